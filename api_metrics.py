@@ -0,0 +1,64 @@
+import time
+
+from instrumentation import PROMETHEUS_CONTENT_TYPE, MetricsRegistry
+
+# Prometheus metrics for the prediction API, served by main.py on /metrics.
+# PrometheusMiddleware is a plain ASGI middleware (no per-request Request/Response
+# objects) that records a latency histogram per method, route template and status
+# and the number of requests in flight. Handlers time their own stages (input
+# fetch, prediction, PNG render and encode, ...) with STAGE_SECONDS.time(stage),
+# and every model.predict call records its batch size and, per model version, its
+# duration. Each observation is a bisect and a locked increment, so the metrics
+# stay on in production.
+
+BATCH_ROW_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 10000)
+UNMATCHED_ROUTE = "unmatched"  # Label for requests no route matched (keeps label cardinality bounded)
+
+metrics_registry = MetricsRegistry()
+REQUEST_SECONDS = metrics_registry.histogram(
+    "safezone_http_request_duration_seconds", "HTTP request latency, including streaming the body",
+    ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = metrics_registry.gauge(
+    "safezone_http_requests_in_flight", "HTTP requests currently being served")
+STAGE_SECONDS = metrics_registry.histogram(
+    "safezone_api_stage_duration_seconds", "Time spent in a stage of a request handler", ("stage",))
+INFERENCE_SECONDS = metrics_registry.histogram(
+    "safezone_model_inference_seconds", "Duration of one model.predict call", ("version",))
+INFERENCE_BATCH_ROWS = metrics_registry.histogram(
+    "safezone_model_inference_batch_rows", "Rows per model.predict call", buckets=BATCH_ROW_BUCKETS)
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # Reported if the app raises before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route, str(status))
+
+# Call `predict` on `matrix`, recording the batch size and the inference time per model version
+def timed_predict(predict, matrix, version):
+    INFERENCE_BATCH_ROWS.observe(len(matrix))
+    with INFERENCE_SECONDS.time(version):
+        return predict(matrix)
+
+def render_metrics():
+    return metrics_registry.render(), PROMETHEUS_CONTENT_TYPE
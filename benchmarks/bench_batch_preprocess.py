@@ -0,0 +1,45 @@
+# Batch enrichment (enrich_dataframe) vs the row-wise .apply chain it replaced.
+# Checks that both produce identical columns, then times them.
+# Run from the repository root: python -m benchmarks.bench_batch_preprocess [sizes...]
+import logging
+import sys
+import time
+
+import pandas as pd
+
+from preprocess_and_upload import enrich_dataframe, extract_location, map_malay_to_type_and_category, preprocess_text
+from benchmarks.synthetic import synthetic_tweet_frame
+
+ENRICHED_COLUMNS = ["Cleaned Text", "Category", "Type", "State", "District"]
+
+# The per-row enrichment previously done inside process_and_upload
+def rowwise_enrich(df):
+    df = df.copy()
+    df["Cleaned Text"] = df["Tweet Text"].apply(preprocess_text)
+    df[["Category", "Type"]] = df["Main Topic"].apply(lambda x: pd.Series(map_malay_to_type_and_category(x)))
+    df[["State", "District"]] = df["Tweet Text"].apply(lambda x: extract_location(x)).apply(pd.Series)
+    return df
+
+def assert_equivalent(df):
+    expected = rowwise_enrich(df)[ENRICHED_COLUMNS].astype(object)
+    actual = enrich_dataframe(df)[ENRICHED_COLUMNS].astype(object)
+    pd.testing.assert_frame_equal(actual, expected)
+
+def timed(func, df):
+    start = time.perf_counter()
+    func(df)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)  # Silence per-tweet location warnings
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+
+    assert_equivalent(synthetic_tweet_frame(5_000, seed=1))
+    print("equivalence: enrich_dataframe matches the row-wise functions")
+
+    print(f"{'rows':>10} {'row-wise':>10} {'batch':>10} {'speedup':>8}")
+    for n in sizes:
+        df = synthetic_tweet_frame(n)
+        rowwise_time = timed(rowwise_enrich, df)
+        batch_time = timed(enrich_dataframe, df)
+        print(f"{n:>10} {rowwise_time:>9.2f}s {batch_time:>9.2f}s {rowwise_time / batch_time:>7.1f}x")
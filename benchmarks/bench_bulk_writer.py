@@ -0,0 +1,32 @@
+# Bulk writer throughput against the in-memory Firebase stand-in, with injected
+# latency and transient write failures.
+# Run from the repository root: python -m benchmarks.bench_bulk_writer [records] [error_rate]
+import hashlib
+import sys
+
+from bulk_writer import FirebaseBulkWriter
+from dedup_index import ProcessedIdIndex
+from benchmarks.fakes import FakeDatabase
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    database = FakeDatabase(latency=0.02, error_rate=error_rate, seed=1)
+    dedup = ProcessedIdIndex(database.reference("processed_id_shards"), cache_path=":memory:")
+    records = {
+        hashlib.md5(str(i).encode()).hexdigest(): {
+            "state": "selangor", "district": "shah alam", "category": "property", "type": "theft", "date": "2024-01-01"
+        }
+        for i in range(n)
+    }
+
+    for workers in (1, 4, 8):
+        database.tree = {}
+        writer = FirebaseBulkWriter(database.reference("crime_data"), on_chunk_written=dedup.add,
+                                    max_workers=workers, backoff_base=0.01)
+        stats = writer.write(records)
+        stored = len(database.tree.get("crime_data", {}))
+        marked = sum(len(ids) for shard, ids in database.tree.get("processed_id_shards", {}).items() if isinstance(ids, dict))
+        print(f"workers={workers}: {stats['records_per_sec']:,.0f} records/sec, {stats['chunks']} chunks, "
+              f"{stats['failed_chunks']} failed, stored={stored}, marked={marked}")
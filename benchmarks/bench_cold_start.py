@@ -0,0 +1,65 @@
+# Cold-start benchmark for the FastAPI service: import time of main.py, and time from
+# launching uvicorn to the first /healthz response and to /readyz reporting ready.
+# Run from the repository root: python -m benchmarks.bench_cold_start [runs]
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(url, expected_status, deadline):
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == expected_status:
+                    return True
+        except urllib.error.HTTPError as e:
+            if e.code == expected_status:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.01)
+    return False
+
+def measure_server(timeout=60.0):
+    port = free_port()
+    start = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + timeout
+        first = time.monotonic() - start if wait_for(f"http://127.0.0.1:{port}/healthz", 200, deadline) else None
+        ready = time.monotonic() - start if wait_for(f"http://127.0.0.1:{port}/readyz", 200, deadline) else None
+        return first, ready
+    finally:
+        server.terminate()
+        server.wait()
+
+def fmt(values):
+    values = [v for v in values if v is not None]
+    return f"{statistics.median(values):.2f}s" if values else "n/a"
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    imports, firsts, readies = [], [], []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+        imports.append(float(output.stdout.strip().splitlines()[-1]))
+        first, ready = measure_server()
+        firsts.append(first)
+        readies.append(ready)
+
+    print(f"runs:                     {runs}")
+    print(f"import main:              {fmt(imports)} (median)")
+    print(f"time to first response:   {fmt(firsts)} (median, /healthz)")
+    print(f"time to ready:            {fmt(readies)} (median, /readyz; n/a if the model or credentials are missing)")
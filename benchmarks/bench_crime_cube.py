@@ -0,0 +1,57 @@
+# Aggregate cube queries vs the equivalent pandas groupby over df_combined, plus
+# the cost of merging one new month into a saved cube vs rebuilding it.
+# Checks that the cube answers match pandas first.
+# Run from the repository root: python -m benchmarks.bench_crime_cube [months]
+import logging
+import sys
+import tempfile
+import time
+
+from crime_cube import CrimeCube, update_cube
+from gov_ingest import aggregate_crime_batches
+from benchmarks.synthetic import synthetic_crime_district_frame
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+
+    raw = synthetic_crime_district_frame(n_periods=months, freq="MS")
+    raw = raw[(raw["state"] != "Malaysia") & (raw["district"] != "All")].drop(columns="type")
+    df = aggregate_crime_batches([raw.copy()])
+    cube = CrimeCube.from_frame(df)
+
+    queries = {
+        "state totals": (lambda: cube.rollup("state"),
+                         lambda: df.groupby("state")["crimes"].sum().to_dict()),
+        "state x month, property": (lambda: cube.rollup(("state", "month"), category="property"),
+                                    lambda: df[df["category"] == "property"]
+                                    .groupby(["state", df["date"].dt.strftime("%Y-%m")])["crimes"].sum().to_dict()),
+        "top 5 districts, 2020": (lambda: cube.top_k(5, start="2020-01", end="2020-12"),
+                                  lambda: list(df[df["date"].dt.year == 2020].groupby("district")["crimes"]
+                                               .sum().nlargest(5).items())),
+    }
+    for name, (cube_query, pandas_query) in queries.items():
+        if cube_query() != pandas_query():
+            print(f"{name}: cube and pandas results differ")
+            sys.exit(1)
+        cube_us, pandas_us = timed(cube_query, 1000), timed(pandas_query, 20)
+        print(f"{name:>26}: cube {cube_us:8.1f} us   pandas {pandas_us:9.1f} us   ({pandas_us / cube_us:.0f}x)")
+
+    directory = tempfile.mkdtemp()
+    last_month = df["date"].max()
+    start = time.perf_counter()
+    update_cube(df[df["date"] < last_month], directory, rebuild=True)
+    rebuild_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    refreshed = update_cube(df, directory)
+    refresh_ms = (time.perf_counter() - start) * 1e3
+    matches = (refreshed.values == cube.values).all()
+    print(f"cube shape {cube.values.shape}: rebuild {rebuild_ms:.1f} ms, one-month refresh {refresh_ms:.1f} ms, "
+          f"refreshed cube matches full build={matches}")
+    sys.exit(0 if matches else 1)
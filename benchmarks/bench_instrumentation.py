@@ -0,0 +1,69 @@
+# Stage instrumentation: cost of an empty metrics.stage() block, then the per-stage
+# metrics of process_and_upload / stream_and_upload over an in-memory sheet (Firebase
+# faked) and of the zgov ingestion over a synthetic crime_district Parquet file,
+# written as JSON and as a Prometheus textfile. Checks that the row counts add up.
+# Run from the repository root: python -m benchmarks.bench_instrumentation [rows]
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import preprocess_and_upload as pu
+import zgov
+from gov_ingest import load_crime_district
+from instrumentation import instrumented_run, metrics
+from benchmarks.fakes import FakeDatabase, FakeSheetsService
+from benchmarks.synthetic import synthetic_sheet_rows, write_synthetic_crime_district
+
+def stage_overhead(n=100_000):
+    start = time.perf_counter()
+    for _ in range(n):
+        with metrics.stage("overhead"):
+            pass
+    return (time.perf_counter() - start) / n
+
+def print_stages(summary):
+    for name, totals in summary["stages"].items():
+        print(f"  {name:<16} {totals['calls']:>5} calls  {totals['seconds']:7.3f}s  {totals['rows']:>9,} rows  "
+              f"{totals['bytes']:>12,} bytes  peak RSS {totals['peak_rss_bytes'] / 1e6:6.0f} MB")
+
+def run_etl(run, rows, path):
+    shutil.rmtree(".cache", ignore_errors=True)
+    pu.db.reference = FakeDatabase().reference
+    pu.open_sheet = lambda: FakeSheetsService(rows)
+    with instrumented_run("preprocess_and_upload", metrics_path=path):
+        run(fetch_mode="full")
+    with open(path) as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    os.chdir(tempfile.mkdtemp())  # Keep caches and metric files out of the repository
+
+    print(f"empty stage: {stage_overhead() * 1e6:.1f} us per call")
+
+    rows = synthetic_sheet_rows(n)
+    for run in (pu.process_and_upload, pu.stream_and_upload):
+        summary = run_etl(run, rows, f"{run.__name__}.json")
+        stages = summary["stages"]
+        if stages["fetch"]["rows"] != n or stages["transform"]["rows"] != n or stages["dedup"]["rows"] != n:
+            raise SystemExit(f"{run.__name__}: fetch/transform/dedup rows do not match the {n} sheet rows")
+        if stages["firebase_upload"]["rows"] != stages["enrich"]["rows"]:
+            raise SystemExit(f"{run.__name__}: uploaded rows differ from enriched rows")
+        print(f"{run.__name__} ({n:,} rows, {summary['duration_seconds']:.2f}s):")
+        print_stages(summary)
+
+    source = write_synthetic_crime_district("crime_district.parquet", n_periods=96, freq="MS")
+    with instrumented_run("zgov", metrics_path="zgov.prom"):
+        df_combined = load_crime_district(source)
+        df_combined_full = zgov.load_crime_district_full(source)
+    if len(df_combined) != len(df_combined_full):
+        raise SystemExit("stream and full ingestion disagree")
+    with open("zgov.prom") as f:
+        prom = f.read()
+    print(f"zgov ingestion ({len(df_combined):,} aggregated rows), Prometheus textfile:")
+    print("\n".join(line for line in prom.splitlines() if "stage_seconds{" in line or "stage_rows{" in line))
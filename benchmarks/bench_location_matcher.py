@@ -0,0 +1,65 @@
+# Micro-benchmark: compiled location matcher vs the previous linear-scan extract_location.
+# First checks that both take the location from the phrase after the "di"/"kat" cue,
+# not from an everyday word elsewhere in the tweet that is also a district name.
+# Run from the repository root: python -m benchmarks.bench_location_matcher [n_tweets]
+import logging
+import re
+import sys
+import time
+
+from preprocess_and_upload import ABBREVIATIONS, DISTRICT_TO_STATE, MALAYSIAN_LOCATIONS, extract_location
+from benchmarks.synthetic import synthetic_tweets
+
+# The extract_location implementation this matcher replaced, kept for comparison
+def legacy_extract_location(text):
+    text_lower = text.lower()
+    for abbrev, full_form in ABBREVIATIONS.items():
+        text_lower = text_lower.replace(abbrev, full_form)
+    match = re.search(r"(di|kat|di dalam|di kawasan)\s+([\w\.\s]+)", text_lower)
+    if match:
+        possible_location = match.group(2).strip()
+        for loc in MALAYSIAN_LOCATIONS:
+            if loc.lower() in possible_location.lower():
+                if loc.lower() in DISTRICT_TO_STATE:
+                    return DISTRICT_TO_STATE[loc.lower()], loc
+                return loc, "Unknown"
+    return "Unknown", "Unknown"
+
+# Tweets with a district-named word before the cue, and the location both must find
+CUE_CASES = {
+    "Kes curi berlaku selama seminggu di Johor": ("johor", "Unknown"),
+    "Bau busuk dari rumah kosong, mayat ditemui di Kuching": ("sarawak", "kuching"),
+    "Harga pekan naik, rompakan di Ipoh": ("perak", "ipoh"),
+    "Nilai barang dicuri mencecah RM5000 di Shah Alam": ("selangor", "shah alam"),
+}
+
+def check_cue_cases():
+    for text, expected in CUE_CASES.items():
+        for name, func in (("legacy", legacy_extract_location), ("compiled", extract_location)):
+            if func(text) != expected:
+                raise SystemExit(f"FAILED: {name} matcher found {func(text)} in {text!r}, expected {expected}")
+
+def time_it(func, tweets):
+    start = time.perf_counter()
+    results = [func(text) for text in tweets]
+    return time.perf_counter() - start, results
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)  # Silence "No location found" warnings
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    check_cue_cases()
+    print("cue-anchored matches agree with the legacy matcher")
+    tweets = synthetic_tweets(n)
+
+    legacy_time, legacy_results = time_it(legacy_extract_location, tweets)
+    compiled_time, compiled_results = time_it(extract_location, tweets)
+
+    found_legacy = sum(r != ("Unknown", "Unknown") for r in legacy_results)
+    found_compiled = sum(r != ("Unknown", "Unknown") for r in compiled_results)
+    agree = sum(a == b for a, b in zip(legacy_results, compiled_results))
+
+    print(f"tweets:            {n}")
+    print(f"legacy scan:       {legacy_time:.3f}s ({n / legacy_time:,.0f} tweets/s), located {found_legacy}")
+    print(f"compiled matcher:  {compiled_time:.3f}s ({n / compiled_time:,.0f} tweets/s), located {found_compiled}")
+    print(f"speedup:           {legacy_time / compiled_time:.1f}x")
+    print(f"identical results: {agree / n:.1%}")
@@ -0,0 +1,56 @@
+# Scaling of the process-pool enrichment pipeline over synthetic tweets, against
+# the single-process enrich_dataframe. Checks that the parallel output is identical
+# (same rows, same order), then shows upload overlapping compute with a simulated
+# per-chunk upload delay. Scaling is bounded by the cores actually available.
+# Run from the repository root: python -m benchmarks.bench_pipeline [rows] [max_workers]
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from pipeline import create_pool, enrich_chunk, parallel_enrich, partition, run_pipeline
+from preprocess_and_upload import enrich_dataframe
+from benchmarks.synthetic import synthetic_tweet_frame
+
+UPLOAD_DELAY = 0.2  # Seconds per chunk for the overlap run
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    df = synthetic_tweet_frame(n)
+    print(f"{n:,} tweets, {os.cpu_count()} CPUs available")
+
+    start = time.perf_counter()
+    expected = enrich_dataframe(df)
+    serial = time.perf_counter() - start
+    print(f"single process : {serial:6.2f}s  {n / serial:>10,.0f} rows/s")
+
+    timings = {}
+    workers = 1
+    while workers <= max_workers:
+        pool = create_pool(workers)
+        list(pool.map(enrich_chunk, [df.iloc[:10]] * workers))  # Start and warm every worker first
+        start = time.perf_counter()
+        result = parallel_enrich(df, workers=workers, pool=pool)
+        elapsed = time.perf_counter() - start
+        timings[workers] = elapsed
+        pool.shutdown()
+        pd.testing.assert_frame_equal(result, expected)
+        print(f"{workers} workers      : {elapsed:6.2f}s  {n / elapsed:>10,.0f} rows/s  "
+              f"speedup {serial / elapsed:4.1f}x")
+        workers *= 2
+
+    # Upload overlap: total time should approach max(compute, upload), not their sum
+    workers = min(max_workers, 2)
+    pool = create_pool(workers)
+    list(pool.map(enrich_chunk, [df.iloc[:10]] * workers))
+    chunks = len(list(partition(df)))
+    start = time.perf_counter()
+    run_pipeline(partition(df), enrich_chunk, lambda chunk: time.sleep(UPLOAD_DELAY), workers=workers, pool=pool)
+    overlapped = time.perf_counter() - start
+    pool.shutdown()
+    print(f"{workers} workers with {chunks} x {UPLOAD_DELAY}s uploads: {overlapped:.2f}s "
+          f"(compute alone {timings[workers]:.2f}s, uploads alone {chunks * UPLOAD_DELAY:.2f}s)")
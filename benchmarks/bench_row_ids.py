@@ -0,0 +1,65 @@
+# Row-ID stage: compute_row_ids (md5 compat and fast BLAKE2b) and select_new_rows
+# vs the iterrows + generate_row_id loop they replaced. First checks that compat
+# mode reproduces the legacy IDs exactly, including datetime64 date columns and
+# missing tweet text, then times both.
+# Run from the repository root: python -m benchmarks.bench_row_ids [rows]
+import logging
+import sys
+import time
+
+import pandas as pd
+
+from dedup_index import ProcessedIdIndex
+from preprocess_and_upload import ROW_ID_COLUMN, compute_row_ids, generate_row_id, select_new_rows
+from benchmarks.fakes import FakeDatabase
+from benchmarks.synthetic import synthetic_tweet_frame
+
+# The dedup loop previously in process_and_upload
+def legacy_select_new_rows(df, dedup):
+    row_ids = [generate_row_id(row) for _, row in df.iterrows()]
+    new_ids = set(dedup.filter_new(row_ids))
+    new_rows = []
+    for (_, row), row_id in zip(df.iterrows(), row_ids):
+        if row_id in new_ids:
+            new_rows.append(row)
+            new_ids.discard(row_id)
+    return pd.DataFrame(new_rows)
+
+def check_compat(df):
+    legacy = [generate_row_id(row) for _, row in df.iterrows()]
+    if compute_row_ids(df, "md5").tolist() != legacy:
+        raise SystemExit("md5 compat IDs differ from generate_row_id")
+
+def fresh_index():
+    return ProcessedIdIndex(FakeDatabase().reference("processed_id_shards"), cache_path=":memory:")
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    df = synthetic_tweet_frame(n)
+    df = pd.concat([df, df.iloc[:n // 10]], ignore_index=True)  # Repeated rows to dedupe
+    check_compat(df.iloc[:20_000])
+    edge = df.iloc[:1000].copy()
+    edge.loc[edge.index[::7], "Tweet Text"] = None
+    check_compat(edge)
+    edge_datetimes = edge.assign(**{"Date (GMT)": pd.to_datetime(edge["Date (GMT)"])})
+    if compute_row_ids(edge_datetimes, "md5").tolist() != compute_row_ids(edge, "md5").tolist():
+        raise SystemExit("datetime64 dates change the md5 IDs")
+    print("md5 compat IDs identical to generate_row_id")
+
+    for mode in ("md5", "fast"):
+        _, elapsed = timed(compute_row_ids, df, mode)
+        print(f"compute_row_ids({mode!r}): {elapsed:6.2f}s  {len(df) / elapsed:>10,.0f} rows/s")
+
+    legacy, legacy_time = timed(legacy_select_new_rows, df, fresh_index())
+    selected, select_time = timed(select_new_rows, df, fresh_index(), "md5")
+    if not selected.drop(columns=ROW_ID_COLUMN).equals(legacy):
+        raise SystemExit("select_new_rows kept different rows than the legacy loop")
+    print(f"dedup {len(df):,} rows -> {len(selected):,} new: iterrows loop {legacy_time:.2f}s, "
+          f"select_new_rows {select_time:.2f}s ({legacy_time / select_time:.0f}x)")
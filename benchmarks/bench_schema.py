@@ -0,0 +1,129 @@
+# Schema layer (schema.py): memory of the ETL DataFrames with object strings and
+# Python dates vs categorical columns, day datetime64 dates and downcast counts, on
+# 1M rows of each source. Sheet rows: sheet_values_to_dataframe and enrich_dataframe
+# against the previous string-based transforms (same values, same row IDs). Gov rows:
+# the categorical ingestion + groupby against the previous object-column groupby
+# (same rows in the same order), with both groupbys timed.
+# Run from the repository root: python -m benchmarks.bench_schema [--rows 1000000]
+import argparse
+import logging
+import time
+
+import pandas as pd
+
+import preprocess_and_upload as pu
+from gov_ingest import DISTRICT_MERGES, GROUP_COLUMNS, REQUIRED_COLUMNS, apply_gov_schema, sum_crimes
+from schema import gov_schema
+from benchmarks.synthetic import synthetic_crime_district_frame, synthetic_sheet_rows
+
+CRIME_MAPPING = {
+    "curi": "theft", "pencuri": "theft", "pencurian": "theft",
+    "rogol": "rape", "perogol": "rape", "merogol": "rape",
+    "rompak": "robbery", "merompak": "robbery", "rompakan": "robbery",
+    "bunuh": "murder", "membunuh": "murder", "pembunuhan": "murder", "terbunuh": "murder"
+}
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def megabytes(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+def report(name, before, after):
+    print(f"  {name:<28} {megabytes(before):9.1f} MB -> {megabytes(after):7.1f} MB "
+          f"({megabytes(before) / megabytes(after):.1f}x smaller)")
+
+def as_objects(df):
+    return df.astype(object).where(df.notna(), None)
+
+# sheet_values_to_dataframe before the schema: Python dates, object topics
+def legacy_sheet_frame(header, rows):
+    df = pd.DataFrame(rows, columns=header)[["Date (GMT)", "Main Topic", "Tweet Text"]]
+    df["Date (GMT)"] = pd.to_datetime(df["Date (GMT)"]).dt.date
+    df["Main Topic"] = df["Main Topic"].str.lower().replace(CRIME_MAPPING)
+    return df.astype({"Main Topic": object, "Tweet Text": object})
+
+# enrich_dataframe before the schema: string lookups, object columns
+def legacy_enrich(df):
+    enriched = df.copy()
+    enriched["Cleaned Text"] = (
+        enriched["Tweet Text"].str.replace(pu.URL_PATTERN, "", regex=True)
+        .str.replace(pu.NON_WORD_PATTERN, " ", regex=True)
+        .str.replace(pu.WHITESPACE_PATTERN, " ", regex=True)
+        .str.strip()
+    )
+    topics = enriched["Main Topic"].str.lower().str.strip()
+    enriched["Category"] = topics.map(pu.TOPIC_TO_CATEGORY).fillna(pu.DEFAULT_CATEGORY_TYPE[0])
+    enriched["Type"] = topics.map(pu.TOPIC_TO_TYPE).fillna(pu.DEFAULT_CATEGORY_TYPE[1])
+    locations = (enriched["Tweet Text"].str.lower().str.extract(pu.LOCATION_CAPTURE, expand=False)
+                 .str.replace(pu.WHITESPACE_PATTERN, " ", regex=True))
+    enriched["State"] = locations.map(pu.LOCATION_TO_STATE).fillna("Unknown")
+    enriched["District"] = locations.map(pu.LOCATION_TO_DISTRICT).fillna("Unknown")
+    return enriched.astype({c: object for c in ["Cleaned Text", "Category", "Type", "State", "District"]})
+
+def bench_sheet(n):
+    rows = synthetic_sheet_rows(n)
+    header, rows = rows[0], rows[1:]
+    legacy = legacy_sheet_frame(header, rows)
+    df = pu.sheet_values_to_dataframe(header, rows)
+    check(pu.format_row_dates(df["Date (GMT)"]).tolist() == legacy["Date (GMT)"].map(str).tolist(), "same dates")
+    check(df["Main Topic"].tolist() == legacy["Main Topic"].tolist(), "same topics")
+    check(pu.compute_row_ids(df.iloc[:100_000]).tolist() == pu.compute_row_ids(legacy.iloc[:100_000]).tolist(),
+          "same row IDs")
+
+    legacy_enriched, legacy_seconds = timed(legacy_enrich, legacy)
+    enriched, seconds = timed(pu.enrich_dataframe, df)
+    columns = ["Category", "Type", "State", "District"]
+    check(as_objects(enriched[columns]).equals(as_objects(legacy_enriched[columns])), "same enrichment")
+    batch = pu.build_crime_batch(enriched.iloc[:1000])
+    check(all(type(value) is str for record in batch.values() for value in record.values()),
+          "crime_data records hold plain strings")
+
+    print(f"sheet rows ({n:,}):")
+    report("fetched frame", legacy, df)
+    report("enriched frame", legacy_enriched, enriched)
+    print(f"  enrich_dataframe: string lookups {legacy_seconds:.2f}s, lookups on codes {seconds:.2f}s")
+
+# zgov.py's aggregation before the schema, on object columns
+def legacy_aggregate(df):
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    df["district"] = df["district"].replace(DISTRICT_MERGES)
+    return df.groupby(GROUP_COLUMNS, as_index=False)["crimes"].sum()
+
+def bench_gov(n):
+    per_period = len(synthetic_crime_district_frame(n_periods=1))
+    raw = synthetic_crime_district_frame(n_periods=-(-n // per_period), freq="MS", start="1990-01-01")
+    raw = raw[(raw["state"] != "Malaysia") & (raw["district"] != "All")][REQUIRED_COLUMNS].reset_index(drop=True)
+    raw = raw.astype({"state": object, "district": object, "category": object})
+    raw["date"] = pd.to_datetime(raw["date"])
+
+    schema = gov_schema()
+    typed, typed_seconds = timed(apply_gov_schema, raw, schema)
+    expected, legacy_seconds = timed(legacy_aggregate, raw)
+    combined, seconds = timed(sum_crimes, typed)
+    combined = schema.apply(combined)
+    check(as_objects(combined).values.tolist() == as_objects(expected).values.tolist(),
+          "same aggregates in the same order")
+
+    print(f"gov rows ({len(raw):,} after filtering):")
+    report("ingested frame", raw, typed)
+    report("aggregated frame", expected, combined)
+    print(f"  groupby: object columns {legacy_seconds:.2f}s (with merges), "
+          f"codes {seconds:.2f}s (+{typed_seconds:.2f}s schema conversion)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    bench_sheet(args.rows)
+    bench_gov(args.rows)
+    print("all checks passed")
@@ -0,0 +1,152 @@
+# Randomized check of the SafeZoneGOV delta upload (sheet_delta.py) against the
+# in-memory worksheet: a full upload, then rounds of random inserts, value changes
+# and deletes (once emptying the sheet and refilling it), each sent with upload_delta
+# in small request chunks so runs are split. After every round the worksheet must hold
+# exactly what a full rewrite of the new data would: the same header and rows, with
+# no gaps (row order may differ). Then runs through zgov.upload_to_google_sheets in
+# which a random write request fails, with the data changing before the next run:
+# that run must still leave the sheet equal to a full rewrite (no duplicated rows).
+# Run from the repository root: python -m benchmarks.bench_sheet_delta [--rounds 200] [--rows 300] [--seed 0]
+import argparse
+import functools
+import logging
+import os
+import random
+import tempfile
+from concurrent.futures import Future
+
+import pandas as pd
+
+import sheet_delta
+from sheet_delta import upload_delta, save_snapshot
+from sheet_writer import SheetWriter
+import zgov
+from zgov import KEY_COLUMNS
+from benchmarks.fakes import FakeTransientError, FakeWorksheet
+
+STATES = ["Johor", "Kedah", "Selangor", "Sabah"]
+DISTRICTS = ["d1", "d2", "d3", "d4", "d5"]
+CATEGORIES = ["assault", "property"]
+DATES = [f"20{year:02d}-{month:02d}-01" for year in range(16, 24) for month in range(1, 13)]
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def random_key(rng):
+    return (rng.choice(STATES), rng.choice(DISTRICTS), rng.choice(CATEGORIES), rng.choice(DATES))
+
+# The frame zgov.py uploads: one row per key, date as a string, crimes as int
+def frame(rows):
+    return pd.DataFrame([[*key, crimes] for key, crimes in rows.items()], columns=[*KEY_COLUMNS, "crimes"])
+
+def full_rewrite(df):
+    return [df.columns.tolist()] + df.values.tolist()
+
+# Random inserts, value changes and deletes; some rounds change nothing, some a lot
+def mutate(rows, rng):
+    rows = dict(rows)
+    scale = rng.choice([0, 1, 5, 50])
+    for key in rng.sample(sorted(rows), min(len(rows), rng.randint(0, scale))):
+        del rows[key]
+    for key in rng.sample(sorted(rows), min(len(rows), rng.randint(0, scale))):
+        rows[key] = rng.randrange(1000)
+    for _ in range(rng.randint(0, scale)):
+        rows[random_key(rng)] = rng.randrange(1000)
+    return rows
+
+def same_sheet(actual, expected):
+    return actual[:1] == expected[:1] and sorted(map(tuple, actual[1:])) == sorted(map(tuple, expected[1:]))
+
+# Fails its `fail_at`-th write request (any of batch_update, append_rows, batch_clear, resize),
+# as a quota error would
+class FlakyWorksheet(FakeWorksheet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writes = 0
+        self.fail_at = None
+
+    def _count_write(self):
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise FakeTransientError("Quota exceeded")
+
+    def batch_update(self, data, **kwargs):
+        self._count_write()
+        return super().batch_update(data, **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._count_write()
+        return super().append_rows(values, **kwargs)
+
+    def batch_clear(self, ranges):
+        self._count_write()
+        return super().batch_clear(ranges)
+
+    def resize(self, rows=None, cols=None):
+        self._count_write()
+        return super().resize(rows, cols)
+
+def upload(worksheet, df, snapshot_path, progress_path):
+    opened = Future()
+    opened.set_result(worksheet)
+    zgov.upload_to_google_sheets(df, None, None, snapshot_path=snapshot_path, progress_path=progress_path,
+                                 worksheet=opened)
+
+# zgov's uploads in 3-row requests, so a failure can land between any two of them
+def run_interrupted(rounds, n, seed):
+    zgov.upload_delta = functools.partial(sheet_delta.upload_delta, max_rows_per_request=3)
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp()
+    snapshot_path, progress_path = os.path.join(directory, "snapshot.parquet"), os.path.join(directory, "progress.json")
+    rows = {random_key(rng): rng.randrange(1000) for _ in range(n)}
+    worksheet = FlakyWorksheet(rows=10, cols=5)
+    upload(worksheet, frame(rows), snapshot_path, progress_path)
+    for round_number in range(rounds):
+        rows = mutate(rows, rng)
+        worksheet.fail_at = worksheet.writes + rng.randint(1, 8)
+        upload(worksheet, frame(rows), snapshot_path, progress_path)
+        worksheet.fail_at = None
+        rows = mutate(rows, rng)
+        upload(worksheet, frame(rows), snapshot_path, progress_path)
+        check(same_sheet(worksheet.get_all_values(), full_rewrite(frame(rows))),
+              f"round {round_number}: the sheet equals a full rewrite after a failed upload")
+    print(f"{rounds} failed uploads: the next upload left the sheet equal to a full rewrite every time")
+
+def run(rounds, n, seed):
+    rng = random.Random(seed)
+    snapshot_path = os.path.join(tempfile.mkdtemp(), "snapshot.parquet")
+    rows = {random_key(rng): rng.randrange(1000) for _ in range(n)}
+    worksheet = FakeWorksheet(rows=10, cols=5)
+    SheetWriter(worksheet).write(full_rewrite(frame(rows)), clear=True)
+    save_snapshot(frame(rows), snapshot_path)
+
+    written = removed = 0
+    for round_number in range(rounds):
+        if round_number == rounds // 2:
+            rows = {}  # Everything removed, then refilled from empty
+        elif round_number == rounds // 2 + 1:
+            rows = {random_key(rng): rng.randrange(1000) for _ in range(n)}
+        else:
+            rows = mutate(rows, rng)
+        df = frame(rows)
+        counts = upload_delta(worksheet, df, snapshot_path, KEY_COLUMNS, max_rows_per_request=rng.choice([1, 3, 5000]))
+        check(counts is not None, f"round {round_number}: the snapshot is used")
+        check(same_sheet(worksheet.get_all_values(), full_rewrite(df)),
+              f"round {round_number}: the sheet equals a full rewrite ({counts})")
+        written += counts["rows_written"]
+        removed += counts["removed"]
+    check(worksheet.calls["clear"] == 1, "only the first upload clears the sheet")
+    print(f"{rounds} rounds: {written:,} rows written, {removed:,} removed, sheet equals a full rewrite after every round")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)  # The injected failures are logged by zgov
+    for seed in range(args.seed, args.seed + 5):
+        run(args.rounds, args.rows, seed)
+        run_interrupted(args.rounds // 4, args.rows, seed)
+    print("all checks passed")
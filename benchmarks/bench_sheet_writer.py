@@ -0,0 +1,33 @@
+# Sheet writer throughput against the in-memory worksheet stand-in, with injected
+# latency and transient failures, followed by a resumed run that writes only the
+# blocks the first run did not finish.
+# Run from the repository root: python -m benchmarks.bench_sheet_writer [rows] [cols] [error_rate]
+import os
+import sys
+import tempfile
+
+from sheet_writer import SheetWriter
+from benchmarks.fakes import FakeWorksheet
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    cols = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+
+    values = [[f"col_{c}" for c in range(cols)]] + [[r * cols + c for c in range(cols)] for r in range(n)]
+
+    for workers in (1, 4):
+        worksheet = FakeWorksheet(latency=0.05)
+        stats = SheetWriter(worksheet, max_workers=workers).write(values, clear=True)
+        print(f"workers={workers}: {stats['rows_per_sec']:,.0f} rows/sec, {stats['blocks']} blocks")
+
+    progress_path = os.path.join(tempfile.mkdtemp(), "progress.json")
+    worksheet = FakeWorksheet(latency=0.05, error_rate=error_rate, seed=1)
+    writer = SheetWriter(worksheet, progress_path=progress_path, max_retries=1)
+    first = writer.write(values, clear=True)
+    worksheet.error_rate = 0.0
+    second = writer.write(values, clear=True)
+    correct = worksheet.get_all_values() == values
+    print(f"interrupted run: {first['failed_blocks']}/{first['blocks']} blocks failed; "
+          f"resumed run: skipped {second['skipped_blocks']}, wrote {second['written']} rows, sheet correct={correct}")
+    sys.exit(0 if correct else 1)
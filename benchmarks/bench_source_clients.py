@@ -0,0 +1,165 @@
+# Source clients against a local HTTP stub server (benchmarks.fakes.StubServer):
+# the REST Sheets client returns the same rows and cursors as the in-memory fake for
+# full, incremental and streamed reads; retries honour Retry-After, back off on 5xx and
+# give up at once on other 4xx; downloads are revalidated (304) and served from the
+# cache when the server fails, and a transfer that breaks off leaves no partial file
+# behind. Then times one pooled keep-alive session vs a new
+# connection per request, and sequential vs concurrent page fetches.
+# Run from the repository root: python -m benchmarks.bench_source_clients [--rows 20000] [--latency 0.02]
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import requests
+
+import preprocess_and_upload as pu
+from source_clients import (RetryPolicy, SheetsClient, SourceHTTPError, fetch_cached, fetch_many,
+                            fetch_sheet_ranges, mount_pool)
+from benchmarks.fakes import FakeSheetsService, StubServer
+from benchmarks.synthetic import synthetic_sheet_rows
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def client_for(stub, retry=None):
+    return SheetsClient(mount_pool(requests.Session()), base_url=stub.url + "/v4",
+                        retry=retry or RetryPolicy(base=0.01))
+
+def check_reads(stub, rows):
+    client, fake = client_for(stub), FakeSheetsService(rows)
+    check(pu.fetch_sheet_rows_full(client) == pu.fetch_sheet_rows_full(fake), "full read matches")
+    _, _, cursor = pu.fetch_sheet_rows_full(FakeSheetsService(rows[:len(rows) // 3]))
+    check(pu.fetch_sheet_rows_incremental(client, cursor) == pu.fetch_sheet_rows_incremental(fake, cursor),
+          "incremental read (concurrent page windows) matches")
+    reader = pu.SheetPageReader(client, mode="incremental", cursor=cursor, page_size=1000)
+    streamed = [row for page in reader for row in page]
+    check(streamed == rows[cursor["last_row"]:], "streamed pages (with read-ahead) match")
+    check(reader.cursor == pu.fetch_sheet_rows_full(fake)[2], "streamed cursor matches a full scan's")
+
+def check_retries(stub):
+    sleeps = []
+    client = client_for(stub, RetryPolicy(base=0.01, sleep=lambda delay: (sleeps.append(delay), time.sleep(delay))))
+    header = "SafeZone!A1:H1"
+
+    stub.fail(header, 429, headers={"Retry-After": "0.3"})
+    _, seconds = timed(client.values().get(spreadsheetId="s", range=header).execute)
+    check(sleeps[-1] >= 0.3 and seconds >= 0.3, "429 waits at least Retry-After")
+
+    before = client.calls
+    stub.fail(header, 503, count=2)
+    client.values().get(spreadsheetId="s", range=header).execute()
+    check(client.calls - before == 3 and max(sleeps[-2:]) < 0.3, "503 retried with short jittered backoff")
+
+    before = client.calls
+    stub.fail(header, 400)
+    try:
+        client.values().get(spreadsheetId="s", range=header).execute()
+        check(False, "400 raises")
+    except SourceHTTPError as e:
+        check(e.status == 400 and client.calls - before == 1, "400 is not retried")
+
+def check_download_cache(stub):
+    cache_dir = tempfile.mkdtemp()
+    url = stub.url + "/publicsafety/crime_district.parquet"
+    retry = RetryPolicy(max_retries=2, base=0.01)
+    path = fetch_cached(url, cache_dir, retry=retry)
+    with open(path, "rb") as f:
+        check(f.read() == stub.files["/publicsafety/crime_district.parquet"], "download stored")
+    not_modified = stub.requests[304]
+    check(fetch_cached(url, cache_dir, retry=retry) == path and stub.requests[304] == not_modified + 1,
+          "second fetch revalidated with a 304")
+    stub.fail("/publicsafety/", 503, count=2)
+    check(fetch_cached(url, cache_dir, retry=retry) == path, "cached copy used while the server fails")
+    try:
+        fetch_cached(stub.url + "/missing.parquet", cache_dir, retry=retry)
+        check(False, "missing file raises")
+    except SourceHTTPError as e:
+        check(e.status == 404, "404 without a cached copy raises")
+
+# A 200 response whose body breaks off after the first block
+class BrokenDownload:
+    status_code = 200
+    headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, block_size):
+        yield b"x" * block_size
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+class BrokenSession:
+    def get(self, url, **kwargs):
+        return BrokenDownload()
+
+def check_broken_download():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        fetch_cached("https://example.invalid/crime_district.parquet", cache_dir, session=BrokenSession(),
+                     retry=RetryPolicy(max_retries=2, base=0.01))
+        check(False, "broken download raises")
+    except requests.exceptions.ChunkedEncodingError:
+        pass
+    check(os.listdir(cache_dir) == [], "no partial files left after a broken download")
+
+def bench_connections(stub, n):
+    stub.connections.clear()
+    session = mount_pool(requests.Session())
+    _, pooled = timed(lambda: [session.get(stub.url + "/v4/spreadsheets/s/values/A1:H1") for _ in range(n)])
+    pooled_connections = len(stub.connections)
+    stub.connections.clear()
+    _, fresh = timed(lambda: [requests.get(stub.url + "/v4/spreadsheets/s/values/A1:H1") for _ in range(n)])
+    check(pooled_connections == 1 and len(stub.connections) == n, "one kept-alive connection vs one per request")
+    print(f"{n} requests: pooled session {pooled * 1000 / n:.2f} ms/request over {pooled_connections} connection, "
+          f"new connection each {fresh * 1000 / n:.2f} ms/request")
+
+def bench_concurrency(stub, rows, page_size):
+    client = client_for(stub)
+    ranges = [pu.page_range(start, page_size) for start in range(2, len(rows) + 1, page_size)]
+    sequential, sequential_seconds = timed(fetch_sheet_ranges, client, "s", ranges, workers=1)
+    concurrent, concurrent_seconds = timed(fetch_sheet_ranges, client, "s", ranges)
+    check(sequential == concurrent, "concurrent pages match")
+    print(f"{len(ranges)} pages of {page_size} rows at {stub.latency * 1000:.0f} ms latency: "
+          f"sequential {sequential_seconds:.2f}s, concurrent {concurrent_seconds:.2f}s "
+          f"({sequential_seconds / concurrent_seconds:.1f}x)")
+
+    sources = [stub.url + path for path in stub.files]
+    cache_dir = tempfile.mkdtemp()
+    paths, seconds = timed(fetch_many, sources, cache_dir)
+    check(all(os.path.exists(path) for path in paths), "every source downloaded")
+    print(f"{len(sources)} downloads with fetch_many: {seconds:.2f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    rows = synthetic_sheet_rows(args.rows)
+    files = {f"/publicsafety/crime_{i}.parquet": os.urandom(256 * 1024) for i in range(4)}
+    files["/publicsafety/crime_district.parquet"] = os.urandom(1 << 20)
+    stub = StubServer(rows, files).start()
+    try:
+        check_reads(stub, rows)
+        check_retries(stub)
+        check_download_cache(stub)
+        check_broken_download()
+        print("all checks passed")
+        bench_connections(stub, args.requests)
+        stub.latency = args.latency
+        bench_concurrency(stub, rows, 1000)
+    finally:
+        stub.stop()
@@ -0,0 +1,127 @@
+# Requests/sec for the /stats endpoints over a synthetic 1M-row crime_data table,
+# served in-process through the ASGI app (GZip middleware included).
+# Checks the district totals against pandas first, and that the gov source read back
+# from the SafeZoneGOV worksheet (as zgov.py uploads it) matches the aggregates, and
+# that the crime_data mirror follows inserts, updates and deletes without re-reading
+# the tree while a refresh with no changes keeps the table.
+# Run from the repository root: python -m benchmarks.bench_stats_api [--rows 1000000] [--requests 2000] [--concurrency 32]
+import argparse
+import asyncio
+import logging
+import time
+
+import firebase_admin.db
+import httpx
+import numpy as np
+
+import main
+from gov_ingest import aggregate_crime_batches
+from stats_store import ColumnTable, FirebaseTreeMirror, ReportSource, StatsStore, load_gov_frame, report_frame
+from benchmarks.fakes import FakeDatabase, FakeSheetsService
+from benchmarks.synthetic import synthetic_crime_district_frame, synthetic_report_frame
+
+QUERIES = [
+    "/stats/district?source=reports",
+    "/stats/district?source=reports&category=property&start=2023-01&end=2023-12&limit=20",
+    "/stats/district?source=reports&state=selangor&offset=5&limit=5",
+    "/stats/trend?source=reports",
+    "/stats/trend?source=reports&district=klang&freq=year",
+    "/stats/district?source=gov&category=assault",
+    "/stats/trend?source=gov&state=Johor",
+]
+
+# The worksheet as zgov.py writes it: header row, ISO date strings
+def check_gov_sheet(gov):
+    uploaded = gov.assign(date=gov["date"].dt.strftime("%Y-%m-%d"))
+    rows = [uploaded.columns.tolist()] + [[str(value) for value in row] for row in uploaded.values.tolist()]
+    table = ColumnTable(load_gov_frame(cube_dir=None, sheet=FakeSheetsService(rows)))
+    if table.by_district() != ColumnTable(gov).by_district() or table.trend() != ColumnTable(gov).trend():
+        raise SystemExit("gov statistics read from the worksheet differ from the aggregates")
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+# crime_data as preprocess_and_upload.py writes it: row ID -> record of strings
+def check_report_mirror(n=2000):
+    reports = synthetic_report_frame(n).drop(columns="crimes")
+    reports["date"] = reports["date"].dt.strftime("%Y-%m-%d")
+    records = {f"row{i}": record for i, record in enumerate(reports.to_dict("records"))}
+    database = FakeDatabase()
+    database.reference("crime_data").set(dict(list(records.items())[:n // 2]))
+    firebase_admin.db.reference = database.reference
+
+    def matches_database(store):
+        expected = ColumnTable(report_frame(database.reference("crime_data").get()))
+        table = store.table("reports")
+        return table.by_district() == expected.by_district() and table.trend() == expected.trend()
+
+    source = ReportSource(FirebaseTreeMirror("crime_data", initial_timeout=1))
+    store = StatsStore({"reports": source})
+    store.refresh()
+    check(matches_database(store), "mirrored reports match crime_data")
+    table = store.table("reports")
+    store.refresh()
+    check(store.table("reports") is table, "an unchanged crime_data keeps its table")
+
+    database.reference("crime_data").update(dict(list(records.items())[n // 2:]))
+    database.reference("crime_data/row0").delete()
+    database.reference("crime_data").update({"row1/district": "klang", "row2": None})
+    database.reference("crime_data/row3/state").set("selangor")
+    store.refresh()
+    check(matches_database(store), "inserts, updates and deletes reach the mirror")
+    check(database.calls["get"] == 2, "the mirror never re-reads crime_data")
+    store.stop()
+
+async def run_load(client, n_requests, concurrency):
+    latencies = []
+    next_index = iter(range(n_requests))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            response = await client.get(QUERIES[i % len(QUERIES)], headers={"accept-encoding": "gzip"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return n_requests / elapsed, np.percentile(latencies, 50) * 1e3, np.percentile(latencies, 99) * 1e3
+
+async def bench(args):
+    reports = synthetic_report_frame(args.rows)
+    raw = synthetic_crime_district_frame(n_periods=96, freq="MS")
+    gov = aggregate_crime_batches([raw[(raw["state"] != "Malaysia") & (raw["district"] != "All")].drop(columns="type")])
+    check_gov_sheet(gov)
+    check_report_mirror()
+    main.stats_store.loaders = {"gov": lambda: gov, "reports": lambda: reports}
+    start = time.perf_counter()
+    main.stats_store.refresh()
+    print(f"loaded {args.rows:,} report rows and {len(gov):,} gov rows in {time.perf_counter() - start:.2f}s")
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        body = (await client.get("/stats/district?source=reports&limit=1000")).json()
+        expected = reports.groupby(["state", "district"])["crimes"].sum()
+        actual = {(item["state"], item["district"]): item["crimes"] for item in body["items"]}
+        if actual != expected.to_dict():
+            raise SystemExit("district totals differ from pandas")
+
+        for query in QUERIES:
+            start = time.perf_counter()
+            for _ in range(20):
+                await client.get(query)
+            print(f"{(time.perf_counter() - start) / 20 * 1e3:7.2f} ms  {query}")
+
+        rps, p50, p99 = await run_load(client, args.requests, args.concurrency)
+        print(f"{args.requests} mixed requests at concurrency {args.concurrency}: {rps:,.0f} req/s, "
+              f"p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(bench(parser.parse_args()))
@@ -0,0 +1,47 @@
+# Peak traced memory (tracemalloc) of the materializing process_and_upload vs the
+# streaming stream_and_upload, over an in-memory sheet of 10k and 1M tweets.
+# Firebase is faked and discards crime_data / processed-ID writes (they live on the
+# server in production), so the peak reflects what the script itself holds.
+# Run from the repository root: python -m benchmarks.bench_streaming_memory [sizes...]
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import preprocess_and_upload as pu
+from benchmarks.fakes import FakeDatabase, FakeSheetsService
+from benchmarks.synthetic import synthetic_sheet_rows
+
+REMOTE_ONLY_PATHS = ("crime_data", "processed_id_shards")
+
+class DiscardingDatabase(FakeDatabase):
+    def _set(self, parts, value):
+        if parts and parts[0] in REMOTE_ONLY_PATHS:
+            return
+        super()._set(parts, value)
+
+def measure(run, rows):
+    shutil.rmtree(".cache", ignore_errors=True)
+    database = DiscardingDatabase()
+    pu.db.reference = database.reference
+    pu.open_sheet = lambda: FakeSheetsService(rows)
+    tracemalloc.start()
+    start = time.perf_counter()
+    run(fetch_mode="full")
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6, elapsed, database.calls["update"]
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.ERROR)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 1_000_000]
+    os.chdir(tempfile.mkdtemp())  # Keep the dedup cache out of the repository
+    for n in sizes:
+        rows = synthetic_sheet_rows(n)
+        for label, run in (("materialized", pu.process_and_upload), ("streaming", pu.stream_and_upload)):
+            peak_mb, elapsed, updates = measure(run, rows)
+            print(f"{n:>9,} rows  {label:<12}  peak {peak_mb:8.1f} MB  {elapsed:6.1f}s  ({updates} Firebase updates)")
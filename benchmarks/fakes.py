@@ -0,0 +1,402 @@
+import copy
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeTransientError(Exception):
+    pass
+
+# Latency and error injection shared by the fakes. Every call sleeps `latency` seconds
+# plus, with `jitter`, an exponentially distributed extra delay of mean `jitter`
+# seconds (a long tail, so p99 differs from p50). With `error_rate`, fallible calls
+# randomly raise FakeTransientError before changing anything. `calls` counts calls per
+# operation and `durations` keeps the wall time of every completed call.
+class FakeBackend:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.durations = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def _wait(self, operation, fallible=False):
+        self.calls[operation] += 1
+        delay = self.latency
+        if self.jitter or (fallible and self.error_rate):
+            with self.lock:
+                delay += self.rng.expovariate(1 / self.jitter) if self.jitter else 0.0
+                failed = fallible and self.rng.random() < self.error_rate
+            if failed:
+                self.calls[f"{operation}_failed"] += 1
+        else:
+            failed = False
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise FakeTransientError(f"Injected {operation} failure")
+
+    @contextmanager
+    def call(self, operation, fallible=False):
+        start = time.perf_counter()
+        self._wait(operation, fallible)
+        yield
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.durations[operation].append(elapsed)
+
+# In-memory stand-in for the firebase_admin.db reference API (get / set / update /
+# delete / child / listen), used to exercise the Firebase code paths without
+# credentials. `bytes_written` counts traffic; with `error_rate`, writes randomly fail.
+# Listeners get a "put" event with the current value, then one per change at or below
+# (or above) their path, delivered synchronously after the write.
+class FakeDatabase(FakeBackend):
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, jitter=0.0):
+        super().__init__(latency, error_rate, seed, jitter)
+        self.tree = {}
+        self.bytes_written = 0
+        self.listeners = []  # (path parts, callback)
+
+    def reference(self, path="/"):
+        return FakeReference(self, path)
+
+    def call(self, operation, fallible=None):
+        return super().call(operation, operation != "get" if fallible is None else fallible)
+
+    def _notify(self, changed):
+        with self.lock:
+            listeners = list(self.listeners)
+        for parts, callback in listeners:
+            if changed[:len(parts)] == parts:
+                below = changed[len(parts):]
+                with self.lock:
+                    data = self._get(changed)
+                callback(FakeEvent("put", "/" + "/".join(below), data))
+            elif parts[:len(changed)] == changed:
+                with self.lock:
+                    data = self._get(parts)
+                callback(FakeEvent("put", "/", data))
+
+    def _get(self, parts):
+        node = self.tree
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return copy.deepcopy(node)
+
+    def _set(self, parts, value):
+        if not parts:
+            self.tree = copy.deepcopy(value) if isinstance(value, dict) else {}
+            return
+        node = self.tree
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+class FakeReference:
+    def __init__(self, database, path):
+        self._db = database
+        self.path = "/".join(part for part in path.split("/") if part)
+
+    @property
+    def key(self):
+        return self.path.rsplit("/", 1)[-1] if self.path else None
+
+    def _parts(self, sub_path=""):
+        full = f"{self.path}/{sub_path}" if sub_path else self.path
+        return [part for part in full.split("/") if part]
+
+    def child(self, path):
+        return FakeReference(self._db, f"{self.path}/{path}")
+
+    def get(self):
+        with self._db.call("get"), self._db.lock:
+            return self._db._get(self._parts())
+
+    def set(self, value):
+        with self._db.call("set"):
+            with self._db.lock:
+                self._db.bytes_written += len(json.dumps(value, default=str))
+                self._db._set(self._parts(), value)
+        self._db._notify(self._parts())
+
+    # Multi-path update: keys may contain "/" and are applied relative to this reference
+    def update(self, value):
+        if not isinstance(value, dict) or not value:
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        with self._db.call("update"):
+            with self._db.lock:
+                self._db.bytes_written += len(json.dumps(value, default=str))
+                for key, item in value.items():
+                    self._db._set(self._parts(key), item)
+        if self._db.listeners:
+            for key in value:
+                self._db._notify(self._parts(key))
+
+    def listen(self, callback):
+        parts = self._parts()
+        with self._db.lock:
+            self._db.listeners.append((parts, callback))
+            data = self._db._get(parts)
+        callback(FakeEvent("put", "/", data))
+        return FakeListenerRegistration(self._db, (parts, callback))
+
+    def delete(self):
+        with self._db.call("delete"):
+            with self._db.lock:
+                self._db._set(self._parts(), None)
+        self._db._notify(self._parts())
+
+# The firebase_admin.db.Event / ListenerRegistration parts the listeners use
+class FakeEvent:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+class FakeListenerRegistration:
+    def __init__(self, database, listener):
+        self._db = database
+        self._listener = listener
+
+    def close(self):
+        with self._db.lock:
+            if self._listener in self._db.listeners:
+                self._db.listeners.remove(self._listener)
+
+# In-memory stand-in for a gspread Worksheet: update / batch_update / append_rows /
+# batch_clear / clear / resize / get_all_values over a grid of cells, with call and cell
+# counters and per-call durations. With `error_rate`, updates randomly raise
+# FakeTransientError.
+A1_PATTERN = re.compile(r"^(?:[^!]*!)?([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+def column_number(letters):
+    number = 0
+    for ch in letters:
+        number = number * 26 + ord(ch) - 64
+    return number
+
+class FakeWorksheet(FakeBackend):
+    def __init__(self, rows=1000, cols=26, latency=0.0, error_rate=0.0, seed=0, jitter=0.0):
+        super().__init__(latency, error_rate, seed, jitter)
+        self.row_count = rows
+        self.col_count = cols
+        self.cells = {}  # (row, col) -> value, 1-based
+        self.cells_written = 0
+
+    def call(self, operation, fallible=None):
+        return super().call(operation, operation in ("update", "batch_update") if fallible is None else fallible)
+
+    def _parse(self, range_name):
+        match = A1_PATTERN.match(range_name)
+        if not match:
+            raise ValueError(f"Unsupported range: {range_name}")
+        first_col, first_row = column_number(match.group(1)), int(match.group(2))
+        last_col = column_number(match.group(3)) if match.group(3) else first_col
+        last_row = int(match.group(4)) if match.group(4) else first_row
+        return first_row, first_col, last_row, last_col
+
+    def _write(self, range_name, values):
+        first_row, first_col, last_row, last_col = self._parse(range_name)
+        if first_row + len(values) - 1 > self.row_count or first_col + max(map(len, values), default=1) - 1 > self.col_count:
+            raise ValueError(f"Range {range_name} exceeds grid limits ({self.row_count}x{self.col_count})")
+        with self.lock:
+            for r, row in enumerate(values):
+                for c, value in enumerate(row):
+                    self.cells[(first_row + r, first_col + c)] = value
+                    self.cells_written += 1
+
+    def update(self, values=None, range_name=None, **kwargs):
+        with self.call("update"):
+            self._write(range_name or "A1", values)
+
+    def batch_update(self, data, **kwargs):
+        with self.call("batch_update"):
+            for item in data:
+                self._write(item["range"], item["values"])
+
+    def append_rows(self, values, value_input_option=None, table_range=None, **kwargs):
+        with self.call("append_rows"):
+            last = max((r for r, _ in self.cells), default=0)
+            self.row_count = max(self.row_count, last + len(values))
+            self._write(f"A{last + 1}", values)
+
+    def add_rows(self, rows):
+        with self.call("add_rows"):
+            self.row_count += rows
+
+    def resize(self, rows=None, cols=None):
+        with self.call("resize"):
+            self.row_count = rows if rows is not None else self.row_count
+            self.col_count = cols if cols is not None else self.col_count
+
+    def batch_clear(self, ranges):
+        with self.call("batch_clear"):
+            with self.lock:
+                for range_name in ranges:
+                    first_row, first_col, last_row, last_col = self._parse(range_name)
+                    for key in [k for k in self.cells if first_row <= k[0] <= last_row and first_col <= k[1] <= last_col]:
+                        del self.cells[key]
+
+    def clear(self):
+        with self.call("clear"):
+            with self.lock:
+                self.cells = {}
+
+    def get_all_values(self):
+        with self.lock:
+            if not self.cells:
+                return []
+            last_row = max(r for r, _ in self.cells)
+            last_col = max(c for _, c in self.cells)
+            return [[self.cells.get((r, c), "") for c in range(1, last_col + 1)] for r in range(1, last_row + 1)]
+
+# In-memory stand-in for the Sheets API v4 spreadsheets() resource, covering the
+# values().get / values().batchGet calls preprocess_and_upload makes. `rows` holds
+# the sheet from row 1 (the header) down; ranges like "SafeZone!A:H" or
+# "SafeZone!A2:H5001" are answered with the matching slice of rows. Latency is
+# injected when a request is executed.
+SHEET_RANGE_PATTERN = re.compile(r"^(?:[^!]*!)?[A-Z]+(\d*)(?::[A-Z]+(\d*))?$")
+
+class FakeRequest:
+    def __init__(self, result, backend=None, operation=None):
+        self.result = result
+        self.backend = backend
+        self.operation = operation
+
+    def execute(self):
+        if self.backend is None:
+            return self.result
+        with self.backend.call(self.operation):
+            return self.result
+
+class FakeSheetsService(FakeBackend):
+    def __init__(self, rows, latency=0.0, seed=0, jitter=0.0):
+        super().__init__(latency, seed=seed, jitter=jitter)
+        self.rows = rows
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _range(self, range_name):
+        match = SHEET_RANGE_PATTERN.match(range_name)
+        if not match:
+            raise ValueError(f"Unsupported range: {range_name}")
+        first = int(match.group(1)) if match.group(1) else 1
+        last = int(match.group(2)) if match.group(2) else len(self.rows)
+        return {"range": range_name, "values": self.rows[first - 1:last]}
+
+    def get(self, spreadsheetId=None, range=None):
+        return FakeRequest(self._range(range), self, "get")
+
+    def batchGet(self, spreadsheetId=None, ranges=()):
+        return FakeRequest({"valueRanges": [self._range(r) for r in ranges]}, self, "batchGet")
+
+# Local HTTP/1.1 stub of the Sheets API v4 values endpoints (backed by a
+# FakeSheetsService over `rows`) and of a static file host (`files`: path -> bytes,
+# served with an ETag and answering If-None-Match with 304), for exercising
+# source_clients over real sockets. `latency` is added to every response; fail()
+# queues error responses (with headers such as Retry-After) for matching paths.
+# `requests` counts responses per status and `connections` the client sockets seen.
+class StubServer:
+    def __init__(self, rows=(), files=None, latency=0.0):
+        self.sheet = FakeSheetsService(list(rows))
+        self.files = dict(files or {})
+        self.latency = latency
+        self.failures = []  # (path fragment, deque of (status, headers))
+        self.requests = Counter()
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fail(self, fragment, status, count=1, headers=None):
+        with self.lock:
+            self.failures.append((fragment, deque([(status, headers or {})] * count)))
+
+    def _next_failure(self, path):
+        with self.lock:
+            for fragment, queue in self.failures:
+                if fragment in path and queue:
+                    return queue.popleft()
+        return None
+
+    def respond(self, handler):
+        with self.lock:
+            self.connections.add(handler.client_address)
+        if self.latency:
+            time.sleep(self.latency)
+        url = urllib.parse.urlsplit(handler.path)
+        path = urllib.parse.unquote(url.path)
+        failure = self._next_failure(path)
+        if failure is not None:
+            status, headers = failure
+            return self._send(handler, status, json.dumps({"error": {"code": status}}).encode(), headers)
+        if path in self.files:
+            body = self.files[path]
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if handler.headers.get("If-None-Match") == etag:
+                return self._send(handler, 304, b"", {"ETag": etag})
+            return self._send(handler, 200, body, {"ETag": etag, "Content-Type": "application/octet-stream"})
+        if path.endswith("/values:batchGet"):
+            ranges = urllib.parse.parse_qs(url.query).get("ranges", [])
+            result = self.sheet.batchGet(ranges=ranges).execute()
+        elif "/values/" in path:
+            result = self.sheet.get(range=path.split("/values/", 1)[1]).execute()
+        else:
+            return self._send(handler, 404, b"{}", {})
+        return self._send(handler, 200, json.dumps(result).encode(), {"Content-Type": "application/json"})
+
+    def _send(self, handler, status, body, headers):
+        with self.lock:
+            self.requests[status] += 1
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connection reuse is observable
+    wbufsize = -1  # Headers and body leave in one write (flushed per response) ...
+    disable_nagle_algorithm = True  # ... and without waiting for a delayed ACK
+
+    def do_GET(self):
+        self.server.stub.respond(self)
+
+    def log_message(self, format, *args):
+        pass
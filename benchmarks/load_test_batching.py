@@ -0,0 +1,107 @@
+# Load test for micro-batched single-row prediction.
+#
+# In-process (default): drives MicroBatcher with the real model.pkl, comparing
+# batching on vs off (one model.predict per request in the threadpool), then checks
+# that rows of the wrong width sent into busy batches fail only their own requests.
+#   python -m benchmarks.load_test_batching --requests 5000 --concurrency 64
+#
+# Against a running server: POSTs to /predict; start the server with
+# MICRO_BATCHING=1 and MICRO_BATCHING=0 to compare.
+#   python -m benchmarks.load_test_batching --url http://localhost:8080
+import argparse
+import asyncio
+import pickle
+import time
+
+import numpy as np
+
+from micro_batcher import InvalidRow, MicroBatcher
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def percentile(latencies, q):
+    return float(np.percentile(latencies, q) * 1000.0)
+
+async def run_load(call, n_requests, concurrency, width):
+    rng = np.random.default_rng(0)
+    rows = rng.random((n_requests, width), dtype=np.float32)
+    latencies = []
+    next_index = iter(range(n_requests))
+
+    async def client():
+        for i in next_index:
+            start = time.perf_counter()
+            await call(rows[i])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput_rps": n_requests / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99)
+    }
+
+def report(label, result):
+    print(f"{label:<22} {result['throughput_rps']:>10,.0f} req/s   "
+          f"p50 {result['p50_ms']:>7.2f} ms   p99 {result['p99_ms']:>7.2f} ms")
+
+async def in_process(args):
+    with open("model.pkl", "rb") as f:
+        model = pickle.load(f)
+    width = model.n_features_in_
+    loop = asyncio.get_running_loop()
+
+    async def unbatched(row):
+        return await loop.run_in_executor(None, model.predict, row.reshape(1, -1))
+
+    report("batching off", await run_load(unbatched, args.requests, args.concurrency, width))
+    batcher = MicroBatcher(model.predict, max_batch_size=args.max_batch, max_wait_ms=args.window_ms)
+    report("batching on", await run_load(batcher.predict, args.requests, args.concurrency, width))
+    print(f"batcher stats: {batcher.stats()}")
+    await check_bad_rows(model, width, args.max_batch)
+
+# Every 8th row is one feature short: rejected on submit when the batcher is told the
+# width, else predicted apart from the well-formed rows; the rest must still succeed
+async def check_bad_rows(model, width, max_batch):
+    rows = np.random.default_rng(1).random((8 * max_batch, width), dtype=np.float32)
+    expected = model.predict(rows)
+    for checked in (True, False):
+        batcher = MicroBatcher(model.predict, max_batch_size=max_batch, max_wait_ms=20.0)
+        calls = [batcher.predict(row[:-1] if i % 8 == 0 else row, width=width if checked else None)
+                 for i, row in enumerate(rows)]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        bad = [result for i, result in enumerate(results) if i % 8 == 0]
+        good = [(result, expected[i]) for i, result in enumerate(results) if i % 8]
+        if checked:
+            check(all(isinstance(result, InvalidRow) for result in bad), "short rows rejected on submit")
+        else:
+            check(all(isinstance(result, Exception) for result in bad), "short rows fail")
+        check(all(not isinstance(result, Exception) and np.isclose(result, value) for result, value in good),
+              "well-formed rows in the same batches succeed")
+    print(f"bad-width rows: {len(bad)} rejected, {len(good)} well-formed rows in the same batches predicted")
+
+async def against_server(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30.0) as client:
+        async def call(row):
+            response = await client.post("/predict", json={"features": row.tolist()})
+            response.raise_for_status()
+
+        report(args.url, await run_load(call, args.requests, args.concurrency, args.width))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test micro-batched single-row prediction.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--url", help="Base URL of a running server; omit to test in-process")
+    parser.add_argument("--width", type=int, default=10, help="Feature width when testing a server")
+    args = parser.parse_args()
+    asyncio.run(against_server(args) if args.url else in_process(args))
@@ -0,0 +1,119 @@
+# Scripted load against the ASGI app (in-process, model replaced by a fake with a
+# fixed inference time), then checks the /metrics output: request counts per route
+# and status, cumulative histogram buckets, inference batch sizes against the
+# micro-batcher's own counters, and only the /metrics request itself in flight.
+# Also reports the cost of one histogram observation and throughput with metrics on.
+# Run from the repository root: python -m benchmarks.load_test_metrics [--requests 2000] [--concurrency 32]
+import argparse
+import asyncio
+import logging
+import re
+import time
+
+import httpx
+import numpy as np
+
+import main
+from instrumentation import Histogram
+
+WIDTH = 10
+INFERENCE_DELAY = 0.012  # Seconds per fake predict call; lands in the (0.01, 0.025] bucket
+SAMPLE_PATTERN = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+class FakeModel:
+    n_features_in_ = WIDTH
+
+    def predict(self, matrix):
+        time.sleep(INFERENCE_DELAY)
+        return np.zeros(len(matrix), dtype=np.float32)
+
+def parse_metrics(text):
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE_PATTERN.match(line)
+        if match and not line.startswith("#"):
+            name, labels, value = match.groups()
+            key = (name, tuple(sorted(re.findall(r'(\w+)="([^"]*)"', labels or ""))))
+            samples[key] = float(value)
+    return samples
+
+def sample(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0.0)
+
+def buckets(samples, name, **labels):
+    found = [(float(dict(key)["le"]), value) for (sample_name, key), value in samples.items()
+             if sample_name == f"{name}_bucket" and {k: v for k, v in key if k != "le"} == labels]
+    return sorted(found)
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+async def scripted_load(client, n_requests, concurrency):
+    rows = np.random.default_rng(0).random((n_requests, WIDTH)).tolist()
+    next_index = iter(range(n_requests))
+
+    async def worker():
+        for i in next_index:
+            response = await client.post("/predict", json={"features": rows[i]})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return n_requests / (time.perf_counter() - start)
+
+async def bench(args):
+    main.registry.install(FakeModel(), "fake")
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        rps = await scripted_load(client, args.requests, args.concurrency)
+        for _ in range(args.not_found):
+            await client.get("/no/such/route")
+        bad = (await client.post("/predict", json={"features": [1.0]})).status_code
+        response = await client.get("/metrics")
+    check(response.headers["content-type"].startswith("text/plain; version=0.0.4"), "metrics content type")
+    samples = parse_metrics(response.text)
+
+    latency = "safezone_http_request_duration_seconds"
+    predict_ok = dict(method="POST", route="/predict", status="200")
+    check(sample(samples, f"{latency}_count", **predict_ok) == args.requests, "one observation per /predict request")
+    check(sample(samples, f"{latency}_count", method="POST", route="/predict", status=str(bad)) == 1,
+          "invalid row recorded with its status")
+    check(sample(samples, f"{latency}_count", method="GET", route="unmatched", status="404") == args.not_found,
+          "unknown paths grouped under route=unmatched")
+
+    latency_buckets = buckets(samples, latency, **predict_ok)
+    counts = [count for _, count in latency_buckets]
+    check(counts == sorted(counts), "latency buckets are cumulative")
+    check(latency_buckets[-1] == (float("inf"), args.requests), "+Inf bucket equals the count")
+    check(dict(latency_buckets)[0.01] == 0, f"no request faster than the {INFERENCE_DELAY}s inference")
+
+    inference = dict(buckets(samples, "safezone_model_inference_seconds", version="fake"))
+    batch_stats = main.batcher.stats()
+    check(inference[0.01] == 0 and inference[0.05] == inference[float("inf")] == batch_stats["batches"],
+          "inference time buckets")
+    check(sample(samples, "safezone_model_inference_batch_rows_sum") == batch_stats["rows"] == args.requests,
+          "batch rows histogram sums to the rows predicted")
+    check(sample(samples, "safezone_model_inference_batch_rows_count") == batch_stats["batches"],
+          "one batch-size observation per micro-batch")
+    check(sample(samples, "safezone_api_stage_duration_seconds_count", stage="predict") == args.requests,
+          "predict stage timed once per request")
+    check(sample(samples, "safezone_http_requests_in_flight") == 1, "only the /metrics request itself in flight")
+
+    histogram = Histogram("bench_seconds", "Observation cost")
+    start = time.perf_counter()
+    for i in range(100_000):
+        histogram.observe(i * 1e-6, "GET", "/predict", "200")
+    observe_us = (time.perf_counter() - start) / 100_000 * 1e6
+    print(f"all checks passed: {args.requests} requests at concurrency {args.concurrency}, "
+          f"{batch_stats['batches']} micro-batches (mean {batch_stats['mean_batch_size']:.1f} rows)")
+    print(f"{rps:,.0f} req/s with metrics on; histogram observe {observe_us:.2f} us; "
+          f"/metrics body {len(response.content):,} bytes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--not-found", type=int, default=7)
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(bench(parser.parse_args()))
@@ -0,0 +1,140 @@
+# Hot model swap under load: /predict is driven concurrently through the ASGI app
+# while MODEL_DIR/CURRENT is flipped between two XGBoost versions, a third version is
+# deployed, a corrupt file is deployed (and must be rejected) and a resident version
+# is activated directly. Every request must succeed and return the prediction of one
+# of the deployed versions; afterwards the registry must serve the last good
+# version with at most `keep` versions resident. Cached predictions (the
+# /predict_from_firebase path) run alongside, and every cache entry must hold the
+# prediction of the version it is keyed with.
+# Run from the repository root: python -m benchmarks.load_test_model_swap [--requests 4000] [--concurrency 32]
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+from xgboost import XGBRegressor
+
+import main
+from model_registry import ModelRegistry, file_version, set_current
+from prediction_cache import TTLCache, input_key
+
+WIDTH = 10
+CACHED_INPUTS = 20  # Distinct inputs sent through cached_predict, so entries are reused
+POLL_SECONDS = 0.02
+DWELL_SECONDS = 0.3  # Load served by each deployed version before the next deploy
+
+# A model that predicts `value` for every row, saved in the native format
+def constant_model(path, value):
+    rng = np.random.default_rng(int(value))
+    model = XGBRegressor(n_estimators=20, max_depth=3)
+    model.fit(rng.random((200, WIDTH)), np.full(200, value))
+    model.save_model(path)
+    return float(model.predict(np.zeros((1, WIDTH)))[0])
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def wait_for_version(registry, version, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while registry.version != version and time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+    return registry.version == version
+
+# Runs in a thread while the load is on: flips, deploys and rolls back
+def deploy_script(registry, model_dir, versions, flips, done):
+    for i in range(flips):
+        name = "a.ubj" if i % 2 else "b.ubj"
+        set_current(model_dir, name)
+        wait_for_version(registry, versions[name])
+        time.sleep(DWELL_SECONDS)
+    set_current(model_dir, "c.ubj")  # A version never loaded before
+    wait_for_version(registry, versions["c.ubj"])
+    time.sleep(DWELL_SECONDS)
+    with open(os.path.join(model_dir, "broken.ubj"), "wb") as f:
+        f.write(b"not a model")
+    set_current(model_dir, "broken.ubj")
+    time.sleep(POLL_SECONDS * 10)  # Several polls; every one must keep serving c
+    registry.activate(versions["b.ubj"])  # Rollback through the API method, no reload
+    done.set()
+
+async def bench(args):
+    model_dir = tempfile.mkdtemp()
+    expected = {name: constant_model(os.path.join(model_dir, name), value)
+                for name, value in (("a.ubj", 1.0), ("b.ubj", 2.0), ("c.ubj", 3.0))}
+    set_current(model_dir, "a.ubj")
+    registry = ModelRegistry(candidates=(), model_dir=model_dir, keep_versions=args.keep)
+    main.registry = registry
+    main.prediction_cache = TTLCache(maxsize=10_000, ttl=3600)
+    versions = {}
+    for name in ("a.ubj", "b.ubj"):  # c is first loaded by the watcher, under load
+        set_current(model_dir, name)
+        registry.load()
+        versions[name] = registry.version
+    versions["c.ubj"] = file_version(os.path.join(model_dir, "c.ubj"))
+    set_current(model_dir, "a.ubj")
+    registry.load()
+    registry.watch(POLL_SECONDS)
+
+    done = threading.Event()
+    deployer = threading.Thread(target=deploy_script, args=(registry, model_dir, versions, args.flips, done))
+    rows = np.random.default_rng(0).random((args.requests, WIDTH)).tolist()
+    next_index = iter(range(args.requests))
+    failures, seen = [], {}
+
+    async def worker(client):
+        for i in next_index:
+            if i % 4 == 0:
+                await main.cached_predict(rows[i % CACHED_INPUTS])
+            response = await client.post("/predict", json={"features": rows[i]})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+                continue
+            prediction = round(response.json()["prediction"][0], 4)
+            seen[prediction] = seen.get(prediction, 0) + 1
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        deployer.start()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        await asyncio.to_thread(done.wait)
+        final = (await client.post("/predict", json={"features": rows[0]})).json()["prediction"][0]
+    registry.stop()
+
+    allowed = {round(value, 4) for value in expected.values()}
+    stats = registry.stats()
+    cached = {(name, i): main.prediction_cache.get(input_key(rows[i], version))
+              for name, version in versions.items() for i in range(CACHED_INPUTS)}
+    cached = {key: value for key, value in cached.items() if value is not None}
+    check(all(round(float(value[0]), 4) == round(expected[name], 4) for (name, _), value in cached.items()),
+          "every cached prediction comes from the version it is keyed with")
+    check(len({name for name, _ in cached}) >= 2, "predictions were cached for several versions")
+    check(not failures, f"{len(failures)} failed requests: {sorted(set(failures))}")
+    check(set(seen) <= allowed, f"unexpected predictions {set(seen) - allowed}")
+    check(len(seen) == 3, "load overlapped every deployed version")
+    check(registry.version == versions["b.ubj"] and round(final, 4) == round(expected["b.ubj"], 4),
+          "rollback to b is active and serving")
+    check(stats["error"] and "broken.ubj" in stats["error"], "corrupt deploy reported")
+    check(len(stats["resident"]) <= args.keep, "resident versions bounded")
+    print(f"all checks passed: {args.requests} requests at concurrency {args.concurrency} in {elapsed:.2f}s "
+          f"({args.requests / elapsed:,.0f} req/s), {stats['swaps']} swaps, 0 failed")
+    print(f"predictions served: {dict(sorted(seen.items()))}")
+    for entry in stats["resident"]:
+        print(f"  version {entry['version']}: {entry['calls']} calls, {entry['rows']} rows, "
+              f"mean {entry['mean_ms']:.2f} ms, max {entry['max_ms']:.2f} ms, loaded in {entry['load_seconds']:.3f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--flips", type=int, default=6)
+    parser.add_argument("--keep", type=int, default=3)
+    logging.getLogger().setLevel(logging.ERROR)
+    asyncio.run(bench(parser.parse_args()))
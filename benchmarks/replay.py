@@ -0,0 +1,379 @@
+# End-to-end replay of the ETL scripts and the API against in-process fakes, for
+# throughput regressions between commits. Scenarios:
+#   cold_backfill  - preprocess_and_upload over a fresh sheet into an empty Firebase
+#   incremental    - after a backfill, rounds of new sheet rows read past the cursor
+#   gov_upload     - zgov.run over a synthetic crime_district Parquet file: full
+#                    worksheet rewrite, then a delta upload after one more month
+#   api_load       - a mixed request load on main.app (predict, Firebase input,
+#                    plots, stats, forecasts) while the Firebase input keeps changing
+# Google Sheets, gspread worksheets and firebase_admin.db are faked
+# (benchmarks.fakes) with injected latency plus an exponential tail. Each scenario
+# runs in its own spawned process and working directory, so its peak RSS is its own.
+# Reports rows/s (requests/s for the API), p50/p99 latencies and peak memory; the
+# results are saved as JSON (by default under .cache/replay/, named by commit), and
+# --compare prints the change against an earlier results file.
+# Run from the repository root: python -m benchmarks.replay [--quick] [--scenarios cold_backfill,api_load]
+#                               [--output PATH] [--compare OLD.json] [--threshold 0.1]
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from instrumentation import peak_rss_bytes
+
+SCENARIOS = ("cold_backfill", "incremental", "gov_upload", "api_load")
+RESULTS_DIR = os.path.join(".cache", "replay")
+HIGHER_IS_BETTER = ("rows_per_second", "requests_per_second")
+COMPARED_METRICS = HIGHER_IS_BETTER + ("p99_ms", "seconds", "peak_rss_mb")
+WIDTH = 10
+WRITE_CALLS = ("update", "batch_update", "append_rows")  # Worksheet calls that carry rows
+API_MIX = (  # (weight, method, path)
+    (40, "POST", "/predict"),
+    (20, "GET", "/predict_from_firebase"),
+    (5, "GET", "/plot_from_firebase?format=png"),
+    (15, "GET", "/stats/district?source=reports&state=selangor"),
+    (10, "GET", "/stats/trend?source=gov&state=Johor"),
+    (10, "GET", "/forecast?limit=20"),
+)
+
+DEFAULTS = {"rows": 20_000, "base_rows": 20_000, "rounds": 10, "round_rows": 200, "periods": 96,
+            "requests": 2000, "concurrency": 32, "firebase_latency": 0.005, "sheets_latency": 0.02,
+            "jitter": 0.002, "workers": 1, "stream": False, "seed": 0}
+QUICK = {"rows": 4000, "base_rows": 4000, "rounds": 5, "round_rows": 100, "periods": 36, "requests": 500}
+
+def check(condition, message):
+    if not condition:
+        raise SystemExit(f"FAILED: {message}")
+
+def latency_summary(seconds):
+    if not seconds:
+        return {"count": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    values = np.asarray(seconds) * 1000.0
+    return {"count": len(values), "p50_ms": float(np.percentile(values, 50)),
+            "p99_ms": float(np.percentile(values, 99)), "max_ms": float(values.max())}
+
+def etl_fakes(params, rows):
+    import preprocess_and_upload as pu
+    from benchmarks.fakes import FakeDatabase, FakeSheetsService
+
+    database = FakeDatabase(latency=params["firebase_latency"], jitter=params["jitter"], seed=params["seed"])
+    sheet = FakeSheetsService(rows, latency=params["sheets_latency"], jitter=params["jitter"], seed=params["seed"])
+    pu.db.reference = database.reference
+    pu.open_sheet = lambda: sheet
+    run = pu.stream_and_upload if params["stream"] else pu.process_and_upload
+    return database, sheet, lambda mode: run(fetch_mode=mode, workers=params["workers"])
+
+def stage_seconds():
+    from instrumentation import metrics
+
+    return {name: round(totals["seconds"], 4) for name, totals in metrics.summary()["stages"].items()}
+
+def cold_backfill(params):
+    from benchmarks.synthetic import synthetic_sheet_rows
+
+    rows = synthetic_sheet_rows(params["rows"], params["seed"])
+    database, sheet, run = etl_fakes(params, rows)
+    start = time.perf_counter()
+    run("full")
+    seconds = time.perf_counter() - start
+    written = len(database.reference("crime_data").get() or {})
+    check(written > 0.95 * params["rows"], f"backfill wrote {written} of {params['rows']} rows")
+    return {"rows": params["rows"], "written": written, "seconds": seconds,
+            "rows_per_second": params["rows"] / seconds, "firebase_update": latency_summary(database.durations["update"]),
+            "sheets_get": latency_summary(sheet.durations["get"]), "firebase_calls": sum(database.calls.values()),
+            "stages": stage_seconds()}
+
+def incremental(params):
+    from benchmarks.synthetic import synthetic_sheet_rows
+
+    total = params["base_rows"] + params["rounds"] * params["round_rows"]
+    all_rows = synthetic_sheet_rows(total, params["seed"])
+    rows = all_rows[:params["base_rows"] + 1]
+    database, sheet, run = etl_fakes(params, rows)
+    run("incremental")  # No cursor yet: the backfill, not timed
+
+    round_seconds = []
+    calls_before = sum(database.calls.values()), sum(sheet.calls.values())
+    for i in range(params["rounds"]):
+        first = params["base_rows"] + 1 + i * params["round_rows"]
+        rows.extend(all_rows[first:first + params["round_rows"]])
+        start = time.perf_counter()
+        run("incremental")
+        round_seconds.append(time.perf_counter() - start)
+    cursor = database.reference("sheet_cursor").get()
+    check(cursor and cursor["last_row"] == total + 1, "cursor advanced to the last sheet row")
+    new_rows = params["rounds"] * params["round_rows"]
+    return {"rounds": params["rounds"], "rows": new_rows, "seconds": sum(round_seconds),
+            "rows_per_second": new_rows / sum(round_seconds), "round": latency_summary(round_seconds),
+            "firebase_calls_per_round": (sum(database.calls.values()) - calls_before[0]) / params["rounds"],
+            "sheets_calls_per_round": (sum(sheet.calls.values()) - calls_before[1]) / params["rounds"]}
+
+def gov_upload(params):
+    import zgov
+    from benchmarks.fakes import FakeWorksheet
+    from benchmarks.synthetic import synthetic_crime_district_frame
+
+    worksheet = FakeWorksheet(rows=1000, cols=5, latency=params["sheets_latency"], jitter=params["jitter"],
+                              seed=params["seed"])
+    zgov.open_worksheet = lambda *args: worksheet
+    os.environ["GOOGLE_SHEETS_CREDENTIALS"] = "{}"  # Never read: the worksheet is faked
+
+    # The delta run sees the same data plus one new month
+    frame = synthetic_crime_district_frame(n_periods=params["periods"] + 1, freq="MS", seed=params["seed"])
+    sources = {"full": frame[frame["date"] < frame["date"].max()], "delta": frame}
+    results = {}
+    for upload, source in sources.items():
+        path = f"crime_district_{upload}.parquet"
+        source.to_parquet(path, index=False)
+        args = argparse.Namespace(ingest="stream", source=path, upload=upload, cube_dir=zgov.DEFAULT_CUBE_DIR,
+                                  rebuild_cube=False)
+        cells_before = worksheet.cells_written
+        calls_before = {operation: len(worksheet.durations[operation]) for operation in WRITE_CALLS}
+        start = time.perf_counter()
+        zgov.run(args)
+        seconds = time.perf_counter() - start
+        rows_written = (worksheet.cells_written - cells_before) // len(zgov.REQUIRED_COLUMNS)
+        results[upload] = {"rows_written": rows_written, "seconds": seconds,
+                           "rows_per_second": rows_written / seconds,
+                           "sheets_update": latency_summary([seconds for operation, start in calls_before.items()
+                                                             for seconds in worksheet.durations[operation][start:]])}
+    sheet_rows = len(worksheet.get_all_values()) - 1
+    new_month_rows = results["delta"]["rows_written"]
+    check(0 < new_month_rows < results["full"]["rows_written"] / (params["periods"] - 1),
+          f"delta wrote only the new month ({new_month_rows} rows)")
+    check(sheet_rows == results["full"]["rows_written"] - 1 + new_month_rows, "worksheet holds every aggregate row")
+    results["sheet_rows"] = sheet_rows
+    results["stages"] = stage_seconds()
+    return results
+
+# Firebase crime_data reports, the SafeZoneGOV worksheet rows zgov.py uploads from its
+# cube and a trained model with its forecast table, as the API finds them in production
+def seed_api(params, database):
+    import preprocess_and_upload as pu
+    from crime_cube import update_cube
+    from gov_ingest import load_crime_district
+    from training import train
+    from benchmarks.synthetic import (synthetic_crime_panel, synthetic_tweet_frame,
+                                      write_synthetic_crime_district)
+
+    reports = pu.build_crime_batch(pu.enrich_dataframe(synthetic_tweet_frame(params["rows"], params["seed"])))
+    database.reference("crime_data").set(reports)
+    database.reference("input_data").set([round(random.random(), 3) for _ in range(WIDTH)])
+    path = write_synthetic_crime_district("crime_district.parquet", n_periods=params["periods"], freq="MS")
+    gov = update_cube(load_crime_district(path)).to_frame()
+    gov["date"] = gov["date"].dt.strftime("%Y-%m-%d")
+    gov_rows = [gov.columns.tolist()] + [[str(value) for value in row] for row in gov.values.tolist()]
+    model_dir = os.path.abspath("models")
+    train(synthetic_crime_panel(320, params["periods"]), model_dir, params={"n_estimators": 50})
+    return model_dir, gov_rows
+
+async def drive_api(params, database):
+    import httpx
+
+    import main
+
+    rng = random.Random(params["seed"])
+    weights, requests = zip(*[(weight, (method, path)) for weight, method, path in API_MIX])
+    plan = rng.choices(requests, weights=weights, k=params["requests"])
+    rows = np.random.default_rng(params["seed"]).random((params["requests"], WIDTH)).round(3).tolist()
+    latencies, failures = {}, []
+    next_index = iter(range(params["requests"]))
+    stop = asyncio.Event()
+
+    async def worker(client):
+        for i in next_index:
+            method, path = plan[i]
+            start = time.perf_counter()
+            if method == "POST":
+                response = await client.post(path, json={"features": rows[i]})
+            else:
+                response = await client.get(path)
+            latencies.setdefault(path.split("?")[0], []).append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures.append((path, response.status_code))
+
+    # New Firebase input every 100 ms: the listener updates the mirror, the prediction
+    # and plot caches miss once per new input
+    async def change_input():
+        while not stop.is_set():
+            values = [round(rng.random(), 3) for _ in range(WIDTH)]
+            await asyncio.to_thread(database.reference("input_data").set, values)
+            await asyncio.sleep(0.1)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=60) as client:
+        await client.get("/plot_from_firebase?format=png")  # Starts the render workers outside the timing
+        writer = asyncio.create_task(change_input())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(params["concurrency"])))
+        seconds = time.perf_counter() - start
+        stop.set()
+        await writer
+    main.plot_renderer.shutdown()
+    main.input_mirror.stop()
+    main.stats_store.stop()
+    return latencies, failures, seconds
+
+def api_load(params):
+    import firebase_admin.db
+
+    from benchmarks.fakes import FakeDatabase, FakeSheetsService
+
+    database = FakeDatabase(latency=params["firebase_latency"], jitter=params["jitter"], seed=params["seed"])
+    firebase_admin.db.reference = database.reference
+    model_dir, gov_rows = seed_api(params, database)
+    gov_sheet = FakeSheetsService(gov_rows, latency=params["sheets_latency"], jitter=params["jitter"], seed=params["seed"])
+
+    import main
+    from model_registry import ModelRegistry
+    from stats_store import load_gov_frame
+
+    main.registry = ModelRegistry(candidates=(), model_dir=model_dir)
+    main.registry.load()
+    main.stats_store.loaders["gov"] = lambda: load_gov_frame(cube_dir=None, sheet=gov_sheet)
+    main.stats_store.refresh()
+    latencies, failures, seconds = asyncio.run(drive_api(params, database))
+    check(not failures, f"{len(failures)} failed requests, e.g. {failures[:3]}")
+    check(main.input_mirror.stats()["mode"] == "listener", "Firebase input mirrored through the listener")
+    every = [value for values in latencies.values() for value in values]
+    return {"requests": len(every), "concurrency": params["concurrency"], "seconds": seconds,
+            "requests_per_second": len(every) / seconds, "latency": latency_summary(every),
+            "routes": {route: latency_summary(values) for route, values in sorted(latencies.items())},
+            "firebase_calls": dict(database.calls)}
+
+# Entry point of a scenario process: a scratch working directory, then the scenario
+def run_scenario(name, params, queue):
+    os.chdir(tempfile.mkdtemp(prefix=f"replay-{name}-"))
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # The scripts' print()s
+            result = globals()[name](params)
+        peak = peak_rss_bytes()
+        result["peak_rss_mb"] = peak / 1e6 if peak else None
+        queue.put((name, result, None))
+    except BaseException as e:
+        queue.put((name, None, f"{type(e).__name__}: {e}"))
+
+def run_isolated(name, params):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_scenario, args=(name, params, queue))
+    process.start()
+    _, result, error = queue.get()
+    process.join()
+    if error:
+        raise SystemExit(f"FAILED: scenario {name}: {error}")
+    return result
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# {"cold_backfill.firebase_update.p99_ms": 12.3, ...} for every number in the results
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+# Changes of the compared metrics vs `baseline`; regressions are worse by more than `threshold`
+def compare(current, baseline, threshold):
+    now, before = flatten(current["scenarios"]), flatten(baseline["scenarios"])
+    regressions = []
+    print(f"\nvs {baseline['revision']} ({baseline['params_hash']}):" if baseline["params_hash"] != current["params_hash"]
+          else f"\nvs {baseline['revision']}:")
+    for key in sorted(now.keys() & before.keys()):
+        if not key.endswith(COMPARED_METRICS) or not before[key]:
+            continue
+        change = (now[key] - before[key]) / before[key]
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(key)
+        print(f"  {key:<58} {before[key]:>12.2f} -> {now[key]:>12.2f}  {change:+7.1%}{flag}")
+    if baseline["params_hash"] != current["params_hash"]:
+        print("  (parameters differ from the baseline run)")
+    return regressions
+
+def print_results(results):
+    for name, result in results["scenarios"].items():
+        rate = result.get("rows_per_second") or result.get("requests_per_second")
+        line = f"{name:<14}"
+        if rate:
+            unit = "req/s" if "requests_per_second" in result else "rows/s"
+            line += f" {rate:>10,.0f} {unit}"
+        for key in ("firebase_update", "round", "latency"):
+            if key in result:
+                line += f"  {key} p50 {result[key]['p50_ms']:.1f} ms, p99 {result[key]['p99_ms']:.1f} ms"
+        if name == "gov_upload":
+            line += "".join(f"  {mode}: {result[mode]['rows_written']:,} rows at {result[mode]['rows_per_second']:,.0f}"
+                            f" rows/s, update p99 {result[mode]['sheets_update']['p99_ms']:.1f} ms"
+                            for mode in ("full", "delta"))
+        print(f"{line}  peak RSS {result['peak_rss_mb']:.0f} MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--quick", action="store_true", help="Smaller data sets, for a fast smoke run")
+    for key, value in DEFAULTS.items():
+        if isinstance(value, bool):
+            parser.add_argument(f"--{key.replace('_', '-')}", action="store_true")
+        else:
+            parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=None)
+    parser.add_argument("--output", help=f"Results file; default {RESULTS_DIR}/<commit>.json")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="Earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    params = {**DEFAULTS, **(QUICK if args.quick else {})}
+    params.update({key: getattr(args, key) for key in DEFAULTS if getattr(args, key) not in (None, False)})
+    baseline = None
+    if args.compare:  # Read first: the new results may be written over it
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {sorted(unknown)}; choose from {', '.join(SCENARIOS)}")
+
+    results = {"revision": git_revision(), "timestamp": time.time(), "python": sys.version.split()[0],
+               "platform": platform.platform(), "cpus": os.cpu_count(), "params": params,
+               "params_hash": hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8],
+               "scenarios": {}}
+    for name in names:
+        results["scenarios"][name] = run_isolated(name, params)
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['revision']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(f"{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
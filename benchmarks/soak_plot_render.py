@@ -0,0 +1,50 @@
+# Soak test: render many distinct plots with plot_renderer.render_png and check
+# that resident memory stays flat (the old pyplot handler grew with every call).
+# Run from the repository root: python -m benchmarks.soak_plot_render [renders] [--pyplot]
+import sys
+import time
+
+import numpy as np
+
+from plot_renderer import render_png
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * 4096 / 1e6
+
+# The rendering previously done in /plot_from_firebase, for comparison
+def pyplot_render(values):
+    import io
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.plot(values)
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png")
+    return buf.getvalue()
+
+if __name__ == "__main__":
+    renders = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 10_000
+    render = pyplot_render if "--pyplot" in sys.argv else render_png
+    rng = np.random.default_rng(0)
+    sample_every = max(renders // 20, 1)
+
+    render(rng.random(12))  # Warm up imports, fonts and caches before the baseline
+    baseline = rss_mb()
+    start = time.perf_counter()
+    samples = []
+    for i in range(1, renders + 1):
+        render(rng.random(12))
+        if i % sample_every == 0:
+            samples.append((i, rss_mb()))
+            print(f"{i:>7} renders  RSS {samples[-1][1]:8.1f} MB")
+
+    elapsed = time.perf_counter() - start
+    # Compare the second half of the run against its midpoint to ignore allocator warm-up
+    midpoint = samples[len(samples) // 2][1]
+    growth = samples[-1][1] - midpoint
+    print(f"{renders} renders in {elapsed:.1f}s ({renders / elapsed:.0f}/s), baseline {baseline:.1f} MB, "
+          f"growth over second half {growth:+.1f} MB")
+    sys.exit(1 if growth > 5.0 else 0)
@@ -0,0 +1,122 @@
+import datetime
+import random
+
+import numpy as np
+import pandas as pd
+
+from preprocess_and_upload import ABBREVIATIONS, DISTRICT_TO_STATE, MALAYSIAN_DISTRICTS, MALAYSIAN_STATES
+
+# Synthetic Malay crime tweets for benchmarks. Most mention a state, district
+# or abbreviation; some carry URLs and punctuation; a few mention no place at all.
+TWEET_TEMPLATES = [
+    "Kes {topic} berlaku di {loc} malam tadi {url}",
+    "Hati-hati semua, ada {topic} kat {loc}!! {url}",
+    "{topic} di kawasan {loc}, polis sedang siasat",
+    "Semalam berita {topic} dekat {loc}... ngeri betul",
+    "Tolong share: suspek {topic} dikesan di dalam {loc} #jenayah",
+    "Baru dengar ada {topic} lagi, tak tahu kat mana {url}",
+]
+
+MAIN_TOPICS = ["curi", "pencuri", "rogol", "rompak", "rompakan", "bunuh", "stealing", "rape", "robbery"]
+
+LOCATION_NAMES = MALAYSIAN_STATES + MALAYSIAN_DISTRICTS + list(ABBREVIATIONS)
+
+def synthetic_tweets(n, seed=0):
+    rng = random.Random(seed)
+    tweets = []
+    for i in range(n):
+        loc = rng.choice(LOCATION_NAMES)
+        if rng.random() < 0.3:
+            loc = loc.title()
+        url = f"https://t.co/{i:08x}" if rng.random() < 0.4 else ""
+        tweets.append(rng.choice(TWEET_TEMPLATES).format(topic=rng.choice(MAIN_TOPICS), loc=loc, url=url))
+    return tweets
+
+# A DataFrame shaped like the output of fetch_google_sheets
+def synthetic_tweet_frame(n, seed=0):
+    rng = random.Random(seed)
+    start = datetime.date(2024, 1, 1)
+    return pd.DataFrame({
+        "Date (GMT)": [start + datetime.timedelta(days=rng.randrange(365)) for _ in range(n)],
+        "Main Topic": [rng.choice(MAIN_TOPICS) for _ in range(n)],
+        "Tweet Text": synthetic_tweets(n, seed),
+    })
+
+# crime_district.parquet-shaped data: one row per state/district/category/type/date,
+# plus the "All" district and "Malaysia" state aggregate rows the ingestion filters out
+CRIME_TYPES = {
+    "assault": ["causing_injury", "murder", "rape", "robbery_gang_armed", "robbery_gang_unarmed", "robbery_solo_armed"],
+    "property": ["break_in", "theft_other", "theft_vehicle_lorry", "theft_vehicle_motorcar", "theft_vehicle_motorcycle"]
+}
+
+def synthetic_crime_district_frame(n_periods=8, freq="YS", start="2016-01-01", seed=0):
+    rng = random.Random(seed)
+    dates = pd.date_range(start, periods=n_periods, freq=freq).date
+    districts = [(state.title(), district.title()) for district, state in DISTRICT_TO_STATE.items()]
+    states = sorted({state for state, _ in districts})
+    places = districts + [(state, "All") for state in states] + [("Malaysia", "All")]
+    rows = [
+        (state, district, category, crime_type, date, rng.randrange(0, 500))
+        for state, district in places
+        for category, crime_types in CRIME_TYPES.items()
+        for crime_type in crime_types
+        for date in dates
+    ]
+    return pd.DataFrame(rows, columns=["state", "district", "category", "type", "date", "crimes"])
+
+def write_synthetic_crime_district(path, row_group_size=50_000, **kwargs):
+    synthetic_crime_district_frame(**kwargs).to_parquet(path, index=False, row_group_size=row_group_size)
+    return path
+
+# zgov.py df_combined-shaped aggregates for n_series state/district/category series,
+# each a noisy level with a trend and a yearly season (for training benchmarks).
+# Series beyond the real district x category pairs get numbered categories.
+def synthetic_crime_panel(n_series, n_periods=96, freq="MS", start="2016-01-01", seed=0):
+    rng = np.random.default_rng(seed)
+    places = [(state.title(), district.title()) for district, state in DISTRICT_TO_STATE.items()]
+    pairs = [(state, district, category) for state, district in places for category in CRIME_TYPES]
+    series = [(state, district, category if i < len(pairs) else f"{category}_{i // len(pairs)}")
+              for i, (state, district, category) in ((i, pairs[i % len(pairs)]) for i in range(n_series))]
+    dates = pd.date_range(start, periods=n_periods, freq=freq)
+    t = np.arange(n_periods)
+    level = rng.uniform(20, 400, (n_series, 1))
+    season = 1 + 0.2 * np.sin(2 * np.pi * t / 12 + rng.uniform(0, 2 * np.pi, (n_series, 1)))
+    trend = 1 + rng.uniform(-0.005, 0.005, (n_series, 1)) * t
+    crimes = rng.poisson(level * season * trend)
+    keys = np.array(series, dtype=object)
+    return pd.DataFrame({
+        "state": np.repeat(keys[:, 0], n_periods),
+        "district": np.repeat(keys[:, 1], n_periods),
+        "category": np.repeat(keys[:, 2], n_periods),
+        "date": np.tile(dates.to_numpy(), n_series),
+        "crimes": crimes.reshape(-1)
+    })
+
+# crime_data-shaped report records (as written by preprocess_and_upload.py), one crime each
+def synthetic_report_frame(n, start="2022-01-01", days=3 * 365, seed=0):
+    rng = np.random.default_rng(seed)
+    places = list(DISTRICT_TO_STATE.items())
+    place = rng.integers(0, len(places), n)
+    categories = np.array(["assault", "property", "Other"], dtype=object)
+    crime_types = np.array(["rape", "theft", "robbery", "Unknown"], dtype=object)
+    return pd.DataFrame({
+        "state": np.array([state for _, state in places], dtype=object)[place],
+        "district": np.array([district for district, _ in places], dtype=object)[place],
+        "category": categories[rng.integers(0, len(categories), n)],
+        "type": crime_types[rng.integers(0, len(crime_types), n)],
+        "date": pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days, n), unit="D"),
+        "crimes": 1
+    })
+
+# Raw SafeZone sheet values (header row first), as returned by the Sheets API
+SHEET_HEADER = ["Date (GMT)", "Main Topic", "Tweet Text", "Tweet URL", "Username", "Likes", "Retweets", "Replies"]
+
+def synthetic_sheet_rows(n, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    rows = [SHEET_HEADER]
+    for i, text in enumerate(synthetic_tweets(n, seed)):
+        date = start + datetime.timedelta(minutes=rng.randrange(365 * 24 * 60))
+        rows.append([date.strftime("%Y-%m-%d %H:%M:%S"), rng.choice(MAIN_TOPICS), text,
+                     f"https://x.com/i/status/{i}", f"user{rng.randrange(5000)}", str(rng.randrange(100)), "0", "0"])
+    return rows
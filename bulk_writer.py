@@ -0,0 +1,95 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Chunked, retrying bulk writer for Firebase Realtime Database multi-path updates.
+# Records are split into chunks bounded by count and serialized size, written
+# concurrently through a bounded thread pool, and each chunk is retried on its own
+# with exponential backoff. `on_chunk_written` (e.g. ProcessedIdIndex.add) is called
+# with a chunk's keys only after that chunk's write succeeded.
+
+MAX_CHUNK_RECORDS = 500
+MAX_CHUNK_BYTES = 1_000_000  # Far below the 16 MB Realtime Database write limit
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # Seconds; doubled after every failed attempt
+BACKOFF_MAX = 30.0
+
+class FirebaseBulkWriter:
+    def __init__(self, data_ref, on_chunk_written=None, max_chunk_records=MAX_CHUNK_RECORDS,
+                 max_chunk_bytes=MAX_CHUNK_BYTES, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, sleep=time.sleep):
+        self.data_ref = data_ref
+        self.on_chunk_written = on_chunk_written
+        self.max_chunk_records = max_chunk_records
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.sleep = sleep
+
+    # Split {key: record} into size-bounded update payloads; returns [(chunk, serialized bytes)]
+    def chunk(self, records):
+        chunks = []
+        current, current_bytes = {}, 0
+        for key, record in records.items():
+            size = len(json.dumps({key: record}, default=str))
+            if current and (len(current) >= self.max_chunk_records or current_bytes + size > self.max_chunk_bytes):
+                chunks.append((current, current_bytes))
+                current, current_bytes = {}, 0
+            current[key] = record
+            current_bytes += size
+        if current:
+            chunks.append((current, current_bytes))
+        return chunks
+
+    def _with_retries(self, action, description):
+        for attempt in range(self.max_retries):
+            try:
+                return action()
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = min(self.backoff_base * 2 ** attempt, BACKOFF_MAX)
+                logging.warning(f"{description} failed (attempt {attempt + 1}): {e}. Retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    def _write_chunk(self, index, chunk):
+        self._with_retries(lambda: self.data_ref.update(chunk), f"Chunk {index} write")
+        if self.on_chunk_written:
+            self._with_retries(lambda: self.on_chunk_written(chunk.keys()), f"Chunk {index} ID marking")
+        return len(chunk)
+
+    # Write all records; returns counts and throughput for the run
+    def write(self, records):
+        start = time.perf_counter()
+        chunks = self.chunk(records)
+        written, written_bytes, failed_chunks, failed_keys = 0, 0, 0, []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._write_chunk, i, chunk): (chunk, size) for i, (chunk, size) in enumerate(chunks)}
+            for future in as_completed(futures):
+                chunk, size = futures[future]
+                try:
+                    written += future.result()
+                    written_bytes += size
+                except Exception as e:
+                    failed_chunks += 1
+                    failed_keys.extend(chunk.keys())
+                    logging.error(f"Chunk of {len(chunk)} records failed after {self.max_retries} attempts: {e}")
+
+        seconds = time.perf_counter() - start
+        stats = {
+            "records": len(records),
+            "written": written,
+            "bytes": written_bytes,
+            "chunks": len(chunks),
+            "failed_chunks": failed_chunks,
+            "failed_keys": failed_keys,
+            "seconds": seconds,
+            "records_per_sec": written / seconds if seconds else 0.0
+        }
+        logging.info(f"Bulk write: {written}/{len(records)} records in {len(chunks)} chunks, "
+                     f"{failed_chunks} failed, {stats['records_per_sec']:.0f} records/sec")
+        return stats
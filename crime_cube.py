@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Precomputed aggregate cube over the SafeZoneGOV crime aggregates.
+# Crimes are summed into one dense int64 array indexed by (district, category, month),
+# with districts identified by their (state, district) pair and months forming a
+# contiguous range, so slices, rollups and top-k rankings are a few NumPy reductions
+# over a small array instead of a groupby over the flat table. The cube is saved as
+# a .npy file plus JSON metadata and loaded memory-mapped; refresh() replaces whole
+# months, so new months can be merged in without rebuilding.
+
+DEFAULT_CUBE_DIR = os.path.join(".cache", "gov", "cube")
+META_FILE = "meta.json"
+DIMENSIONS = ("state", "district", "category", "month")
+
+def to_months(dates):
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[M]")
+
+def to_month(value):
+    return pd.Timestamp(value).to_datetime64().astype("datetime64[M]")
+
+def _as_list(value):
+    if value is None:
+        return None
+    return list(value) if isinstance(value, (list, tuple, set, np.ndarray)) else [value]
+
+class CrimeCube:
+    def __init__(self, values, districts, categories, start_month):
+        self.values = np.asarray(values)  # Plain ndarray view of a memmap; indexing a memmap is slow
+        self.districts = [tuple(d) for d in districts]
+        self.categories = list(categories)
+        self.start_month = to_month(start_month) if start_month is not None else None
+        self._reindex()
+
+    @classmethod
+    def from_frame(cls, df):
+        cube = cls(np.zeros((0, 0, 0), dtype=np.int64), [], [], None)
+        cube.refresh(df)
+        return cube
+
+    @property
+    def months(self):
+        if self.start_month is None:
+            return np.array([], dtype="datetime64[M]")
+        return self.start_month + np.arange(self.values.shape[2])
+
+    @property
+    def last_month(self):
+        return self.months[-1] if self.values.shape[2] else None
+
+    def _reindex(self):
+        self.states = sorted({state for state, _ in self.districts})
+        state_pos = {state: i for i, state in enumerate(self.states)}
+        self.state_of = np.array([state_pos[state] for state, _ in self.districts], dtype=np.intp)
+        self.state_matrix = np.zeros((len(self.states), len(self.districts)), dtype=np.int64)
+        self.state_matrix[self.state_of, np.arange(len(self.districts))] = 1
+        self.district_names = np.array([district for _, district in self.districts], dtype=object)
+        self.month_labels = np.array([str(m) for m in self.months], dtype=object)
+        self._district_index = pd.MultiIndex.from_tuples(self.districts, names=["state", "district"]) \
+            if self.districts else None
+        self._category_index = pd.Index(self.categories)
+
+    # Merge rows of df (state, district, category, date, crimes) into the cube.
+    # Every month present in df is replaced as a whole; other months are left untouched.
+    def refresh(self, df):
+        if df.empty:
+            return self
+        months = to_months(df["date"])
+        keys = list(zip(df["state"], df["district"]))
+        known_districts, known_categories = set(self.districts), set(self.categories)
+        districts = self.districts + [d for d in dict.fromkeys(keys) if d not in known_districts]
+        categories = self.categories + [c for c in pd.unique(df["category"]) if c not in known_categories]
+        start = min(months.min(), self.start_month) if self.start_month is not None else months.min()
+        end = max(months.max(), self.last_month) if self.start_month is not None else months.max()
+        num_months = int((end - start).astype(int)) + 1
+
+        values = np.zeros((len(districts), len(categories), num_months), dtype=np.int64)
+        if self.values.size:
+            offset = int((self.start_month - start).astype(int))
+            d, c, m = self.values.shape
+            values[:d, :c, offset:offset + m] = self.values
+        self.values, self.districts, self.categories, self.start_month = values, districts, categories, start
+        self._reindex()
+
+        d_codes = self._district_index.get_indexer(pd.MultiIndex.from_arrays([df["state"], df["district"]]))
+        c_codes = self._category_index.get_indexer(df["category"])
+        m_codes = (months - start).astype(int)
+        values[:, :, np.unique(m_codes)] = 0
+        flat = (d_codes * len(categories) + c_codes) * num_months + m_codes
+        sums = np.bincount(flat, weights=df["crimes"].to_numpy(dtype=np.float64), minlength=values.size)
+        values += np.rint(sums).astype(np.int64).reshape(values.shape)
+        logging.info(f"Crime cube refreshed with {len(df)} rows over {len(np.unique(m_codes))} months, "
+                     f"shape {values.shape}")
+        return self
+
+    def _selection(self, state=None, district=None, category=None, start=None, end=None):
+        d_sel = np.arange(len(self.districts))
+        if state is not None:
+            wanted = {self.states.index(s) for s in _as_list(state) if s in self.states}
+            d_sel = d_sel[np.isin(self.state_of[d_sel], list(wanted))]
+        if district is not None:
+            names = set(_as_list(district))
+            d_sel = np.array([i for i in d_sel if self.districts[i] in names or self.districts[i][1] in names],
+                             dtype=np.intp)
+        c_sel = np.arange(len(self.categories))
+        if category is not None:
+            c_sel = np.array([self.categories.index(c) for c in _as_list(category) if c in self.categories],
+                             dtype=np.intp)
+        first, last = 0, self.values.shape[2]
+        if start is not None and self.start_month is not None:
+            first = max(int((to_month(start) - self.start_month).astype(int)), 0)
+        if end is not None and self.start_month is not None:
+            last = min(int((to_month(end) - self.start_month).astype(int)) + 1, last)
+        return d_sel, c_sel, slice(first, max(first, last))
+
+    # Months are always a contiguous slice; districts/categories are only fancy-indexed
+    # when filtered, since basic slicing is several times faster than np.ix_
+    def _take(self, d_sel, c_sel, m_sel):
+        sub = self.values[:, :, m_sel]
+        if len(c_sel) != sub.shape[1]:
+            sub = sub[:, c_sel]
+        if len(d_sel) != sub.shape[0]:
+            sub = sub[d_sel]
+        return sub
+
+    def _slice(self, d_sel, c_sel, m_sel):
+        labels = {"district": [self.districts[i] for i in d_sel],
+                  "category": [self.categories[i] for i in c_sel],
+                  "month": self.month_labels[m_sel].tolist()}
+        return self._take(d_sel, c_sel, m_sel), labels
+
+    # Sub-cube for the filters, shape (districts, categories, months), with its labels
+    def slice(self, **filters):
+        return self._slice(*self._selection(**filters))
+
+    def total(self, **filters):
+        return int(self.slice(**filters)[0].sum())
+
+    # Sum over every dimension not in `by`; returns (array, [labels per kept dimension]),
+    # with kept dimensions always in (state/district, category, month) order
+    def rollup_array(self, by=("state",), **filters):
+        by = (by,) if isinstance(by, str) else tuple(by)
+        unknown = [dim for dim in by if dim not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions {unknown}, expected a subset of {DIMENSIONS}")
+        d_sel, c_sel, m_sel = self._selection(**filters)
+        sub = self._take(d_sel, c_sel, m_sel)
+        # Reduce the dropped dimensions first so the state fold works on the smallest array
+        if "month" not in by:
+            sub = sub.sum(axis=2, keepdims=True)
+        if "category" not in by:
+            sub = sub.sum(axis=1, keepdims=True)
+
+        labels = []
+        if "state" in by and "district" not in by:
+            folded = self.state_matrix[:, d_sel] @ sub.reshape(len(d_sel), -1)
+            sub = folded.reshape((len(self.states),) + sub.shape[1:])
+            labels.append(self.states)
+        elif "district" in by:
+            labels.append([self.districts[i] for i in d_sel] if "state" in by else self.district_names[d_sel].tolist())
+        else:
+            sub = sub.sum(axis=0, keepdims=True)
+        if "category" in by:
+            labels.append([self.categories[i] for i in c_sel])
+        if "month" in by:
+            labels.append(self.month_labels[m_sel].tolist())
+
+        kept = ["state" in by or "district" in by, "category" in by, "month" in by]
+        return sub.reshape([size for size, keep in zip(sub.shape, kept) if keep]), labels
+
+    # {label: total} for one dimension, or {(label, label, ...): total} for several
+    def rollup(self, by=("state",), **filters):
+        result, labels = self.rollup_array(by, **filters)
+        if result.ndim == 0:
+            return {(): int(result)}
+        if result.ndim == 1:
+            return dict(zip(labels[0], result.tolist()))
+        flat_labels = pd.MultiIndex.from_product(labels).tolist()
+        return dict(zip(flat_labels, result.ravel().tolist()))
+
+    # The k largest totals along one dimension, largest first (empty if the filters match nothing)
+    def top_k(self, k, by="district", **filters):
+        d_sel, c_sel, m_sel = self._selection(**filters)
+        if not len(d_sel) or not len(c_sel) or m_sel.stop <= m_sel.start:
+            return []
+        result, labels = self.rollup_array((by,), **filters)
+        k = min(k, len(result))
+        if k <= 0:
+            return []
+        top = np.argpartition(-result, k - 1)[:k]
+        top = top[np.argsort(-result[top], kind="stable")]
+        return [(labels[0][i], int(result[i])) for i in top]
+
+    def to_frame(self):
+        d, c, m = np.nonzero(self.values)
+        return pd.DataFrame({
+            "state": [self.districts[i][0] for i in d],
+            "district": [self.districts[i][1] for i in d],
+            "category": [self.categories[i] for i in c],
+            "date": (self.months[m]).astype("datetime64[ns]"),
+            "crimes": self.values[d, c, m]
+        })
+
+    # Write the array under a fresh name, then swap the metadata file that points at it
+    def save(self, directory=DEFAULT_CUBE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        values_file = f"values-{uuid.uuid4().hex[:8]}.npy"
+        np.save(os.path.join(directory, values_file), np.ascontiguousarray(self.values))
+        meta = {
+            "values_file": values_file,
+            "shape": list(self.values.shape),
+            "districts": [list(d) for d in self.districts],
+            "categories": self.categories,
+            "start_month": str(self.start_month) if self.start_month is not None else None
+        }
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as tmp:
+            json.dump(meta, tmp)
+        os.replace(tmp.name, os.path.join(directory, META_FILE))
+        for name in os.listdir(directory):
+            if name.startswith("values-") and name != values_file:
+                os.remove(os.path.join(directory, name))
+        logging.info(f"Saved crime cube {self.values.shape} to {directory}")
+
+    @classmethod
+    def load(cls, directory=DEFAULT_CUBE_DIR, mmap=True):
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        values = np.load(os.path.join(directory, meta["values_file"]), mmap_mode="r" if mmap else None)
+        return cls(values, meta["districts"], meta["categories"], meta["start_month"])
+
+# Update the stored cube from a fresh df_combined. Only months from the cube's last
+# month onwards are merged (the last one again, as it may have been partial), unless
+# rebuild is set.
+def update_cube(df_combined, directory=DEFAULT_CUBE_DIR, rebuild=False):
+    cube = None if rebuild else CrimeCube.load(directory, mmap=False)
+    if cube is None or cube.last_month is None:
+        cube = CrimeCube.from_frame(df_combined)
+    else:
+        recent = df_combined[to_months(df_combined["date"]) >= cube.last_month]
+        cube.refresh(recent)
+    cube.save(directory)
+    return cube
@@ -0,0 +1,100 @@
+import logging
+import os
+import sqlite3
+import threading
+
+# Processed-ID dedup index.
+# IDs are sharded in Firebase by their first SHARD_PREFIX_LENGTH hex characters
+# (processed_id_shards/ab/<id>), so a run only reads the shards touched by its
+# batch and only writes back the IDs it adds. A local SQLite cache mirrors every
+# shard already read, so most lookups never reach the database. Row IDs are
+# content hashes, so a stale cache can only cause an idempotent re-upload of a
+# record, never a lost one. The cache has to persist between runs (the workflow
+# keeps it with actions/cache): without it each run re-reads every touched shard,
+# which for a batch spread over most shards means most of the ID history.
+
+SHARD_PREFIX_LENGTH = 2
+SHARDED_PATH = "processed_id_shards"
+LEGACY_PATH = "processed_ids"  # Flat {id: True} tree used before sharding
+MIGRATED_MARKER = "_migrated"
+DEFAULT_CACHE_PATH = os.path.join(".cache", "processed_ids.sqlite")
+WRITE_CHUNK_SIZE = 10000  # IDs per multi-path update
+SQLITE_MAX_PARAMS = 500  # IDs per "IN (...)" lookup
+
+def shard_key(row_id):
+    return row_id[:SHARD_PREFIX_LENGTH]
+
+class ProcessedIdIndex:
+    def __init__(self, root_ref, cache_path=DEFAULT_CACHE_PATH):
+        self.root_ref = root_ref  # firebase_admin.db.Reference (or a compatible fake) for SHARDED_PATH
+        if cache_path != ":memory:" and os.path.dirname(cache_path):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS shards (shard TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.shard_reads = 0
+
+    # IDs from `ids` already present in the local cache
+    def _cached(self, ids):
+        found = set()
+        with self.lock:
+            for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+                chunk = ids[start:start + SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(f"SELECT id FROM ids WHERE id IN ({placeholders})", chunk)
+                found.update(row[0] for row in rows)
+        return found
+
+    def _remember(self, ids, shards=()):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO ids (id) VALUES (?)", ((i,) for i in ids))
+            self.conn.executemany("INSERT OR IGNORE INTO shards (shard) VALUES (?)", ((s,) for s in shards))
+
+    def _synced_shards(self):
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT shard FROM shards")}
+
+    # Return the IDs (in input order, without duplicates) that have not been processed yet
+    def filter_new(self, ids):
+        ids = list(dict.fromkeys(i for i in ids if i))
+        known = self._cached(ids)
+        missing = [i for i in ids if i not in known]
+
+        # Pull only the shards the uncached IDs fall into and that were never read before
+        unsynced = {shard_key(i) for i in missing} - self._synced_shards()
+        for shard in sorted(unsynced):
+            shard_ids = self.root_ref.child(shard).get() or {}
+            self.shard_reads += 1
+            self._remember(shard_ids.keys(), shards=[shard])
+        if unsynced:
+            known |= self._cached(missing)
+
+        new_ids = [i for i in ids if i not in known]
+        logging.info(f"Dedup: {len(ids)} IDs, {len(ids) - len(missing)} answered from cache, "
+                     f"{len(unsynced)} shards fetched, {len(new_ids)} new.")
+        return new_ids
+
+    # Record IDs as processed: multi-path update of only the new IDs, then the local cache
+    def add(self, ids):
+        ids = list(ids)
+        for start in range(0, len(ids), WRITE_CHUNK_SIZE):
+            chunk = ids[start:start + WRITE_CHUNK_SIZE]
+            self.root_ref.update({f"{shard_key(i)}/{i}": True for i in chunk})
+        self._remember(ids)
+
+    # One-time copy of the flat processed_ids tree into shards
+    def migrate_legacy(self, legacy_ref):
+        if self.root_ref.child(MIGRATED_MARKER).get():
+            return 0
+        legacy_ids = legacy_ref.get() or {}
+        logging.info(f"Migrating {len(legacy_ids)} processed IDs into shards...")
+        self.add(legacy_ids.keys())
+        self.root_ref.child(MIGRATED_MARKER).set(True)
+        # Every ID of these shards is now cached locally
+        self._remember((), shards={shard_key(i) for i in legacy_ids})
+        return len(legacy_ids)
+
+    def close(self):
+        self.conn.close()
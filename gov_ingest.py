@@ -0,0 +1,95 @@
+import logging
+import os
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from instrumentation import metrics
+from schema import gov_schema, map_categories
+from source_clients import fetch_cached
+
+# Streaming ingestion of the data.gov.my crime_district Parquet feed.
+# Only the required columns are read, the Malaysia/All aggregate rows are filtered
+# inside the Parquet scan, and record batches are aggregated one at a time, so peak
+# memory follows the aggregated output rather than the whole file. Downloads go
+# through source_clients.fetch_cached: kept locally, revalidated with ETag /
+# Last-Modified and retried with backoff over a pooled session. Batches are converted
+# to the schema.gov_schema() types on arrival (categorical state/district/category,
+# day dates, downcast counts), so the merges and groupbys run on integer codes.
+
+URL_DATA = 'https://storage.data.gov.my/publicsafety/crime_district.parquet'
+REQUIRED_COLUMNS = ['state', 'district', 'category', 'date', 'crimes']
+GROUP_COLUMNS = ['state', 'district', 'category', 'date']
+DICTIONARY_COLUMNS = ['state', 'district', 'category']  # Read as dictionaries, so batches arrive categorical
+DEFAULT_CACHE_DIR = os.path.join(".cache", "gov")
+BATCH_ROWS = 64 * 1024
+PARTIALS_BEFORE_FOLD = 8
+
+# Districts that are combined before aggregation
+DISTRICT_MERGES = {
+    'Johor Bahru Selatan': 'Johor Bahru',
+    'Johor Bahru Utara': 'Johor Bahru',
+    'Seberang Perai Selatan': 'Seberang Perai',
+    'Seberang Perai Tengah': 'Seberang Perai',
+    'Seberang Perai Utara': 'Seberang Perai',
+    'Klang Selatan': 'Klang',
+    'Klang Utara': 'Klang',
+    'Cameron Highland': 'Cameron Highlands'  # Fix district name
+}
+
+# Scan the Parquet file with column projection and the aggregate-row filters pushed down
+def iter_crime_batches(path, batch_rows=BATCH_ROWS):
+    parquet = ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=DICTIONARY_COLUMNS))
+    dataset = ds.dataset(path, format=parquet)
+    missing = [c for c in REQUIRED_COLUMNS if c not in dataset.schema.names]
+    if missing:
+        raise ValueError(f"DataFrame is missing one or more required columns: {REQUIRED_COLUMNS}")
+
+    row_filter = (pc.field('state') != 'Malaysia') & (pc.field('district') != 'All')
+    scanner = dataset.scanner(columns=REQUIRED_COLUMNS, filter=row_filter, batch_size=batch_rows)
+    batches = scanner.to_batches()
+    while True:
+        # Time only the scan and conversion, not the consumer between batches
+        with metrics.stage("parquet_read") as stage:
+            batch = next(batches, None)
+            if batch is not None:
+                stage.add(rows=batch.num_rows, nbytes=batch.nbytes)
+                df = batch.to_pandas(date_as_object=False) if batch.num_rows else None
+        if batch is None:
+            return
+        if df is not None:
+            yield df
+
+# Convert a frame of raw rows to the schema and merge districts, on the category codes
+def apply_gov_schema(df, schema):
+    df = schema.apply(df)
+    district = map_categories(df['district'], DISTRICT_MERGES, schema.dtypes['district'])
+    schema.dtypes['district'] = district.dtype
+    return df.assign(district=district)
+
+def sum_crimes(df):
+    return df.groupby(GROUP_COLUMNS, as_index=False, observed=True)['crimes'].sum()
+
+# Merge districts and sum crimes per state/district/category/date, one batch at a time
+def aggregate_crime_batches(batches, schema=None):
+    schema = schema or gov_schema()
+    partials = []
+    for df in batches:
+        with metrics.stage("groupby") as stage:
+            partials.append(sum_crimes(apply_gov_schema(df, schema)))
+            if len(partials) >= PARTIALS_BEFORE_FOLD:
+                # Fold partial sums so memory stays bounded by the aggregated size
+                partials = [sum_crimes(schema.concat(partials))]
+            stage.add(rows=len(df))
+    if not partials:
+        return pd.DataFrame(columns=REQUIRED_COLUMNS)
+    with metrics.stage("groupby"):
+        return schema.apply(sum_crimes(schema.concat(partials)))
+
+# Streaming ingestion entry point: cached download, pushed-down scan, batched aggregation
+def load_crime_district(source=URL_DATA, cache_dir=DEFAULT_CACHE_DIR, batch_rows=BATCH_ROWS):
+    path = fetch_cached(source, cache_dir)
+    df_combined = aggregate_crime_batches(iter_crime_batches(path, batch_rows))
+    logging.info(f"Aggregated {len(df_combined)} state/district/category/date rows from {path}")
+    return df_combined[REQUIRED_COLUMNS]
@@ -0,0 +1,345 @@
+import bisect
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+# Stage instrumentation for the ETL scripts.
+# Every stage (fetch, transform, dedup, enrich, upload, parquet read, groupby) runs
+# inside metrics.stage(name) or a function decorated with metrics.timed(name). Calls
+# are aggregated per stage name: call count, wall seconds, rows, bytes transferred and
+# the process peak RSS, including how much the stage raised that peak. At the end of
+# a run the totals are written as JSON, or as a Prometheus textfile (for the
+# node_exporter textfile collector) when the path ends in .prom. Recording is cheap
+# enough to stay on; byte counts that need serializing a payload are only computed
+# when a metrics path was given. profiled() wraps a run in cProfile.
+# Counter, Gauge and Histogram are minimal Prometheus metric types for long-running
+# processes (the API service); a MetricsRegistry renders them in the text format.
+
+METRIC_PREFIX = "safezone_etl"
+PROFILE_TOP_FUNCTIONS = 40
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Process peak resident set size in bytes (ru_maxrss is KiB on Linux, bytes on macOS)
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+# Size of `values` as compact JSON, i.e. roughly what goes over the wire
+def payload_bytes(values):
+    return len(json.dumps(values, separators=(",", ":"), default=str).encode("utf-8"))
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+# One sample in the Prometheus text exposition format
+def prometheus_line(name, labels, value):
+    if labels:
+        label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+# Write `text` so readers never see a partial file (the textfile collector may read at any time)
+def write_atomic(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as tmp:
+        tmp.write(text)
+    os.replace(tmp.name, path)
+
+# Base for labelled metrics: one value (or bucket array) per tuple of label values
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _labels(self, values):
+        return dict(zip(self.labelnames, values))
+
+    def samples(self):
+        with self.lock:
+            return [(self._labels(values), value) for values, value in self.series.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines += [prometheus_line(self.name, labels, value) for labels, value in self.samples()]
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.series[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+# Per-bucket counts are kept non-cumulative (one bisect and one increment per
+# observation) and summed into the cumulative `le` buckets only when rendered
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    # {labels: (cumulative counts per bucket including +Inf, sum, count)}
+    def snapshot(self):
+        with self.lock:
+            series = {values: (list(counts), total) for values, (counts, total) in self.series.items()}
+        result = {}
+        for values, (counts, total) in series.items():
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            result[values] = (cumulative, total, running)
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(float(b)) for b in self.buckets] + ["+Inf"]
+        for values, (cumulative, total, count) in self.snapshot().items():
+            labels = self._labels(values)
+            lines += [prometheus_line(f"{self.name}_bucket", {**labels, "le": bound}, bucket_count)
+                      for bound, bucket_count in zip(bounds, cumulative)]
+            lines.append(prometheus_line(f"{self.name}_sum", labels, total))
+            lines.append(prometheus_line(f"{self.name}_count", labels, count))
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+# Counters for a single stage call; the caller adds rows and bytes as they become known
+class StageRecord:
+    __slots__ = ("metrics", "rows", "bytes")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.rows = 0
+        self.bytes = 0
+
+    # `payload` is serialized to count its bytes only when metrics are being written
+    def add(self, rows=0, nbytes=0, payload=None):
+        self.rows += rows
+        self.bytes += nbytes
+        if payload is not None and self.metrics.enabled:
+            self.bytes += payload_bytes(payload)
+
+class StageMetrics:
+    def __init__(self, job, enabled=False):
+        self.job = job
+        self.enabled = enabled  # Compute byte counts that need serialization
+        self.started_at = time.time()
+        self.stages = {}
+        self.lock = threading.Lock()  # Stages also run in pipeline and uploader threads
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.started_at = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        record = StageRecord(self)
+        rss_before = peak_rss_bytes()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield record
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._record(name, record, time.perf_counter() - start, rss_before, peak_rss_bytes(), failed)
+
+    # Decorator form of stage(); `rows` maps the return value to a row count
+    def timed(self, name, rows=None):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as record:
+                    result = func(*args, **kwargs)
+                    if rows is not None:
+                        record.add(rows=rows(result))
+                    return result
+            return wrapper
+        return decorator
+
+    def _record(self, name, record, seconds, rss_before, rss_after, failed):
+        with self.lock:
+            totals = self.stages.setdefault(name, {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                                   "rows": 0, "bytes": 0, "peak_rss_bytes": None,
+                                                   "rss_growth_bytes": 0})
+            totals["calls"] += 1
+            totals["errors"] += failed
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["rows"] += record.rows
+            totals["bytes"] += record.bytes
+            if rss_after is not None:
+                totals["peak_rss_bytes"] = max(totals["peak_rss_bytes"] or 0, rss_after)
+                totals["rss_growth_bytes"] += rss_after - rss_before
+
+    def summary(self):
+        with self.lock:
+            stages = {name: dict(totals) for name, totals in self.stages.items()}
+        for totals in stages.values():
+            totals["rows_per_sec"] = totals["rows"] / totals["seconds"] if totals["seconds"] else 0.0
+        return {"job": self.job, "started_at": self.started_at, "finished_at": time.time(),
+                "duration_seconds": time.time() - self.started_at, "peak_rss_bytes": peak_rss_bytes(),
+                "stages": stages}
+
+    def to_prometheus(self, summary=None):
+        summary = summary or self.summary()
+        series = {
+            "stage_calls": ("gauge", "Calls of the stage in the last run", "calls"),
+            "stage_errors": ("gauge", "Calls of the stage that raised in the last run", "errors"),
+            "stage_seconds": ("gauge", "Wall time spent in the stage in the last run", "seconds"),
+            "stage_max_seconds": ("gauge", "Longest single call of the stage in the last run", "max_seconds"),
+            "stage_rows": ("gauge", "Rows handled by the stage in the last run", "rows"),
+            "stage_bytes": ("gauge", "Bytes transferred by the stage in the last run", "bytes"),
+            "stage_rss_growth_bytes": ("gauge", "Increase of the process peak RSS during the stage", "rss_growth_bytes"),
+        }
+        lines = []
+        for suffix, (kind, help_text, key) in series.items():
+            name = f"{METRIC_PREFIX}_{suffix}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for stage, totals in summary["stages"].items():
+                lines.append(prometheus_line(name, {"job_name": self.job, "stage": stage}, totals[key]))
+        for suffix, help_text, value in (
+                ("run_duration_seconds", "Wall time of the last run", summary["duration_seconds"]),
+                ("last_run_timestamp_seconds", "Unix time the last run finished", summary["finished_at"]),
+                ("peak_rss_bytes", "Process peak RSS of the last run", summary["peak_rss_bytes"])):
+            if value is None:
+                continue
+            name = f"{METRIC_PREFIX}_{suffix}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge",
+                      prometheus_line(name, {"job_name": self.job}, value)]
+        return "\n".join(lines) + "\n"
+
+    # JSON, or the Prometheus text format when the path ends in .prom
+    def write(self, path):
+        summary = self.summary()
+        if path.endswith(".prom"):
+            write_atomic(path, self.to_prometheus(summary))
+        else:
+            write_atomic(path, json.dumps(summary, indent=2))
+        logging.info(f"Wrote {self.job} stage metrics to {path}")
+        return summary
+
+    def log_summary(self):
+        for name, totals in self.summary()["stages"].items():
+            logging.info(f"Stage {name}: {totals['calls']} calls, {totals['seconds']:.2f}s, {totals['rows']} rows, "
+                         f"{totals['bytes']} bytes")
+
+# Shared collector: the scripts and the modules they call record into the same run
+metrics = StageMetrics(job="etl")
+
+# Profile the enclosed block with cProfile. `path` receives the binary stats (for
+# snakeviz / pstats) and `path`.txt the top functions by cumulative time.
+@contextmanager
+def profiled(path):
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        profiler.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        with open(path + ".txt", "w") as f:
+            f.write(report.getvalue())
+        logging.info(f"Wrote profile to {path} and {path}.txt")
+
+# Shared run-level wrapper for the scripts: profile if asked, then write the metrics
+@contextmanager
+def instrumented_run(job, metrics_path=None, profile_path=None):
+    metrics.job = job
+    metrics.enabled = bool(metrics_path)
+    metrics.reset()
+    try:
+        with profiled(profile_path):
+            yield metrics
+    finally:
+        metrics.log_summary()
+        if metrics_path:
+            try:
+                metrics.write(metrics_path)
+            except Exception as e:
+                logging.error(f"Failed to write metrics to {metrics_path}: {e}")
@@ -1,54 +1,378 @@
-from fastapi import FastAPI
-import pickle
-import numpy as np
-import matplotlib.pyplot as plt
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
 import io
+import json
 import base64
 
-from firebase_admin import db
+from fastapi import FastAPI, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+
 import firebase_admin
 from firebase_admin import credentials
 
+from prediction_cache import TTLCache, FirebaseValueMirror, input_key
+from micro_batcher import InvalidRow, MicroBatcher, check_row
+from plot_renderer import PlotRenderer
+from model_registry import ForecastStore, ModelRegistry
+from stats_store import SOURCES, FREQUENCIES, StatsStore, paginate
+from api_metrics import PrometheusMiddleware, STAGE_SECONDS, render_metrics, timed_predict
+
+# Initialize Firebase app if not already initialized
+def initialize_firebase():
+    if not firebase_admin._apps:
+        cred = credentials.Certificate("firebase-credentials.json")
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': "https://safezone-660a9-default-rtdb.asia-southeast1.firebasedatabase.app/"
+        })
+
+# Model registry: MODEL_DIR/CURRENT (hot-reloaded), else model.ubj / model.json / model.pkl
+registry = ModelRegistry()
+MODEL_RELOAD_SECONDS = float(os.getenv("MODEL_RELOAD_SECONDS", "10"))  # 0 disables the watcher
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN")  # Required for /model/activate; unset disables it
+startup_state = {"firebase": "pending", "model": "pending", "stats": "pending"}
+
+# Connect to Firebase and load the model after the server starts accepting connections,
+# so /healthz answers immediately and /readyz reports when predictions can be served
+async def warm_up():
+    try:
+        await run_in_threadpool(initialize_firebase)
+        startup_state["firebase"] = "ready"
+    except Exception as e:
+        startup_state["firebase"] = f"error: {e}"
+        logging.error(f"Error initializing Firebase: {e}")
+    try:
+        await run_in_threadpool(registry.load)
+        startup_state["model"] = "ready"
+    except Exception as e:
+        startup_state["model"] = f"error: {e}"
+        logging.error(f"Error loading model: {e}")
+    # Also picks up a model that appears after a failed first load
+    registry.watch(MODEL_RELOAD_SECONDS)
+    await run_in_threadpool(stats_store.refresh)
+    startup_state["stats"] = "ready" if stats_store.tables else "error: no statistics loaded"
+
+# Reload the statistics tables in the background; each refresh swaps in complete new tables
+async def refresh_stats_periodically():
+    while True:
+        await asyncio.sleep(STATS_REFRESH_SECONDS)
+        await run_in_threadpool(stats_store.refresh)
+
+@asynccontextmanager
+async def lifespan(app):
+    warm_up_task = asyncio.create_task(warm_up())
+    stats_refresh_task = asyncio.create_task(refresh_stats_periodically())
+    yield
+    warm_up_task.cancel()
+    stats_refresh_task.cancel()
+    input_mirror.stop()
+    stats_store.stop()
+    plot_renderer.shutdown()
+    registry.stop()
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_BYTES", "1000")))
+app.add_middleware(PrometheusMiddleware)  # Outermost, so latency includes compression
 
 # Root route to return a friendly message
 @app.get("/")
 def read_root():
     return {"message": "FastAPI is running on Render 🚀"}
 
-# Initialize Firebase app if not already initialized
-if not firebase_admin._apps:
-    cred = credentials.Certificate("firebase-credentials.json")
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': "https://safezone-660a9-default-rtdb.asia-southeast1.firebasedatabase.app/"
-    })
-
-# Load the model
-model = pickle.load(open("model.pkl", "rb"))
-
-# Fetch data from Firebase
-def fetch_data_from_firebase(path: str) -> list:
-    ref = db.reference(path)
-    data = ref.get()
+# Liveness: the process is up and serving requests
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness: the model is loaded and predictions can be served
+@app.get("/readyz")
+def readyz():
+    status_code = 200 if registry.ready else 503
+    return JSONResponse({"ready": registry.ready, **startup_state, "model_info": registry.stats()}, status_code=status_code)
+
+def model_not_ready():
+    return JSONResponse({"error": "Model is not loaded yet"}, status_code=503)
+
+# Prediction cache and Firebase input mirror settings (overridable through the environment)
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+INPUT_REFRESH_SECONDS = float(os.getenv("INPUT_REFRESH_SECONDS", "30"))
+
+# Batch prediction settings
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "10000"))
+STREAM_CHUNK_ROWS = 1000  # Predictions serialized per streamed chunk
+NPY_MEDIA_TYPE = "application/x-npy"
+
+# Micro-batching settings: concurrent single-row predictions are coalesced for up to
+# MICRO_BATCH_WINDOW_MS or MICRO_BATCH_MAX_ROWS rows into one model.predict call
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "1") == "1"
+MICRO_BATCH_MAX_ROWS = int(os.getenv("MICRO_BATCH_MAX_ROWS", "64"))
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", "5"))
+
+# Plot rendering: worker processes and number of cached PNGs
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", "2"))
+PLOT_CACHE_SIZE = int(os.getenv("PLOT_CACHE_SIZE", "256"))
+
+# Crime statistics: reload interval and page sizes for /stats endpoints
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", "600"))
+STATS_PAGE_SIZE = 100
+STATS_MAX_PAGE_SIZE = 1000
+
+prediction_cache = TTLCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+input_mirror = FirebaseValueMirror("input_data", refresh_interval=INPUT_REFRESH_SECONDS)
+plot_renderer = PlotRenderer(max_workers=PLOT_WORKERS, cache_size=PLOT_CACHE_SIZE)
+# Every inference goes through here, so its duration and batch size are recorded once.
+# The model is taken once per call (or given by the caller that keyed a cache entry
+# with its version), so a swap never changes the model mid-predict.
+def model_predict(matrix: np.ndarray, current=None) -> np.ndarray:
+    current = current or registry.current()
+    return timed_predict(current.predict, matrix, current.version)
+
+batcher = MicroBatcher(model_predict, max_batch_size=MICRO_BATCH_MAX_ROWS, max_wait_ms=MICRO_BATCH_WINDOW_MS)
+stats_store = StatsStore()
+forecasts = ForecastStore()
+
+# Latest input vector, served from the in-memory mirror instead of a read per request
+def current_input_data() -> list:
+    data = input_mirror.get()
     return data if isinstance(data, list) else []
 
+# Features per row the model was trained on, if it records it
+def expected_width(current):
+    return getattr(current.model, "n_features_in_", None)
+
+# Predict one row, coalesced with concurrent requests when micro-batching is on.
+# Raises InvalidRow if the row does not fit the model.
+async def predict_row(data: list, current=None) -> np.ndarray:
+    current = current or registry.current()
+    if MICRO_BATCHING:
+        return np.atleast_1d(await batcher.predict(data, current, expected_width(current)))
+    row = check_row(data, expected_width(current))
+    return await run_in_threadpool(model_predict, row[np.newaxis], current)
+
+# Predict for one input vector, reusing the cached result for identical inputs.
+# The cached result is keyed with the version of the model that computed it.
+async def cached_predict(data: list) -> np.ndarray:
+    current = registry.current()
+    check_row(data, expected_width(current))
+    key = input_key(data, current.version)
+    prediction = prediction_cache.get(key)
+    if prediction is None:
+        prediction = await predict_row(data, current)
+        prediction_cache.set(key, prediction)
+    return prediction
+
 @app.get("/predict_from_firebase")
-def predict_from_firebase():
-    data = fetch_data_from_firebase("input_data")  # Replace with your actual path in Firebase
+async def predict_from_firebase():
+    if not registry.ready:
+        return model_not_ready()
+    with STAGE_SECONDS.time("input_fetch"):
+        data = await run_in_threadpool(current_input_data)
     if not data:
         return {"error": "No data found at Firebase path"}
-    prediction = model.predict(np.array([data]))
+    try:
+        with STAGE_SECONDS.time("predict"):
+            prediction = await cached_predict(data)
+    except InvalidRow as e:
+        return JSONResponse({"error": f"Invalid input data at Firebase path: {e}"}, status_code=400)
     return {"prediction": prediction.tolist()}
 
+# Predict a single feature row sent by the client: {"features": [...]}
+@app.post("/predict")
+async def predict(request: Request):
+    if not registry.ready:
+        return model_not_ready()
+    try:
+        payload = await request.json()
+        features = payload["features"]
+    except (ValueError, TypeError, KeyError) as e:
+        return JSONResponse({"error": f"Invalid feature row: {e}"}, status_code=400)
+    current = registry.current()
+    try:
+        row = check_row(features, expected_width(current))
+    except InvalidRow as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    with STAGE_SECONDS.time("predict"):
+        prediction = await predict_row(row, current)
+    return {"prediction": prediction.tolist()}
+
+# format=json (default) returns base64 in JSON; format=png returns raw image/png with an ETag
 @app.get("/plot_from_firebase")
-def plot_from_firebase():
-    data = fetch_data_from_firebase("input_data")
+async def plot_from_firebase(request: Request, output_format: str = Query("json", alias="format")):
+    if not registry.ready:
+        return model_not_ready()
+    with STAGE_SECONDS.time("input_fetch"):
+        data = await run_in_threadpool(current_input_data)
     if not data:
         return {"error": "No data found at Firebase path"}
-    prediction = model.predict(np.array([data]))
-    plt.plot(prediction)
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    return {"image": base64.b64encode(buf.read()).decode()}
+    try:
+        with STAGE_SECONDS.time("predict"):
+            prediction = await cached_predict(data)
+    except InvalidRow as e:
+        return JSONResponse({"error": f"Invalid input data at Firebase path: {e}"}, status_code=400)
+    with STAGE_SECONDS.time("plot_render"):
+        png, etag = await plot_renderer.render(prediction)
+    if output_format == "png":
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(png, media_type="image/png", headers=headers)
+    with STAGE_SECONDS.time("png_encode"):
+        image = base64.b64encode(png).decode()
+    return {"image": image}
+
+# Parse a batch request body (JSON {"rows": [[...], ...]} or a .npy array) into a contiguous float32 matrix
+def parse_feature_matrix(body: bytes, content_type: str) -> np.ndarray:
+    if content_type.startswith(NPY_MEDIA_TYPE):
+        matrix = np.load(io.BytesIO(body), allow_pickle=False)
+    else:
+        payload = json.loads(body)
+        matrix = np.asarray(payload.get("rows") if isinstance(payload, dict) else payload, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)  # A single feature row
+    return np.ascontiguousarray(matrix, dtype=np.float32)
+
+# Stream predictions as one JSON document, serialized a chunk of rows at a time
+def stream_predictions_json(predictions: np.ndarray):
+    yield f'{{"count": {len(predictions)}, "predictions": ['
+    for start in range(0, len(predictions), STREAM_CHUNK_ROWS):
+        chunk = json.dumps(predictions[start:start + STREAM_CHUNK_ROWS].tolist())[1:-1]
+        yield chunk if start == 0 else "," + chunk
+    yield "]}"
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    if not registry.ready:
+        return model_not_ready()
+    try:
+        body = await request.body()
+        with STAGE_SECONDS.time("parse"):
+            matrix = parse_feature_matrix(body, request.headers.get("content-type", ""))
+    except (ValueError, TypeError, AttributeError) as e:
+        return JSONResponse({"error": f"Invalid feature rows: {e}"}, status_code=400)
+
+    if matrix.ndim != 2 or len(matrix) == 0:
+        return JSONResponse({"error": "Expected a non-empty 2-D array of feature rows"}, status_code=400)
+    if len(matrix) > MAX_BATCH_ROWS:
+        return JSONResponse({"error": f"Batch of {len(matrix)} rows exceeds the limit of {MAX_BATCH_ROWS}"}, status_code=413)
+    current = registry.current()
+    width = expected_width(current)
+    if width is not None and matrix.shape[1] != width:
+        return JSONResponse({"error": f"Expected {width} features per row, got {matrix.shape[1]}"}, status_code=400)
+
+    # One vectorized predict call for the whole batch, off the event loop
+    with STAGE_SECONDS.time("predict"):
+        predictions = await run_in_threadpool(model_predict, matrix, current)
+
+    if NPY_MEDIA_TYPE in request.headers.get("accept", ""):
+        with STAGE_SECONDS.time("serialize"):
+            buf = io.BytesIO()
+            np.save(buf, np.asarray(predictions, dtype=np.float32))
+        return Response(buf.getvalue(), media_type=NPY_MEDIA_TYPE)
+    return StreamingResponse(stream_predictions_json(predictions), media_type="application/json")
+
+# Precomputed next-period forecasts of the active model (written by training.py), largest first.
+# No inference per request: the table is scored offline for every district and category.
+@app.get("/forecast")
+def forecast(state: str = None, district: str = None, category: str = None,
+             offset: int = 0, limit: int = STATS_PAGE_SIZE):
+    table = forecasts.get(registry.path)
+    if table is None:
+        return JSONResponse({"error": "No forecast table for the active model; run training.py"}, status_code=503)
+    mask = np.ones(len(table), dtype=bool)
+    for column, value in (("state", state), ("district", district), ("category", category)):
+        if value is not None:
+            mask &= (table[column].str.lower() == value.lower()).to_numpy()
+    page = paginate(table[mask], *page_bounds(offset, limit))
+    page["items"] = page["items"].to_dict("records")  # Only the requested rows are converted
+    period = str(table["period"].iloc[0]) if len(table) else None
+    return {"model_version": registry.version, "period": period, **page}
+
+# Active and resident model versions with their inference latency
+@app.get("/model/versions")
+def model_versions():
+    return registry.stats()
+
+# Roll back (or forward) to a resident version: POST /model/activate?version=...
+# with "Authorization: Bearer $MODEL_ADMIN_TOKEN"
+@app.post("/model/activate")
+def model_activate(request: Request, version: str):
+    if not MODEL_ADMIN_TOKEN:
+        return JSONResponse({"error": "Model activation is disabled (MODEL_ADMIN_TOKEN is not set)"}, status_code=403)
+    if request.headers.get("authorization") != f"Bearer {MODEL_ADMIN_TOKEN}":
+        return JSONResponse({"error": "Invalid admin token"}, status_code=401)
+    try:
+        registry.activate(version)
+    except KeyError as e:
+        return JSONResponse({"error": str(e.args[0])}, status_code=404)
+    return registry.stats()
+
+# Prometheus metrics: request latency per route, handler stages, in-flight requests,
+# inference time and batch sizes
+@app.get("/metrics")
+def metrics():
+    text, content_type = render_metrics()
+    return Response(text, media_type=content_type)
+
+# Cache hit/miss counters, input mirror status and micro-batching counters
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "model_version": registry.version,
+        "predictions": prediction_cache.stats(),
+        "input_data": input_mirror.stats(),
+        "micro_batching": dict(batcher.stats(), enabled=MICRO_BATCHING)
+    }
+
+# Look up the statistics table for a request, or an error response
+def stats_table(source: str):
+    if source not in SOURCES:
+        return None, JSONResponse({"error": f"source must be one of {SOURCES}"}, status_code=400)
+    table = stats_store.table(source)
+    if table is None:
+        return None, JSONResponse({"error": f"{source} statistics are not loaded yet"}, status_code=503)
+    return table, None
+
+def page_bounds(offset: int, limit: int):
+    return max(offset, 0), min(max(limit, 1), STATS_MAX_PAGE_SIZE)
+
+# Crimes per state/district, largest first.
+# source=gov: data.gov.my aggregates from zgov.py; source=reports: crime_data records.
+@app.get("/stats/district")
+def stats_district(source: str = "gov", state: str = None, district: str = None, category: str = None,
+                   start: str = None, end: str = None, offset: int = 0, limit: int = STATS_PAGE_SIZE):
+    table, error = stats_table(source)
+    if error:
+        return error
+    try:
+        rows = table.by_district(state=state, district=district, category=category, start=start, end=end)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid filter: {e}"}, status_code=400)
+    items = [{"state": s, "district": d, "crimes": c} for s, d, c in rows]
+    return {"source": source, **paginate(items, *page_bounds(offset, limit))}
+
+# Crimes per month or year, oldest first
+@app.get("/stats/trend")
+def stats_trend(source: str = "gov", state: str = None, district: str = None, category: str = None,
+                start: str = None, end: str = None, freq: str = "month", offset: int = 0, limit: int = STATS_PAGE_SIZE):
+    table, error = stats_table(source)
+    if error:
+        return error
+    if freq not in FREQUENCIES:
+        return JSONResponse({"error": f"freq must be one of {FREQUENCIES}"}, status_code=400)
+    try:
+        rows = table.trend(freq=freq, state=state, district=district, category=category, start=start, end=end)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid filter: {e}"}, status_code=400)
+    items = [{"period": p, "crimes": c} for p, c in rows]
+    return {"source": source, "freq": freq, **paginate(items, *page_bounds(offset, limit))}
+
+# Rows, load time and last error per statistics source
+@app.get("/stats/status")
+def stats_status():
+    return stats_store.stats()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+import numpy as np
+
+# Request coalescer in front of a vectorized predict function.
+# Concurrent single-row predictions are queued; a worker task collects up to
+# `max_batch_size` rows or waits at most `max_wait_ms` after the first one,
+# runs one predict call in a worker thread and resolves each caller's future
+# with its own row of the result. A caller may name the model for its row; rows
+# for different models are predicted separately, with predict_fn(matrix, model).
+# Rows are checked on submit (one dimension, `width` features if given), so a bad
+# row fails only its own request; rows of different widths never share a matrix.
+
+# Raised to the caller of a row that cannot be predicted (not numeric, wrong shape)
+class InvalidRow(ValueError):
+    pass
+
+def check_row(row, width=None):
+    try:
+        row = np.asarray(row, dtype=np.float32)
+    except (ValueError, TypeError) as e:
+        raise InvalidRow(f"Invalid feature row: {e}") from e
+    if row.ndim != 1 or (width is not None and len(row) != width):
+        raise InvalidRow(f"Expected a single row of {width} features, got shape {row.shape}")
+    return row
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.loop = None
+        self.queue = None
+        self.worker = None
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    # Bind the queue and worker to the running event loop (again, if the loop changed)
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.worker is None or self.worker.done():
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+
+    async def predict(self, row, model=None, width=None):
+        row = check_row(row, width)
+        self._ensure_started()
+        future = self.loop.create_future()
+        await self.queue.put((row, model, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            groups = {}
+            for row, model, future in await self._collect():
+                groups.setdefault((model, len(row)), []).append((row, future))
+            for (model, _), group in groups.items():
+                await self._predict(group, model)
+
+    async def _predict(self, group, model):
+        futures = [future for _, future in group]
+        try:
+            matrix = np.ascontiguousarray(np.stack([row for row, _ in group]))
+            args = (matrix,) if model is None else (matrix, model)
+            predictions = await self.loop.run_in_executor(None, self.predict_fn, *args)
+        except Exception as e:
+            logging.error(f"Micro-batch of {len(group)} rows failed: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(group)
+        self.largest_batch = max(self.largest_batch, len(group))
+        for future, prediction in zip(futures, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch
+        }
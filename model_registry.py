@@ -0,0 +1,307 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Model registry for the prediction service.
+# Prefers XGBoost's native UBJ/JSON booster formats, which load without unpickling
+# arbitrary objects and without the cross-version pickle warnings, and falls back
+# to model.pkl. xgboost itself is only imported when a model is actually loaded.
+#
+# Hot reload: the model to serve is named by the CURRENT pointer file in MODEL_DIR
+# (or is the newest model file there; without MODEL_DIR, the first of
+# MODEL_CANDIDATES). A watcher thread polls for a changed file, loads the new
+# version in the background, warms it with a canned batch and then swaps it in with
+# a single assignment: requests that already took the old version finish on it,
+# new requests get the new one. The last `keep_versions` versions stay resident, so
+# activate() can roll back instantly. Each version counts its own inference latency.
+
+MODEL_CANDIDATES = ("model.ubj", "model.json", "model.pkl")
+MODEL_EXTENSIONS = (".ubj", ".json", ".pkl")
+MODEL_DIR = os.getenv("MODEL_DIR", "models")
+POINTER_FILE = "CURRENT"  # Holds the file name (relative to MODEL_DIR) of the version to serve
+KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "3"))
+WARMUP_ROWS = 8
+FORECAST_SUFFIX = ".forecast.csv"
+
+def load_model_file(path):
+    if path.endswith((".ubj", ".json")):
+        from xgboost import XGBRegressor
+
+        model = XGBRegressor()
+        model.load_model(path)
+        return model
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def file_version(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+# Cheap change detection for the watcher; the file is only hashed when this changes
+def file_signature(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+# Convert a pickled XGBoost model to the native format given by the output extension
+def export_native(pickle_path, output_path):
+    with open(pickle_path, "rb") as f:
+        model = pickle.load(f)
+    model.save_model(output_path)
+    logging.info(f"Exported {pickle_path} to {output_path}")
+
+# Point MODEL_DIR/CURRENT at `file_name` atomically, so the watcher never reads a partial name
+def set_current(model_dir, file_name):
+    pointer = os.path.join(model_dir, POINTER_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(file_name)
+    os.replace(pointer + ".tmp", pointer)
+
+# One loaded model version and its inference counters
+class ModelVersion:
+    def __init__(self, model, version, path=None, load_seconds=None):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.calls = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def n_features(self):
+        return getattr(self.model, "n_features_in_", None)
+
+    def predict(self, matrix):
+        start = time.perf_counter()
+        predictions = self.model.predict(matrix)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.calls += 1
+            self.rows += len(matrix)
+            self.seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        return predictions
+
+    def stats(self):
+        with self.lock:
+            return {"version": self.version, "path": self.path, "load_seconds": self.load_seconds,
+                    "loaded_at": self.loaded_at, "calls": self.calls, "rows": self.rows,
+                    "mean_ms": self.seconds / self.calls * 1000.0 if self.calls else 0.0,
+                    "max_ms": self.max_seconds * 1000.0}
+
+class ModelRegistry:
+    def __init__(self, candidates=MODEL_CANDIDATES, model_dir=MODEL_DIR, keep_versions=KEEP_VERSIONS,
+                 warmup_rows=WARMUP_ROWS):
+        self.candidates = candidates
+        self.model_dir = model_dir
+        self.keep_versions = max(keep_versions, 1)
+        self.warmup_rows = warmup_rows
+        self.active = None  # The ModelVersion serving new requests; replaced, never mutated
+        self.resident = OrderedDict()  # version -> ModelVersion, least recently active first
+        self.signature = None
+        self.failed_signature = None
+        self.error = None
+        self.swaps = 0
+        self.last_check = None
+        self.lock = threading.Lock()  # Serializes loads and swaps; request handlers only read self.active
+        self.stop_event = threading.Event()
+        self.watcher = None
+
+    @property
+    def ready(self):
+        return self.active is not None
+
+    @property
+    def model(self):
+        active = self.active
+        return active.model if active else None
+
+    @property
+    def version(self):
+        active = self.active
+        return active.version if active else None
+
+    @property
+    def path(self):
+        active = self.active
+        return active.path if active else None
+
+    # The version to use for one request; keep the returned object for the whole request
+    def current(self):
+        return self.active
+
+    # Path of the model to serve: MODEL_DIR/CURRENT, else the newest model file in
+    # MODEL_DIR, else the first existing candidate
+    def resolve(self):
+        pointer = os.path.join(self.model_dir, POINTER_FILE)
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                name = f.read().strip()
+            path = os.path.join(self.model_dir, name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{pointer} points to missing model file {path}")
+            return path
+        if os.path.isdir(self.model_dir):
+            files = [os.path.join(self.model_dir, name) for name in os.listdir(self.model_dir)
+                     if name.endswith(MODEL_EXTENSIONS)]
+            if files:
+                return max(files, key=os.path.getmtime)
+        return next((p for p in self.candidates if os.path.exists(p)), None)
+
+    # Run a canned batch through a new version before it takes traffic: the first
+    # predict pays one-time setup costs, and a model that cannot predict is rejected
+    def _warm_up(self, entry):
+        if entry.n_features is None or not self.warmup_rows:
+            return
+        batch = np.zeros((self.warmup_rows, entry.n_features), dtype=np.float32)
+        predictions = np.asarray(entry.model.predict(batch))
+        if len(predictions) != len(batch):
+            raise ValueError(f"warm-up returned {len(predictions)} predictions for {len(batch)} rows")
+
+    def _activate(self, entry):
+        previous = self.active
+        self.resident[entry.version] = entry
+        self.resident.move_to_end(entry.version)
+        self.active = entry  # The swap: one reference assignment
+        while len(self.resident) > self.keep_versions:
+            self.resident.popitem(last=False)
+        if previous is not None and previous is not entry:
+            self.swaps += 1
+            logging.info(f"Swapped model {previous.version} -> {entry.version}")
+
+    # Load the model `resolve()` names, unless it is already active. A version that is
+    # still resident is swapped back in without reloading. Returns the active model.
+    def load(self):
+        with self.lock:
+            self.last_check = time.time()
+            path = signature = None
+            try:
+                path = self.resolve()
+                if path is None:
+                    raise FileNotFoundError(f"No model file found (looked in {self.model_dir} and for "
+                                            f"{', '.join(self.candidates)})")
+                signature = file_signature(path)
+                if signature == self.signature and self.active is not None:
+                    return self.active.model
+                if signature == self.failed_signature:
+                    raise ValueError(self.error)  # Same broken file as last time; wait for a new one
+                version = file_version(path)
+                entry = self.resident.get(version)
+                if entry is None:
+                    start = time.perf_counter()
+                    entry = ModelVersion(load_model_file(path), version, path)
+                    self._warm_up(entry)
+                    entry.load_seconds = time.perf_counter() - start
+                    logging.info(f"Loaded model {path} (version {version}) in {entry.load_seconds:.2f}s")
+            except Exception as e:
+                if signature is None or signature != self.failed_signature:
+                    self.error = f"Failed to load {path or 'model'}: {e}"
+                    self.failed_signature = signature
+                raise
+            self.signature = signature
+            self.failed_signature = None
+            self.error = None
+            self._activate(entry)
+            return entry.model
+
+    # Serve an in-memory model (e.g. one just trained) as `version`
+    def install(self, model, version, path=None):
+        entry = ModelVersion(model, version, path)
+        self._warm_up(entry)
+        with self.lock:
+            self._activate(entry)
+        return entry
+
+    # Roll back (or forward) to a resident version; it stays active until the model file changes
+    def activate(self, version):
+        with self.lock:
+            entry = self.resident.get(version)
+            if entry is None:
+                raise KeyError(f"Model version {version} is not resident")
+            self._activate(entry)
+        return entry
+
+    # One watcher poll: reload if the served file changed; a failed load keeps the current model
+    def check_for_update(self):
+        previous, failed = self.active, self.failed_signature
+        try:
+            self.load()
+        except Exception as e:
+            if self.failed_signature is None or self.failed_signature != failed:
+                logging.error(f"Model reload failed, keeping version {self.version}: {e}")
+        return self.active is not previous
+
+    def watch(self, interval):
+        if self.watcher is not None or interval <= 0:
+            return
+        self.stop_event.clear()
+
+        def poll():
+            while not self.stop_event.wait(interval):
+                self.check_for_update()
+
+        self.watcher = threading.Thread(target=poll, name="model-watcher", daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.watcher is not None:
+            self.watcher.join(timeout=5)
+            self.watcher = None
+
+    def stats(self):
+        active = self.active
+        return {"ready": active is not None, "path": active.path if active else None,
+                "version": active.version if active else None,
+                "load_seconds": active.load_seconds if active else None, "error": self.error,
+                "model_dir": self.model_dir, "swaps": self.swaps, "last_check": self.last_check,
+                "watching": self.watcher is not None,
+                "resident": [entry.stats() for entry in reversed(self.resident.values())]}
+
+def forecast_path(model_path):
+    return os.path.splitext(model_path)[0] + FORECAST_SUFFIX
+
+# Forecast table of the model being served (written by training.py next to the model
+# file), reloaded when the model or the file changes; pandas is imported on first use
+class ForecastStore:
+    def __init__(self):
+        self.signature = None
+        self.table = None
+        self.lock = threading.Lock()
+
+    def get(self, model_path):
+        if not model_path:
+            return None
+        path = forecast_path(model_path)
+        try:
+            signature = file_signature(path)
+        except FileNotFoundError:
+            return None
+        if signature != self.signature:
+            with self.lock:
+                if signature != self.signature:
+                    import pandas as pd
+
+                    table = pd.read_csv(path, dtype={"period": str})
+                    table = table.sort_values("forecast", ascending=False, kind="stable").reset_index(drop=True)
+                    self.table, self.signature = table, signature
+        return self.table
+
+# Usage: python model_registry.py model.pkl model.ubj
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    export_native(sys.argv[1] if len(sys.argv) > 1 else "model.pkl",
+                  sys.argv[2] if len(sys.argv) > 2 else "model.ubj")
@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Parallel enrichment pipeline for preprocess_and_upload.
+# New rows are partitioned into fixed-size chunks that are enriched (text cleaning,
+# category and location lookup) in a process pool. Three stages run at once: a
+# source thread produces chunks into a bounded queue, the main thread keeps a
+# bounded window of chunks in the pool and hands results on strictly in input
+# order, and a sink thread uploads them from a second bounded queue. The bounds
+# keep memory flat and let fetch and upload overlap with compute.
+
+CHUNK_ROWS = 20_000
+QUEUE_CHUNKS = 4  # Chunks buffered between stages
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+_DONE = object()
+
+# Runs once in every worker: importing preprocess_and_upload compiles the location
+# trie regex and lookup tables, and one small call warms the regex caches
+def init_worker():
+    logging.getLogger().setLevel(logging.ERROR)
+    from preprocess_and_upload import enrich_dataframe
+
+    enrich_dataframe(pd.DataFrame({"Main Topic": ["curi"], "Tweet Text": ["curi di shah alam"]}))
+
+def enrich_chunk(chunk):
+    from preprocess_and_upload import enrich_dataframe
+
+    return enrich_dataframe(chunk)
+
+# Upper bound on chunks between the source and the end of the sink at any moment:
+# both queues, the pool window, the chunk being uploaded and the one being produced
+def chunks_in_flight(workers, queue_chunks=QUEUE_CHUNKS):
+    return 2 * queue_chunks + 2 * workers + 2
+
+def partition(df, chunk_rows=CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def create_pool(workers=DEFAULT_WORKERS):
+    # spawn: workers start clean instead of inheriting the stage threads, and build
+    # their tables once in init_worker
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_worker)
+
+# Put items from `items` onto `out` until exhausted, then a sentinel. An exception
+# is passed through the queue so the consumer can re-raise it.
+def _produce(items, out, stop):
+    try:
+        for item in items:
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    except Exception as e:
+        out.put(e)
+        return
+    out.put(_DONE)
+
+def _consume(inbox, handle, errors):
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            return
+        if errors:
+            continue  # Drain after a failure so the producer never blocks
+        try:
+            handle(item)
+        except Exception as e:
+            errors.append(e)
+
+# Run source -> process pool -> sink with bounded queues between the stages.
+# `process` is a picklable function applied to every chunk in a worker; `sink` is
+# called in the sink thread with each result, in the order the chunks were produced.
+# Returns the number of chunks processed.
+def run_pipeline(source, process, sink, workers=DEFAULT_WORKERS, queue_chunks=QUEUE_CHUNKS, pool=None):
+    fetched = queue.Queue(maxsize=queue_chunks)
+    processed = queue.Queue(maxsize=queue_chunks)
+    stop = threading.Event()
+    sink_errors = []
+    source_thread = threading.Thread(target=_produce, args=(source, fetched, stop), name="pipeline-source", daemon=True)
+    sink_thread = threading.Thread(target=_consume, args=(processed, sink, sink_errors), name="pipeline-sink", daemon=True)
+
+    own_pool = pool is None
+    pool = pool or create_pool(workers)
+    in_flight = deque()
+    chunks = 0
+    source_thread.start()
+    sink_thread.start()
+    try:
+        source_done = False
+        while not source_done or in_flight:
+            # Keep up to 2x workers chunks in the pool so no worker idles between chunks
+            while not source_done and len(in_flight) < 2 * workers:
+                item = fetched.get()
+                if item is _DONE:
+                    source_done = True
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    in_flight.append(pool.submit(process, item))
+            if in_flight:
+                processed.put(in_flight.popleft().result())
+                chunks += 1
+            if sink_errors:
+                raise sink_errors[0]
+    except BaseException:
+        stop.set()
+        for future in in_flight:
+            future.cancel()
+        raise
+    finally:
+        processed.put(_DONE)
+        sink_thread.join()
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+    if sink_errors:
+        raise sink_errors[0]
+    return chunks
+
+# Enrich a whole DataFrame in parallel and return it in the original row order
+def parallel_enrich(df, workers=DEFAULT_WORKERS, chunk_rows=CHUNK_ROWS, pool=None):
+    parts = []
+    run_pipeline(partition(df, chunk_rows), enrich_chunk, parts.append, workers=workers, pool=pool)
+    return pd.concat(parts) if parts else df.copy()
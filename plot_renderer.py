@@ -0,0 +1,57 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from prediction_cache import TTLCache
+
+# Render a line plot of `values` to PNG bytes. Each call builds its own Agg Figure
+# (no global pyplot state), so nothing accumulates between renders and concurrent
+# renders cannot interfere. matplotlib is only imported inside the worker process.
+def render_png(values, width=6.4, height=4.8, dpi=100):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(np.asarray(values))
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+def plot_key(values):
+    return hashlib.sha256(np.ascontiguousarray(values, dtype=np.float64).tobytes()).hexdigest()
+
+# Renders plots in a process pool off the event loop and caches PNG bytes by a hash
+# of the plotted values. The hash doubles as the HTTP ETag.
+class PlotRenderer:
+    def __init__(self, max_workers=2, cache_size=256, cache_ttl=3600.0):
+        self.max_workers = max_workers
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.pool = None
+
+    def _pool(self):
+        if self.pool is None:
+            # spawn: workers must not inherit the server's threads and open sockets
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    # Return (png_bytes, etag) for the values, rendering only on a cache miss
+    async def render(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        key = plot_key(values)
+        png = self.cache.get(key)
+        if png is None:
+            png = await asyncio.get_running_loop().run_in_executor(self._pool(), render_png, values)
+            self.cache.set(key, png)
+        return png, f'"{key[:32]}"'
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from firebase_admin import db
+
+# TTL + LRU cache for model outputs, keyed by a hash of the input vector and the model version
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+def input_key(vector, model_version):
+    data = np.ascontiguousarray(vector, dtype=np.float64).tobytes()
+    return hashlib.sha256(model_version.encode("utf-8") + data).hexdigest()
+
+# Keeps the latest value of a Firebase path in memory so request handlers never block
+# on a network read. Uses a realtime listener; if that cannot be opened, polls every
+# `refresh_interval` seconds instead. Started lazily by the first get().
+class FirebaseValueMirror:
+    def __init__(self, path, refresh_interval=30.0, use_listener=True):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.use_listener = use_listener
+        self.value = None
+        self.updated_at = None
+        self.mode = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.registration = None
+
+    def _store(self, value):
+        self.value = value
+        self.updated_at = time.time()
+
+    def refresh(self):
+        self._store(db.reference(self.path).get())
+
+    def _on_event(self, event):
+        if event.path == "/":
+            self._store(event.data)
+        else:
+            # Partial update below the path: re-read the whole value
+            self.refresh()
+
+    def _poll(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Error refreshing Firebase path {self.path}: {e}")
+
+    def start(self):
+        with self.lock:
+            if self.mode:
+                return
+            self.refresh()
+            if self.use_listener:
+                try:
+                    self.registration = db.reference(self.path).listen(self._on_event)
+                    self.mode = "listener"
+                    return
+                except Exception as e:
+                    logging.warning(f"Firebase listener for {self.path} unavailable, polling instead: {e}")
+            threading.Thread(target=self._poll, name=f"mirror-{self.path}", daemon=True).start()
+            self.mode = "polling"
+
+    def stop(self):
+        self.stop_event.set()
+        if self.registration:
+            self.registration.close()
+
+    def get(self):
+        if not self.mode:
+            self.start()
+        return self.value
+
+    def stats(self):
+        return {"path": self.path, "mode": self.mode, "updated_at": self.updated_at}
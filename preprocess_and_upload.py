@@ -2,251 +2,77 @@ import firebase_admin
 from firebase_admin import credentials, db
 import pandas as pd
 import hashlib
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
 import logging
 import re
-from googleapiclient.errors import HttpError  # Import HttpError
-import time  # Import time for retry delay
-
-# Malaysian states, districts, and special cases
-MALAYSIAN_STATES = [
-    "johor", "kedah", "kelantan", "melaka", "negeri sembilan", "pahang",
-    "perak", "perlis", "pulau pinang", "sabah", "sarawak", "selangor",
-    "terengganu", "w.p. kuala lumpur"
-]
-
-MALAYSIAN_DISTRICTS = [
-    "batu pahat", "iskandar puteri", "johor bahru selatan", "johor bahru utara", "kluang",
-    "kota tinggi", "kulaijaya", "ledang", "mersing", "muar", "nusajaya", "pontian", "segamat", "seri alam",  # Johor
-    "baling", "bandar bharu", "kota setar", "kuala muda", "kubang pasu", "kulim",
-    "langkawi", "padang terap", "pendang", "sik", "yan",  # Kedah
-    "bachok", "gua musang", "jeli", "kota bharu", "kuala krai", "machang", "pasir mas",
-    "pasir puteh", "tanah merah", "tumpat",  # Kelantan
-    "alor gajah", "jasin", "melaka tengah",  # Melaka
-    "jelebu", "jempol", "kuala pilah", "nilai", "port dickson", "rembau", "seremban", "tampin",  # Negeri Sembilan
-    "bentong", "bera", "cameron highlands", "jerantut", "kuala lipis", "kuantan",
-    "maran", "pekan", "raub", "rompin", "temerloh",  # Pahang
-    "batu gajah", "gerik", "hilir perak", "ipoh", "kampar", "kerian", "kuala kangsar",
-    "manjung", "pengkalan hulu", "perak tengah", "selama", "sungai siput", "taiping",
-    "tanjong malim", "tapah",  # Perak
-    "arau", "kangar", "padang besar",  # Perlis
-    "barat daya","seberang perai", "timur laut",  # Pulau Pinang
-    "beaufort", "beluran", "keningau", "kota belud", "kota kinabalu", "kinabatangan",
-    "kota marudu", "kudat", "kunak", "lahad datu", "papar", "penampang", "ranau",
-    "sandakan", "semporna", "sipitang", "tawau", "tenom", "tuaran",  # Sabah
-    "bau", "belaga", "betong", "bintulu", "dalat", "julau", "kanowit", "kapit",
-    "kota samarahan", "kuching", "lawas", "limbang", "lubok antu", "lundu", "marudi",
-    "matu daro", "meradong", "miri", "mukah", "padawan", "saratok", "sarikei",
-    "serian", "sibu", "simunjan", "song", "sri aman", "tatau",  # Sarawak
-    "ampang jaya", "gombak", "hulu selangor", "kajang", "klang", "kuala langat", 
-    "kuala selangor", "petaling jaya", "sabak bernam", "sepang",
-    "serdang", "sg. buloh", "shah alam", "subang jaya",  # Selangor
-    "besut", "dungun", "hulu terengganu", "kemaman", "kuala terengganu", "marang", "setiu",  # Terengganu
-    "brickfields", "cheras", "dang wangi", "sentul", "wangsa maju", "w.p. putrajaya"  # W.P. Kuala Lumpur
-]
-
-# Dictionary for abbreviations
-ABBREVIATIONS = {
-    "putrajaya": "w.p. putrajaya",
-    "sg buloh": "sg. buloh",
-    "sungai buloh": "sg. buloh",
-    "kl": "w.p. kuala lumpur",
-    "kuala lumpur": "w.p. kuala lumpur",
-    "n9": "negeri sembilan",
-    "tg malim": "tanjong malim",
-    "tanjung malim": "tanjong malim",
-    "cameron highland": "cameron highlands"
-}
-
-DISTRICT_TO_STATE = {
-    # Johor
-    "batu pahat": "johor",
-    "iskandar puteri": "johor",
-    "johor bahru selatan": "johor",
-    "johor bahru utara": "johor",
-    "kluang": "johor",
-    "kota tinggi": "johor",
-    "kulaijaya": "johor",
-    "ledang": "johor",
-    "mersing": "johor",
-    "muar": "johor",
-    "nusajaya": "johor",
-    "pontian": "johor",
-    "segamat": "johor",
-    "seri alam": "johor",
-
-    # Kedah
-    "baling": "kedah",
-    "bandar bharu": "kedah",
-    "kota setar": "kedah",
-    "kuala muda": "kedah",
-    "kubang pasu": "kedah",
-    "kulim": "kedah",
-    "langkawi": "kedah",
-    "padang terap": "kedah",
-    "pendang": "kedah",
-    "sik": "kedah",
-    "yan": "kedah",
-
-    # Kelantan
-    "bachok": "kelantan",
-    "gua musang": "kelantan",
-    "jeli": "kelantan",
-    "kota bharu": "kelantan",
-    "kuala krai": "kelantan",
-    "machang": "kelantan",
-    "pasir mas": "kelantan",
-    "pasir puteh": "kelantan",
-    "tanah merah": "kelantan",
-    "tumpat": "kelantan",
-
-    # Melaka
-    "alor gajah": "melaka",
-    "jasin": "melaka",
-    "melaka tengah": "melaka",
-
-    # Negeri Sembilan
-    "jelebu": "negeri sembilan",
-    "jempol": "negeri sembilan",
-    "kuala pilah": "negeri sembilan",
-    "nilai": "negeri sembilan",
-    "port dickson": "negeri sembilan",
-    "rembau": "negeri sembilan",
-    "seremban": "negeri sembilan",
-    "tampin": "negeri sembilan",
-
-    # Pahang
-    "bentong": "pahang",
-    "bera": "pahang",
-    "cameron highland": "pahang",
-    "jerantut": "pahang",
-    "kuala lipis": "pahang",
-    "kuantan": "pahang",
-    "maran": "pahang",
-    "pekan": "pahang",
-    "raub": "pahang",
-    "rompin": "pahang",
-    "temerloh": "pahang",
-
-    # Perak
-    "batu gajah": "perak",
-    "gerik": "perak",
-    "hilir perak": "perak",
-    "ipoh": "perak",
-    "kampar": "perak",
-    "kerian": "perak",
-    "kuala kangsar": "perak",
-    "manjung": "perak",
-    "pengkalan hulu": "perak",
-    "perak tengah": "perak",
-    "selama": "perak",
-    "sungai siput": "perak",
-    "taiping": "perak",
-    "tanjong malim": "perak",
-    "tapah": "perak",
-
-    # Perlis
-    "arau": "perlis",
-    "kangar": "perlis",
-    "padang besar": "perlis",
-
-    # Pulau Pinang
-    "barat daya": "pulau pinang",
-    "seberang perai selatan": "pulau pinang",
-    "seberang perai tengah": "pulau pinang",
-    "seberang perai utara": "pulau pinang",
-    "timur laut": "pulau pinang",
-
-    # Sabah
-    "beaufort": "sabah",
-    "beluran": "sabah",
-    "keningau": "sabah",
-    "kota belud": "sabah",
-    "kota kinabalu": "sabah",
-    "kinabatangan": "sabah",
-    "kota marudu": "sabah",
-    "kudat": "sabah",
-    "kunak": "sabah",
-    "lahad datu": "sabah",
-    "papar": "sabah",
-    "penampang": "sabah",
-    "ranau": "sabah",
-    "sandakan": "sabah",
-    "semporna": "sabah",
-    "sipitang": "sabah",
-    "tawau": "sabah",
-    "tenom": "sabah",
-    "tuaran": "sabah",
-
-    # Sarawak
-    "bau": "sarawak",
-    "belaga": "sarawak",
-    "betong": "sarawak",
-    "bintulu": "sarawak",
-    "dalat": "sarawak",
-    "julau": "sarawak",
-    "kanowit": "sarawak",
-    "kapit": "sarawak",
-    "kota samarahan": "sarawak",
-    "kuching": "sarawak",
-    "lawas": "sarawak",
-    "limbang": "sarawak",
-    "lubok antu": "sarawak",
-    "lundu": "sarawak",
-    "marudi": "sarawak",
-    "matu daro": "sarawak",
-    "meradong": "sarawak",
-    "miri": "sarawak",
-    "mukah": "sarawak",
-    "padawan": "sarawak",
-    "saratok": "sarawak",
-    "sarikei": "sarawak",
-    "serian": "sarawak",
-    "sibu": "sarawak",
-    "simunjan": "sarawak",
-    "song": "sarawak",
-    "sri aman": "sarawak",
-    "tatau": "sarawak",
-
-    # Selangor
-    "ampang jaya": "selangor",
-    "gombak": "selangor",
-    "hulu selangor": "selangor",
-    "kajang": "selangor",
-    "klang selatan": "selangor",
-    "klang utara": "selangor",
-    "kuala langat": "selangor",
-    "kuala selangor": "selangor",
-    "petaling jaya": "selangor",
-    "sabak bernam": "selangor",
-    "sepang": "selangor",
-    "serdang": "selangor",
-    "sg. buloh": "selangor",
-    "shah alam": "selangor",
-    "subang jaya": "selangor",
-
-    # Terengganu
-    "besut": "terengganu",
-    "dungun": "terengganu",
-    "hulu terengganu": "terengganu",
-    "kemaman": "terengganu",
-    "kuala terengganu": "terengganu",
-    "marang": "terengganu",
-    "setiu": "terengganu",
-
-    # W.P. Kuala Lumpur
-    "brickfields": "w.p. kuala lumpur",
-    "cheras": "w.p. kuala lumpur",
-    "dang wangi": "w.p. kuala lumpur",
-    "sentul": "w.p. kuala lumpur",
-    "wangsa maju": "w.p. kuala lumpur",
-    "w.p. putrajaya": "w.p. kuala lumpur"
-}
+import argparse
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dedup_index import ProcessedIdIndex, SHARDED_PATH, LEGACY_PATH
+from bulk_writer import FirebaseBulkWriter
+from pipeline import chunks_in_flight, enrich_chunk, partition, run_pipeline
+from instrumentation import metrics, instrumented_run
+from source_clients import FETCH_WORKERS, fetch_sheet_ranges, sheets_client
+from schema import (ABBREVIATIONS, DISTRICT_DTYPE, DISTRICT_TO_STATE, MALAYSIAN_DISTRICTS, MALAYSIAN_STATES,
+                    STATE_DTYPE, UNKNOWN, categorical, map_categories, report_schema, to_categorical)
 
 # Combine all locations into a single list for easier lookup
 MALAYSIAN_LOCATIONS = MALAYSIAN_STATES + MALAYSIAN_DISTRICTS
 
+# Map every known name (state, district or abbreviation) to its (state, district) result
+def build_location_index():
+    index = {}
+    for state in MALAYSIAN_STATES:
+        index[state] = (state, "Unknown")
+    for district in MALAYSIAN_DISTRICTS + list(DISTRICT_TO_STATE):
+        if district in DISTRICT_TO_STATE:
+            index[district] = (DISTRICT_TO_STATE[district], district)
+    for abbrev, full_form in ABBREVIATIONS.items():
+        if full_form in index:
+            index[abbrev] = index[full_form]
+    return index
+
+# Render a word-level trie of names as one regex. Longer continuations are tried
+# first, so at any position the longest name wins ("johor bahru selatan" over "johor").
+def _trie_regex(node):
+    branches = []
+    for token in sorted((t for t in node if t), key=len, reverse=True):
+        child = node[token]
+        tail = _trie_regex(child)
+        if tail is None:
+            branches.append(re.escape(token))
+        elif "" in child:
+            branches.append(f"{re.escape(token)}(?:\\s+{tail})?")
+        else:
+            branches.append(f"{re.escape(token)}\\s+{tail}")
+    if not branches:
+        return None
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+def build_location_pattern(names):
+    trie = {}
+    for name in names:
+        node = trie
+        for token in name.split():
+            node = node.setdefault(token, {})
+        node[""] = True
+    return re.compile(f"(?<!\\w){_trie_regex(trie)}(?!\\w)")
+
+# A location is only taken from the phrase after a cue word ("di shah alam", "kat kl"),
+# as the original matcher did, so everyday words that are also district names
+# ("selama", "bau", "pekan", "nilai") elsewhere in the tweet are not mistaken for it.
+# The phrase runs up to the next punctuation; its leftmost (longest) name is captured.
+LOCATION_CUE = r"(?:di|kat)\s+"
+
+def build_location_capture(pattern):
+    return re.compile(f"{LOCATION_CUE}[\\w.\\s]*?({pattern.pattern})")
+
+# Built once at import and shared by every call to extract_location
+LOCATION_INDEX = build_location_index()
+LOCATION_PATTERN = build_location_pattern(LOCATION_INDEX)
+LOCATION_CAPTURE = build_location_capture(LOCATION_PATTERN)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -262,77 +88,243 @@ def initialize_firebase():
 
 # Google Sheets API Setup
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+GOOGLE_CREDENTIALS_FILE = "google-credentials.json"
 SHEET_ID = "1CNo8eLCASEfd7ktOgiUrzT8KBkAWhW5sPON1BITBKvM"
-RANGE_NAME = "SafeZone!A:H"
-
-# Fetch data from Google Sheets
-def fetch_google_sheets():
-    creds = service_account.Credentials.from_service_account_file("google-credentials.json", scopes=SCOPES)
-    service = build("sheets", "v4", credentials=creds)
-    sheet = service.spreadsheets()
+SHEET_NAME = "SafeZone"
+RANGE_NAME = f"{SHEET_NAME}!A:H"
+
+# Incremental fetch settings
+PAGE_SIZE = 5000  # Rows requested per page when reading past the cursor
+TAIL_CHECK_ROWS = 50  # Rows above the cursor covered by the tail checksum
+CURSOR_PATH = "sheet_cursor"  # Firebase path holding the high-water mark
+
+# Load / save the high-water mark of the last processed sheet row
+def load_sheet_cursor():
+    return db.reference(CURSOR_PATH).get()
+
+def save_sheet_cursor(cursor):
+    db.reference(CURSOR_PATH).set(cursor)
+
+# Checksum of the header plus the rows just above the cursor, used to detect edits or deletions
+def sheet_tail_checksum(header, tail_rows):
+    payload = json.dumps([header] + tail_rows, ensure_ascii=False).encode("utf-8")
+    return hashlib.md5(payload).hexdigest()
+
+# Build the cursor for a sheet whose data rows (below the header) are `rows`
+def build_sheet_cursor(header, rows):
+    tail_rows = rows[-TAIL_CHECK_ROWS:]
+    return {
+        "last_row": len(rows) + 1,  # Sheet row number of the last data row (row 1 is the header)
+        "tail_rows": len(tail_rows),
+        "tail_checksum": sheet_tail_checksum(header, tail_rows)
+    }
+
+# Read the whole SafeZone!A:H range
+def fetch_sheet_rows_full(sheet):
+    result = sheet.values().get(spreadsheetId=SHEET_ID, range=RANGE_NAME).execute()
+    values = result.get("values", [])
+    if not values:
+        return [], [], None
+    return values[0], values[1:], build_sheet_cursor(values[0], values[1:])
+
+# Read the header and the rows just above the cursor in one batchGet and compare them
+# with the cursor's checksum. Returns (header, tail_rows), or None if they changed.
+def check_sheet_cursor(sheet, cursor):
+    last_row = cursor["last_row"]
+    tail_start = last_row - cursor["tail_rows"] + 1
+    ranges = [f"{SHEET_NAME}!A1:H1"]
+    if cursor["tail_rows"]:
+        ranges.append(f"{SHEET_NAME}!A{tail_start}:H{last_row}")
+    result = sheet.values().batchGet(spreadsheetId=SHEET_ID, ranges=ranges).execute()
+    value_ranges = [r.get("values", []) for r in result.get("valueRanges", [])]
+    header = value_ranges[0][0] if value_ranges and value_ranges[0] else []
+    tail_rows = value_ranges[1] if len(value_ranges) > 1 else []
+
+    if sheet_tail_checksum(header, tail_rows) != cursor["tail_checksum"]:
+        logging.warning(f"Rows at or above sheet row {last_row} changed since the last run, running a full scan.")
+        return None
+    return header, tail_rows
+
+def page_range(start, page_size):
+    return f"{SHEET_NAME}!A{start}:H{start + page_size - 1}"
+
+# Read only the rows after the cursor, in fixed-size pages. Falls back to a full
+# scan when there is no cursor or the header/tail no longer match its checksum.
+def fetch_sheet_rows_incremental(sheet, cursor):
+    if not cursor:
+        logging.info("No sheet cursor stored, running a full scan.")
+        return fetch_sheet_rows_full(sheet)
+
+    checked = check_sheet_cursor(sheet, cursor)
+    if checked is None:
+        return fetch_sheet_rows_full(sheet)
+    header, tail_rows = checked
+    last_row = cursor["last_row"]
+
+    # Pages are read concurrently, in windows that double while pages come back full
+    # (1, 2, 4, ... up to FETCH_WORKERS), so a small increment still costs one request
+    rows = []
+    start = last_row + 1
+    window = 1
+    done = False
+    while not done:
+        starts = range(start, start + window * PAGE_SIZE, PAGE_SIZE)
+        pages = fetch_sheet_ranges(sheet, SHEET_ID, [page_range(s, PAGE_SIZE) for s in starts])
+        for page in pages:
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                done = True
+                break
+        start += window * PAGE_SIZE
+        window = min(window * 2, FETCH_WORKERS)
+
+    new_tail = (tail_rows + rows)[-TAIL_CHECK_ROWS:]
+    new_cursor = {
+        "last_row": last_row + len(rows),
+        "tail_rows": len(new_tail),
+        "tail_checksum": sheet_tail_checksum(header, new_tail)
+    }
+    logging.info(f"Incremental fetch read {len(rows)} rows after sheet row {last_row}.")
+    return header, rows, new_cursor
+
+# Stream the sheet as pages of at most `page_size` raw rows, holding only one page at a
+# time. Incremental mode starts after a still-valid cursor, otherwise every data row is
+# read. `header` is set before the first page, `cursor` once the last page was read.
+# The next page is requested while the consumer works on the current one, so at most
+# two pages are held. Failed requests are retried by the sheet client.
+class SheetPageReader:
+    def __init__(self, sheet, mode="incremental", cursor=None, page_size=PAGE_SIZE):
+        self.sheet = sheet
+        self.mode = mode
+        self.start_cursor = cursor
+        self.page_size = page_size
+        self.header = []
+        self.cursor = None
+        self.rows_read = 0
+
+    def _get(self, range_name, data_rows=True):
+        with metrics.stage("fetch") as stage:
+            values = self.sheet.values().get(spreadsheetId=SHEET_ID, range=range_name).execute().get("values", [])
+            stage.add(rows=len(values) if data_rows else 0, payload=values)
+        return values
+
+    def __iter__(self):
+        checked = None
+        if self.mode == "incremental" and self.start_cursor:
+            with metrics.stage("fetch"):
+                checked = check_sheet_cursor(self.sheet, self.start_cursor)
+        if checked is not None:
+            self.header, tail_rows = checked
+            last_row = self.start_cursor["last_row"]
+        else:
+            header_rows = self._get(f"{SHEET_NAME}!A1:H1", data_rows=False)
+            self.header, tail_rows, last_row = (header_rows[0] if header_rows else []), [], 1
+        if not self.header:
+            logging.warning("No data found in Google Sheets.")
+            return
 
-    retries = 3  # Number of retry attempts
-    for attempt in range(retries):
-        try:
-            result = sheet.values().get(spreadsheetId=SHEET_ID, range=RANGE_NAME).execute()
-            values = result.get("values", [])
-
-            if not values:
-                logging.warning("No data found in Google Sheets.")
-                return pd.DataFrame()
-
-            # Convert to DataFrame and select only the required columns
-            df = pd.DataFrame(values[1:], columns=values[0])
-            df = df[["Date (GMT)", "Main Topic", "Tweet Text"]]  # Select only the required columns
-
-            # Modify Date Format (Remove Time)
-            df["Date (GMT)"] = pd.to_datetime(df["Date (GMT)"]).dt.date
-
-            # Log unique values in the "Main Topic" column before mapping
-            logging.info(f"Unique 'Main Topic' values before mapping: {df['Main Topic'].unique()}")
-
-            # Lowercase the "Main Topic" column before mapping
-            df["Main Topic"] = df["Main Topic"].str.lower()
-
-            # Malay Crime Terms Mapping
-            crime_mapping = {
-                "curi": "theft", "pencuri": "theft", "pencurian": "theft",
-                "rogol": "rape", "perogol": "rape", "merogol": "rape",
-                "rompak": "robbery", "merompak": "robbery", "rompakan": "robbery",
-                "bunuh": "murder", "membunuh": "murder", "pembunuhan": "murder", "terbunuh": "murder"
-            }
-            df["Main Topic"] = df["Main Topic"].replace(crime_mapping)
-
-            # Log unique values in the "Main Topic" column after mapping
-            logging.info(f"Unique 'Main Topic' values after mapping: {df['Main Topic'].unique()}")
-
-            logging.info(f"Fetched {len(df)} rows from Google Sheets.")
-            logging.info(f"Columns in DataFrame: {df.columns.tolist()}")  # Log column names
-            logging.info(f"First row of data: {df.iloc[0].to_dict()}")  # Log first row of data
-            return df
-
-        except HttpError as e:
-            logging.error(f"Error fetching data from Google Sheets (attempt {attempt + 1}): {e}")
-            if attempt < retries - 1:
-                time.sleep(5)  # Wait before retrying
-            else:
-                logging.error("All retry attempts failed. Returning empty DataFrame.")
-                return pd.DataFrame()  # Return empty DataFrame if all retries fail
-        except Exception as e:
-            logging.error(f"Unexpected error fetching data from Google Sheets (attempt {attempt + 1}): {e}")
-            if attempt < retries - 1:
-                time.sleep(5)  # Wait before retrying
+        tail = deque(tail_rows, maxlen=TAIL_CHECK_ROWS)
+        start = last_row + 1
+        with ThreadPoolExecutor(max_workers=1) as prefetch:
+            pending = prefetch.submit(self._get, page_range(start, self.page_size))
+            while True:
+                page = pending.result()
+                full = len(page) == self.page_size
+                if full:
+                    start += self.page_size
+                    pending = prefetch.submit(self._get, page_range(start, self.page_size))
+                if page:
+                    tail.extend(page)
+                    last_row += len(page)
+                    self.rows_read += len(page)
+                    yield page
+                if not full:
+                    break
+
+        self.cursor = {
+            "last_row": last_row,
+            "tail_rows": len(tail),
+            "tail_checksum": sheet_tail_checksum(self.header, list(tail))
+        }
+        logging.info(f"Streamed {self.rows_read} rows from Google Sheets, up to sheet row {last_row}.")
+
+# Convert raw sheet values to the DataFrame used by the rest of the pipeline
+@metrics.timed("transform", rows=len)
+def sheet_values_to_dataframe(header, rows):
+    # Convert to DataFrame and select only the required columns
+    df = pd.DataFrame(rows, columns=header)
+    df = df[["Date (GMT)", "Main Topic", "Tweet Text"]]  # Select only the required columns
+
+    # Day dates and categorical topics (see schema.py)
+    df = report_schema().apply(df)
+    topics = df["Main Topic"]
+
+    # Log unique values in the "Main Topic" column before mapping
+    logging.info(f"Unique 'Main Topic' values before mapping: {topics.cat.categories.tolist()}")
+
+    # Malay Crime Terms Mapping
+    crime_mapping = {
+        "curi": "theft", "pencuri": "theft", "pencurian": "theft",
+        "rogol": "rape", "perogol": "rape", "merogol": "rape",
+        "rompak": "robbery", "merompak": "robbery", "rompakan": "robbery",
+        "bunuh": "murder", "membunuh": "murder", "pembunuhan": "murder", "terbunuh": "murder"
+    }
+
+    # Lowercase and map each distinct topic once; rows keep their codes
+    df["Main Topic"] = map_categories(topics, lambda topic: crime_mapping.get(topic.lower(), topic.lower()))
+
+    # Log unique values in the "Main Topic" column after mapping
+    logging.info(f"Unique 'Main Topic' values after mapping: {df['Main Topic'].cat.categories.tolist()}")
+    return df
+
+# The Sheets client is shared by the whole process (cached credentials and token,
+# pooled keep-alive connections) and retries each request with jittered backoff.
+def open_sheet():
+    return sheets_client(GOOGLE_CREDENTIALS_FILE, SCOPES)
+
+# Fetch data from Google Sheets.
+# mode="full" re-reads SafeZone!A:H; mode="incremental" reads only rows after `cursor`.
+# The cursor to persist once the rows are processed is returned in df.attrs["sheet_cursor"].
+def fetch_google_sheets(mode="full", cursor=None):
+    try:
+        sheet = open_sheet()
+        with metrics.stage("fetch") as stage:
+            if mode == "incremental":
+                header, rows, new_cursor = fetch_sheet_rows_incremental(sheet, cursor)
             else:
-                logging.error("All retry attempts failed. Returning empty DataFrame.")
-                return pd.DataFrame()  # Return empty DataFrame if all retries fail
-                
+                header, rows, new_cursor = fetch_sheet_rows_full(sheet)
+            stage.add(rows=len(rows), payload=rows)
+    except Exception as e:
+        logging.error(f"Error fetching data from Google Sheets, returning empty DataFrame: {e}")
+        return pd.DataFrame()
+
+    if not header:
+        logging.warning("No data found in Google Sheets.")
+        return pd.DataFrame()
+    if not rows:
+        logging.info("No new rows in Google Sheets.")
+        return pd.DataFrame()
+
+    df = sheet_values_to_dataframe(header, rows)
+    df.attrs["sheet_cursor"] = new_cursor
+
+    logging.info(f"Fetched {len(df)} rows from Google Sheets ({mode} mode).")
+    logging.info(f"Columns in DataFrame: {df.columns.tolist()}")  # Log column names
+    logging.info(f"First row of data: {df.iloc[0].to_dict()}")  # Log first row of data
+    return df
+
+# Text cleaning patterns, compiled once for preprocess_text and enrich_dataframe
+URL_PATTERN = re.compile(r"http\S+|www\S+|https\S+", flags=re.MULTILINE)
+NON_WORD_PATTERN = re.compile(r"\W")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
 # Preprocess text (clean and normalize)
 def preprocess_text(text):
     try:
         # Remove special characters, URLs, and extra spaces
-        text = re.sub(r"http\S+|www\S+|https\S+", "", text, flags=re.MULTILINE)  # Remove URLs
-        text = re.sub(r"\W", " ", text)  # Remove special characters
-        text = re.sub(r"\s+", " ", text).strip()  # Remove extra spaces
+        text = URL_PATTERN.sub("", text)  # Remove URLs
+        text = NON_WORD_PATTERN.sub(" ", text)  # Remove special characters
+        text = WHITESPACE_PATTERN.sub(" ", text).strip()  # Remove extra spaces
         return text
     except Exception as e:
         logging.error(f"Error preprocessing text: {e}")
@@ -347,28 +339,50 @@ def generate_row_id(row):
         logging.error(f"Error generating row ID: {e}")
         return None
 
+# Row IDs for a whole DataFrame, computed once as a column.
+# "md5" reproduces generate_row_id exactly, so IDs already stored in Firebase keep
+# matching; "fast" hashes the same key with a 128-bit BLAKE2b digest and is meant
+# for a fresh processed-ID index (its IDs differ from the MD5 ones).
+ROW_ID_COLUMN = "Row ID"
+ROW_ID_MODES = ("md5", "fast")
+ROW_ID_MODE = os.getenv("ROW_ID_MODE", "md5")
+
+# Dates as generate_row_id formats them (datetime.date -> YYYY-MM-DD)
+def format_row_dates(dates):
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.strftime("%Y-%m-%d").fillna("NaT")
+    return dates.map(str)
+
+def compute_row_ids(df, mode=ROW_ID_MODE):
+    if mode not in ROW_ID_MODES:
+        raise ValueError(f"Unknown row ID mode {mode!r}, expected one of {ROW_ID_MODES}")
+    keys = [f"{date}-{text}".encode("utf-8") for date, text in zip(format_row_dates(df["Date (GMT)"]), df["Tweet Text"])]
+    if mode == "md5":
+        row_ids = [hashlib.md5(key).hexdigest() for key in keys]
+    else:
+        row_ids = [hashlib.blake2b(key, digest_size=16).hexdigest() for key in keys]
+    return pd.Series(row_ids, index=df.index, dtype=object)
+
+# Rows whose IDs are not processed yet (first copy of each), with their IDs in ROW_ID_COLUMN.
+# IDs in `exclude` (sets of IDs still being uploaded) are treated as processed.
+def select_new_rows(df, dedup, mode=ROW_ID_MODE, exclude=()):
+    with metrics.stage("dedup") as stage:
+        row_ids = compute_row_ids(df, mode)
+        keep = row_ids.isin(dedup.filter_new(row_ids.tolist())) & ~row_ids.duplicated()
+        for ids in exclude:
+            keep &= ~row_ids.isin(ids)
+        stage.add(rows=len(df))
+        return df[keep].assign(**{ROW_ID_COLUMN: row_ids[keep]})
+
 # Extract State and District from Text
 def extract_location(text):
     try:
-        #Normalize the text by replacing abbreviations
-        text_lower = text.lower()
-        for abbrev, full_form in ABBREVIATIONS.items():
-            text_lower = text_lower.replace(abbrev, full_form)
-
-        # Use regex to detect common location phrases (e.g., "di shah alam")
-        match = re.search(r"(di|kat|di dalam|di kawasan)\s+([\w\.\s]+)", text_lower)
+        # Single pass over the text; abbreviations are part of the pattern
+        match = LOCATION_CAPTURE.search(text.lower())
         if match:
-            possible_location = match.group(2).strip()
-            for loc in MALAYSIAN_LOCATIONS:
-                if loc.lower() in possible_location.lower():
-                    # Check if the location is a district
-                    if loc.lower() in DISTRICT_TO_STATE:
-                        state = DISTRICT_TO_STATE[loc.lower()]
-                        return state, loc  # Return state and district
-                    else:
-                        return loc, "Unknown"  # Return location as state, district as Unknown
-                        
-        #If regex fails, return "Unknown" for both state and district
+            return LOCATION_INDEX[" ".join(match.group(1).split())]
+
+        #If no known location is mentioned, return "Unknown" for both state and district
         logging.warning(f"No location found in text: {text}")
         return "Unknown", "Unknown"  # Default case
 
@@ -377,85 +391,235 @@ def extract_location(text):
         return "Unknown", "Unknown"
 
 # Map Malay crime terms to Type and Category
+TOPIC_TO_CATEGORY_TYPE = {
+    "stealing": ("property", "theft"),
+    "rape": ("assault", "rape"),
+    "robbery": ("property", "robbery")
+}
+DEFAULT_CATEGORY_TYPE = ("Other", "Unknown")  # Default for unknown terms
+
 def map_malay_to_type_and_category(topic):
     topic = topic.lower().strip()  # Ensure case insensitivity and remove extra spaces
-    if topic in ["stealing"]:
-        return "property", "theft"
-    elif topic in ["rape"]:
-        return "assault", "rape"
-    elif topic in ["robbery"]:
-        return "property", "robbery"
-    else:
-        return "Other", "Unknown"  # Default for unknown terms
-
-# Process and Upload Data
-def process_and_upload():
+    return TOPIC_TO_CATEGORY_TYPE.get(topic, DEFAULT_CATEGORY_TYPE)
+
+# Batch enrichment stage: the same columns as preprocess_text, map_malay_to_type_and_category
+# and extract_location, computed column-wise over the whole DataFrame
+LOCATION_TO_STATE = {name: state for name, (state, _) in LOCATION_INDEX.items()}
+LOCATION_TO_DISTRICT = {name: district for name, (_, district) in LOCATION_INDEX.items()}
+TOPIC_TO_CATEGORY = {topic: category for topic, (category, _) in TOPIC_TO_CATEGORY_TYPE.items()}
+TOPIC_TO_TYPE = {topic: crime_type for topic, (_, crime_type) in TOPIC_TO_CATEGORY_TYPE.items()}
+CATEGORY_DTYPE = categorical(list(TOPIC_TO_CATEGORY.values()) + [DEFAULT_CATEGORY_TYPE[0]])
+TYPE_DTYPE = categorical(list(TOPIC_TO_TYPE.values()) + [DEFAULT_CATEGORY_TYPE[1]])
+
+def normalize_topic(topic):
+    return topic.lower().strip() if isinstance(topic, str) else topic
+
+def normalize_location(name):
+    return " ".join(name.split())
+
+@metrics.timed("enrich", rows=len)
+def enrich_dataframe(df):
+    enriched = df.copy()
+    text = enriched["Tweet Text"]
+
+    # Clean text with vectorized regex replacements
+    enriched["Cleaned Text"] = (
+        text.str.replace(URL_PATTERN, "", regex=True)
+        .str.replace(NON_WORD_PATTERN, " ", regex=True)
+        .str.replace(WHITESPACE_PATTERN, " ", regex=True)
+        .str.strip()
+    )
+
+    # Topic -> (Category, Type) through dictionary lookups, once per distinct topic
+    topics = to_categorical(enriched["Main Topic"])
+    enriched["Category"] = map_categories(topics, lambda topic: TOPIC_TO_CATEGORY.get(normalize_topic(topic)),
+                                          CATEGORY_DTYPE, DEFAULT_CATEGORY_TYPE[0])
+    enriched["Type"] = map_categories(topics, lambda topic: TOPIC_TO_TYPE.get(normalize_topic(topic)),
+                                      TYPE_DTYPE, DEFAULT_CATEGORY_TYPE[1])
+
+    # Resolve locations with one extract over the column, then look up each distinct match
+    locations = to_categorical(text.str.lower().str.extract(LOCATION_CAPTURE, expand=False))
+    enriched["State"] = map_categories(locations, lambda name: LOCATION_TO_STATE.get(normalize_location(name)),
+                                       STATE_DTYPE, UNKNOWN)
+    enriched["District"] = map_categories(locations, lambda name: LOCATION_TO_DISTRICT.get(normalize_location(name)),
+                                          DISTRICT_DTYPE, UNKNOWN)
+
+    missing = int(locations.isna().sum())
+    if missing:
+        logging.warning(f"No location found in {missing} of {len(enriched)} tweets.")
+    return enriched
+
+# Firebase crime_data records for enriched rows, keyed by row ID
+def build_crime_batch(df, mode=ROW_ID_MODE):
+    row_ids = df[ROW_ID_COLUMN] if ROW_ID_COLUMN in df else compute_row_ids(df, mode)
+    dates = format_row_dates(df["Date (GMT)"])  # ISO date strings
+    return {
+        row_id: {
+            "state": state,
+            "district": district,
+            "category": category,  # "Assault" or "Property"
+            "type": crime_type,  # Malay term (e.g., "pencuri", "rogol")
+            "date": date
+        }
+        for row_id, state, district, category, crime_type, date
+        in zip(row_ids, df["State"], df["District"], df["Category"], df["Type"], dates)
+    }
+
+# Upload enriched rows to crime_data; IDs are marked processed chunk by chunk
+def upload_crime_batch(writer, df):
+    with metrics.stage("firebase_upload") as stage:
+        stats = writer.write(build_crime_batch(df))
+        stage.add(rows=stats["written"], nbytes=stats["bytes"])
+    return stats
+
+# Process and Upload Data.
+# workers > 1 enriches chunks in a process pool, overlapped with the upload (see pipeline.py).
+def process_and_upload(fetch_mode="incremental", workers=1, row_id_mode=ROW_ID_MODE):
     try:
         logging.info("Starting data processing and upload...")
         
         # Fetch data from Google Sheets
-        df = fetch_google_sheets()
+        cursor = load_sheet_cursor() if fetch_mode == "incremental" else None
+        df = fetch_google_sheets(mode=fetch_mode, cursor=cursor)
         if df.empty:
             logging.info("No data to process.")
             return
+        new_cursor = df.attrs.get("sheet_cursor")
 
-        # Get already processed IDs from Firebase
-        processed_ref = db.reference("processed_ids")
-        processed_ids = processed_ref.get() or {}
+        # Look up already processed IDs in the sharded dedup index
+        dedup = ProcessedIdIndex(db.reference(SHARDED_PATH))
+        dedup.migrate_legacy(db.reference(LEGACY_PATH))
 
-        # Filter new rows
-        new_rows = []
-        for _, row in df.iterrows():
-            row_id = generate_row_id(row)
-            if row_id and row_id not in processed_ids:
-                new_rows.append(row)
+        # Filter new rows (IDs are computed once and kept in ROW_ID_COLUMN for the upload)
+        new_df = select_new_rows(df, dedup, row_id_mode)
 
-        if not new_rows:
+        if new_df.empty:
             logging.info("No new data to process.")
+            if new_cursor:
+                save_sheet_cursor(new_cursor)
             return
             
         # Process new rows
-        new_df = pd.DataFrame(new_rows)
         test_location = extract_location(new_df["Tweet Text"].iloc[0])
         print(f"Extracted Location Example: {test_location}")  # Should be a tuple (State, District)
-        new_df["Cleaned Text"] = new_df["Tweet Text"].apply(preprocess_text)
-        new_df[["Category", "Type"]] = new_df["Main Topic"].apply(lambda x: pd.Series(map_malay_to_type_and_category(x)))
-        new_df[["State", "District"]] = new_df["Tweet Text"].apply(lambda x: extract_location(x)).apply(pd.Series)
 
-        # Log the processed DataFrame
-        logging.info(f"Processed DataFrame columns: {new_df.columns.tolist()}")
-        logging.info(f"Processed DataFrame first row: {new_df.iloc[0].to_dict()}")
+        # Chunked concurrent upload; each chunk's IDs are marked processed once it is stored
+        writer = FirebaseBulkWriter(db.reference("crime_data"), on_chunk_written=dedup.add)
+        if workers > 1:
+            # Enrich chunks in a process pool while already enriched chunks are uploaded
+            stats = {"written": 0, "failed_chunks": 0}
+
+            def upload_chunk(enriched):
+                chunk_stats = upload_crime_batch(writer, enriched)
+                stats["written"] += chunk_stats["written"]
+                stats["failed_chunks"] += chunk_stats["failed_chunks"]
+
+            with metrics.stage("pipeline") as stage:
+                run_pipeline(partition(new_df), enrich_chunk, upload_chunk, workers=workers)
+                stage.add(rows=len(new_df))
+        else:
+            new_df = enrich_dataframe(new_df)
+
+            # Log the processed DataFrame
+            logging.info(f"Processed DataFrame columns: {new_df.columns.tolist()}")
+            logging.info(f"Processed DataFrame first row: {new_df.iloc[0].to_dict()}")
+            stats = upload_crime_batch(writer, new_df)
+
+        logging.info(f"Added {stats['written']} new records to Firebase!")
+        if stats["failed_chunks"]:
+            logging.error(f"{stats['failed_chunks']} chunks failed; their rows will be retried on the next run.")
+            return
 
-        # Upload data to Firebase
-        crime_ref = db.reference("crime_data")
-        batch = {}
-        
-        for _, row in new_df.iterrows():
-            row_id = generate_row_id(row)
-            if row_id:
-                # Convert date to string
-                date_str = row["Date (GMT)"].isoformat()  # Convert date to ISO format string
-                crime_data = {
-                    "state": row["State"],
-                    "district": row["District"],
-                    "category": row["Category"],  # "Assault" or "Property"
-                    "type": row["Type"],  # Malay term (e.g., "pencuri", "rogol")
-                    "date": date_str  # Use the string representation of the date
-                }
-                batch[row_id] = crime_data
-                processed_ids[row_id] = True  # Mark as processed
-
-        # Atomic update to Firebase
-        crime_ref.update(batch)
-        processed_ref.update(processed_ids)
-        logging.info(f"Added {len(new_df)} new records to Firebase!")
+        # Advance the sheet cursor only after the rows are safely stored
+        if new_cursor:
+            save_sheet_cursor(new_cursor)
     except Exception as e:
         logging.error(f"Error in process_and_upload: {e}")
         
-# Main execution
-if __name__ == "__main__":
+# Streaming stages: every stage takes and yields chunks of at most one sheet page, so
+# memory stays bounded by the page size rather than by the size of the backlog
+def frames_from_pages(reader):
+    for page in reader:
+        yield sheet_values_to_dataframe(reader.header, page)
+
+# Drop rows already processed. IDs of uploaded chunks reach the dedup cache, so repeats
+# across chunks are caught without a growing `seen` set; only the IDs of the last
+# `recent_chunks` chunks, which may still be on their way to the upload, are kept.
+def dedupe_frames(frames, dedup, recent_chunks=1, mode=ROW_ID_MODE):
+    recent = deque(maxlen=recent_chunks)
+    for df in frames:
+        new_df = select_new_rows(df, dedup, mode, exclude=recent)
+        recent.append(set(new_df[ROW_ID_COLUMN]))
+        if not new_df.empty:
+            yield new_df
+
+def enrich_frames(frames):
+    for df in frames:
+        yield enrich_dataframe(df)
+
+# Streaming ETL: fetch pages -> dedupe -> enrich -> upload, one page-sized chunk at a time.
+# workers > 1 enriches in the process pool, with the stages still joined by bounded queues.
+def stream_and_upload(fetch_mode="incremental", workers=1, row_id_mode=ROW_ID_MODE):
     try:
-        initialize_firebase()
-        process_and_upload()
+        logging.info("Starting streaming data processing and upload...")
+        cursor = load_sheet_cursor() if fetch_mode == "incremental" else None
+        reader = SheetPageReader(open_sheet(), mode=fetch_mode, cursor=cursor)
+
+        dedup = ProcessedIdIndex(db.reference(SHARDED_PATH))
+        dedup.migrate_legacy(db.reference(LEGACY_PATH))
+        writer = FirebaseBulkWriter(db.reference("crime_data"), on_chunk_written=dedup.add)
+        totals = {"chunks": 0, "written": 0, "failed_chunks": 0}
+
+        def upload(enriched):
+            stats = upload_crime_batch(writer, enriched)
+            totals["chunks"] += 1
+            totals["written"] += stats["written"]
+            totals["failed_chunks"] += stats["failed_chunks"]
+
+        if workers > 1:
+            new_frames = dedupe_frames(frames_from_pages(reader), dedup, recent_chunks=chunks_in_flight(workers),
+                                       mode=row_id_mode)
+            with metrics.stage("pipeline"):
+                run_pipeline(new_frames, enrich_chunk, upload, workers=workers)
+        else:
+            new_frames = dedupe_frames(frames_from_pages(reader), dedup, mode=row_id_mode)
+            for enriched in enrich_frames(new_frames):
+                upload(enriched)
+
+        logging.info(f"Added {totals['written']} new records to Firebase from {reader.rows_read} sheet rows "
+                     f"in {totals['chunks']} chunks!")
+        if totals["failed_chunks"]:
+            logging.error(f"{totals['failed_chunks']} chunks failed; their rows will be retried on the next run.")
+            return
+
+        # Advance the sheet cursor only after the rows are safely stored
+        if reader.cursor:
+            save_sheet_cursor(reader.cursor)
     except Exception as e:
-        logging.error(f"Script failed: {e}")
+        logging.error(f"Error in stream_and_upload: {e}")
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process SafeZone tweets and upload them to Firebase.")
+    parser.add_argument("--fetch-mode", choices=["incremental", "full"], default="incremental",
+                        help="'incremental' reads only rows after the stored sheet cursor; 'full' re-reads the whole sheet.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for text cleaning and enrichment; 1 enriches in this process.")
+    parser.add_argument("--row-id-mode", choices=ROW_ID_MODES, default=ROW_ID_MODE,
+                        help="'md5' keeps the existing row IDs; 'fast' uses BLAKE2b IDs (needs a fresh processed-ID index).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Fetch, dedupe, enrich and upload one sheet page at a time to bound memory.")
+    parser.add_argument("--metrics", default=os.getenv("METRICS_PATH"),
+                        help="Write per-stage timings here: JSON, or a Prometheus textfile if the path ends in .prom.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile the run with cProfile; stats go to PATH and a text summary to PATH.txt.")
+    args = parser.parse_args()
+    with instrumented_run("preprocess_and_upload", metrics_path=args.metrics, profile_path=args.profile):
+        try:
+            initialize_firebase()
+            if args.stream:
+                stream_and_upload(fetch_mode=args.fetch_mode, workers=args.workers, row_id_mode=args.row_id_mode)
+            else:
+                process_and_upload(fetch_mode=args.fetch_mode, workers=args.workers, row_id_mode=args.row_id_mode)
+        except Exception as e:
+            logging.error(f"Script failed: {e}")
@@ -0,0 +1,348 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# Canonical column types for the ETL DataFrames.
+# Low-cardinality text columns (state, district, category, type, topic) are pandas
+# Categoricals: one small integer code per row plus a single copy of each label, so
+# frames take a fraction of the memory and groupby, joins and lookups work on the
+# codes. State and district categories are the fixed vocabularies below (title-cased
+# for the data.gov.my feeds); other columns take the labels they see. A label outside
+# the vocabulary is added rather than lost, and categories are kept sorted, so sorting
+# or grouping by codes gives the same order as sorting the strings. Dates are
+# day-precision datetime64 (pandas has no datetime64[D], so day-floored
+# datetime64[s]) and crime counts are downcast to the smallest integer type.
+
+# Malaysian states, districts, and special cases
+MALAYSIAN_STATES = [
+    "johor", "kedah", "kelantan", "melaka", "negeri sembilan", "pahang",
+    "perak", "perlis", "pulau pinang", "sabah", "sarawak", "selangor",
+    "terengganu", "w.p. kuala lumpur"
+]
+
+MALAYSIAN_DISTRICTS = [
+    "batu pahat", "iskandar puteri", "johor bahru selatan", "johor bahru utara", "kluang",
+    "kota tinggi", "kulaijaya", "ledang", "mersing", "muar", "nusajaya", "pontian", "segamat", "seri alam",  # Johor
+    "baling", "bandar bharu", "kota setar", "kuala muda", "kubang pasu", "kulim",
+    "langkawi", "padang terap", "pendang", "sik", "yan",  # Kedah
+    "bachok", "gua musang", "jeli", "kota bharu", "kuala krai", "machang", "pasir mas",
+    "pasir puteh", "tanah merah", "tumpat",  # Kelantan
+    "alor gajah", "jasin", "melaka tengah",  # Melaka
+    "jelebu", "jempol", "kuala pilah", "nilai", "port dickson", "rembau", "seremban", "tampin",  # Negeri Sembilan
+    "bentong", "bera", "cameron highlands", "jerantut", "kuala lipis", "kuantan",
+    "maran", "pekan", "raub", "rompin", "temerloh",  # Pahang
+    "batu gajah", "gerik", "hilir perak", "ipoh", "kampar", "kerian", "kuala kangsar",
+    "manjung", "pengkalan hulu", "perak tengah", "selama", "sungai siput", "taiping",
+    "tanjong malim", "tapah",  # Perak
+    "arau", "kangar", "padang besar",  # Perlis
+    "barat daya","seberang perai", "timur laut",  # Pulau Pinang
+    "beaufort", "beluran", "keningau", "kota belud", "kota kinabalu", "kinabatangan",
+    "kota marudu", "kudat", "kunak", "lahad datu", "papar", "penampang", "ranau",
+    "sandakan", "semporna", "sipitang", "tawau", "tenom", "tuaran",  # Sabah
+    "bau", "belaga", "betong", "bintulu", "dalat", "julau", "kanowit", "kapit",
+    "kota samarahan", "kuching", "lawas", "limbang", "lubok antu", "lundu", "marudi",
+    "matu daro", "meradong", "miri", "mukah", "padawan", "saratok", "sarikei",
+    "serian", "sibu", "simunjan", "song", "sri aman", "tatau",  # Sarawak
+    "ampang jaya", "gombak", "hulu selangor", "kajang", "klang", "kuala langat", 
+    "kuala selangor", "petaling jaya", "sabak bernam", "sepang",
+    "serdang", "sg. buloh", "shah alam", "subang jaya",  # Selangor
+    "besut", "dungun", "hulu terengganu", "kemaman", "kuala terengganu", "marang", "setiu",  # Terengganu
+    "brickfields", "cheras", "dang wangi", "sentul", "wangsa maju", "w.p. putrajaya"  # W.P. Kuala Lumpur
+]
+
+# Dictionary for abbreviations
+ABBREVIATIONS = {
+    "putrajaya": "w.p. putrajaya",
+    "sg buloh": "sg. buloh",
+    "sungai buloh": "sg. buloh",
+    "kl": "w.p. kuala lumpur",
+    "kuala lumpur": "w.p. kuala lumpur",
+    "n9": "negeri sembilan",
+    "tg malim": "tanjong malim",
+    "tanjung malim": "tanjong malim",
+    "cameron highland": "cameron highlands"
+}
+
+DISTRICT_TO_STATE = {
+    # Johor
+    "batu pahat": "johor",
+    "iskandar puteri": "johor",
+    "johor bahru selatan": "johor",
+    "johor bahru utara": "johor",
+    "kluang": "johor",
+    "kota tinggi": "johor",
+    "kulaijaya": "johor",
+    "ledang": "johor",
+    "mersing": "johor",
+    "muar": "johor",
+    "nusajaya": "johor",
+    "pontian": "johor",
+    "segamat": "johor",
+    "seri alam": "johor",
+
+    # Kedah
+    "baling": "kedah",
+    "bandar bharu": "kedah",
+    "kota setar": "kedah",
+    "kuala muda": "kedah",
+    "kubang pasu": "kedah",
+    "kulim": "kedah",
+    "langkawi": "kedah",
+    "padang terap": "kedah",
+    "pendang": "kedah",
+    "sik": "kedah",
+    "yan": "kedah",
+
+    # Kelantan
+    "bachok": "kelantan",
+    "gua musang": "kelantan",
+    "jeli": "kelantan",
+    "kota bharu": "kelantan",
+    "kuala krai": "kelantan",
+    "machang": "kelantan",
+    "pasir mas": "kelantan",
+    "pasir puteh": "kelantan",
+    "tanah merah": "kelantan",
+    "tumpat": "kelantan",
+
+    # Melaka
+    "alor gajah": "melaka",
+    "jasin": "melaka",
+    "melaka tengah": "melaka",
+
+    # Negeri Sembilan
+    "jelebu": "negeri sembilan",
+    "jempol": "negeri sembilan",
+    "kuala pilah": "negeri sembilan",
+    "nilai": "negeri sembilan",
+    "port dickson": "negeri sembilan",
+    "rembau": "negeri sembilan",
+    "seremban": "negeri sembilan",
+    "tampin": "negeri sembilan",
+
+    # Pahang
+    "bentong": "pahang",
+    "bera": "pahang",
+    "cameron highland": "pahang",
+    "cameron highlands": "pahang",
+    "jerantut": "pahang",
+    "kuala lipis": "pahang",
+    "kuantan": "pahang",
+    "maran": "pahang",
+    "pekan": "pahang",
+    "raub": "pahang",
+    "rompin": "pahang",
+    "temerloh": "pahang",
+
+    # Perak
+    "batu gajah": "perak",
+    "gerik": "perak",
+    "hilir perak": "perak",
+    "ipoh": "perak",
+    "kampar": "perak",
+    "kerian": "perak",
+    "kuala kangsar": "perak",
+    "manjung": "perak",
+    "pengkalan hulu": "perak",
+    "perak tengah": "perak",
+    "selama": "perak",
+    "sungai siput": "perak",
+    "taiping": "perak",
+    "tanjong malim": "perak",
+    "tapah": "perak",
+
+    # Perlis
+    "arau": "perlis",
+    "kangar": "perlis",
+    "padang besar": "perlis",
+
+    # Pulau Pinang
+    "barat daya": "pulau pinang",
+    "seberang perai": "pulau pinang",
+    "seberang perai selatan": "pulau pinang",
+    "seberang perai tengah": "pulau pinang",
+    "seberang perai utara": "pulau pinang",
+    "timur laut": "pulau pinang",
+
+    # Sabah
+    "beaufort": "sabah",
+    "beluran": "sabah",
+    "keningau": "sabah",
+    "kota belud": "sabah",
+    "kota kinabalu": "sabah",
+    "kinabatangan": "sabah",
+    "kota marudu": "sabah",
+    "kudat": "sabah",
+    "kunak": "sabah",
+    "lahad datu": "sabah",
+    "papar": "sabah",
+    "penampang": "sabah",
+    "ranau": "sabah",
+    "sandakan": "sabah",
+    "semporna": "sabah",
+    "sipitang": "sabah",
+    "tawau": "sabah",
+    "tenom": "sabah",
+    "tuaran": "sabah",
+
+    # Sarawak
+    "bau": "sarawak",
+    "belaga": "sarawak",
+    "betong": "sarawak",
+    "bintulu": "sarawak",
+    "dalat": "sarawak",
+    "julau": "sarawak",
+    "kanowit": "sarawak",
+    "kapit": "sarawak",
+    "kota samarahan": "sarawak",
+    "kuching": "sarawak",
+    "lawas": "sarawak",
+    "limbang": "sarawak",
+    "lubok antu": "sarawak",
+    "lundu": "sarawak",
+    "marudi": "sarawak",
+    "matu daro": "sarawak",
+    "meradong": "sarawak",
+    "miri": "sarawak",
+    "mukah": "sarawak",
+    "padawan": "sarawak",
+    "saratok": "sarawak",
+    "sarikei": "sarawak",
+    "serian": "sarawak",
+    "sibu": "sarawak",
+    "simunjan": "sarawak",
+    "song": "sarawak",
+    "sri aman": "sarawak",
+    "tatau": "sarawak",
+
+    # Selangor
+    "ampang jaya": "selangor",
+    "gombak": "selangor",
+    "hulu selangor": "selangor",
+    "kajang": "selangor",
+    "klang": "selangor",
+    "klang selatan": "selangor",
+    "klang utara": "selangor",
+    "kuala langat": "selangor",
+    "kuala selangor": "selangor",
+    "petaling jaya": "selangor",
+    "sabak bernam": "selangor",
+    "sepang": "selangor",
+    "serdang": "selangor",
+    "sg. buloh": "selangor",
+    "shah alam": "selangor",
+    "subang jaya": "selangor",
+
+    # Terengganu
+    "besut": "terengganu",
+    "dungun": "terengganu",
+    "hulu terengganu": "terengganu",
+    "kemaman": "terengganu",
+    "kuala terengganu": "terengganu",
+    "marang": "terengganu",
+    "setiu": "terengganu",
+
+    # W.P. Kuala Lumpur
+    "brickfields": "w.p. kuala lumpur",
+    "cheras": "w.p. kuala lumpur",
+    "dang wangi": "w.p. kuala lumpur",
+    "sentul": "w.p. kuala lumpur",
+    "wangsa maju": "w.p. kuala lumpur",
+    "w.p. putrajaya": "w.p. kuala lumpur"
+}
+
+UNKNOWN = "Unknown"  # Label for rows without a known state, district or type
+
+# Dtype whose categories are `labels`, sorted
+def categorical(labels):
+    return pd.CategoricalDtype(sorted(set(labels)))
+
+# `dtype` with any of `labels` it does not have yet
+def extend_categories(dtype, labels):
+    unseen = pd.Index(labels).difference(dtype.categories)
+    if not len(unseen):
+        return dtype
+    logging.debug(f"Adding {len(unseen)} categories outside the vocabulary: {list(unseen[:10])}")
+    return categorical(list(dtype.categories) + list(unseen))
+
+# `values` as a Categorical of `dtype` (extended with unseen labels); with no dtype
+# the categories are the sorted labels present
+def to_categorical(values, dtype=None):
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    target = categorical(values.cat.categories) if dtype is None else extend_categories(dtype, values.cat.categories)
+    return values if values.cat.categories.equals(target.categories) else values.astype(target)
+
+# Map `values` through `mapping` (a dict or function) once per distinct label and
+# broadcast the results through the codes. Unmapped labels keep their value, or become
+# `default` (as do missing values) when one is given.
+def map_categories(values, mapping, dtype=None, default=None):
+    values = to_categorical(values)
+    labels = values.cat.categories
+    targets = pd.Series(labels.map(mapping), dtype=object)
+    targets = targets.where(targets.notna(), default if default is not None else pd.Series(labels, dtype=object))
+    present = targets.dropna()
+    if default is not None:
+        present = pd.concat([present, pd.Series([default], dtype=object)])
+    dtype = categorical(present) if dtype is None else extend_categories(dtype, present)
+    lookup = dtype.categories.get_indexer(targets)
+    # Code -1 (missing) picks the last entry
+    lookup = np.append(lookup, dtype.categories.get_loc(default) if default is not None else -1)
+    codes = lookup[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=values.index, name=values.name)
+
+# Dates at day precision (wall-clock date for timezone-aware values)
+def to_dates(values):
+    dates = values if pd.api.types.is_datetime64_any_dtype(values) else pd.to_datetime(values)
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.dt.floor("D").astype("datetime64[s]")
+
+def to_counts(values):
+    return pd.to_numeric(values, downcast="integer")
+
+# Column types for one kind of frame. Categorical dtypes grow as unseen labels arrive,
+# so frames converted one after another (record batches, pages) share their
+# categories and can be concatenated without falling back to object columns.
+class FrameSchema:
+    def __init__(self, categories=None, dates=(), counts=()):
+        self.dtypes = dict(categories or {})  # Column -> CategoricalDtype, or None to infer
+        self.dates = tuple(dates)
+        self.counts = tuple(counts)
+
+    def apply(self, df):
+        converted = {}
+        for column, dtype in self.dtypes.items():
+            if column in df:
+                converted[column] = to_categorical(df[column], dtype)
+                self.dtypes[column] = converted[column].dtype
+        for column in self.dates:
+            if column in df:
+                converted[column] = to_dates(df[column])
+        for column in self.counts:
+            if column in df:
+                converted[column] = to_counts(df[column])
+        return df.assign(**converted)
+
+    # Concatenate frames converted earlier, recoded to the current categories
+    def concat(self, frames):
+        frames = [frame.astype({column: dtype for column, dtype in self.dtypes.items()
+                                if column in frame and dtype is not None}) for frame in frames]
+        return pd.concat(frames, ignore_index=True)
+
+# Lowercase vocabularies, as the tweet pipeline matches and stores them
+STATE_DTYPE = categorical(MALAYSIAN_STATES + list(DISTRICT_TO_STATE.values()) + [UNKNOWN])
+DISTRICT_DTYPE = categorical(list(DISTRICT_TO_STATE) + [UNKNOWN])
+
+# data.gov.my crime_district: title-cased names ("W.P. Kuala Lumpur"), inferred crime categories
+def gov_schema():
+    return FrameSchema(
+        categories={"state": categorical(state.title() for state in MALAYSIAN_STATES),
+                    "district": categorical(district.title() for district in DISTRICT_TO_STATE),
+                    "category": None},
+        dates=["date"], counts=["crimes"])
+
+# SafeZone sheet rows as fetched (Main Topic labels are inferred)
+def report_schema():
+    return FrameSchema(categories={"Main Topic": None}, dates=["Date (GMT)"])
@@ -0,0 +1,164 @@
+import logging
+import os
+
+import pandas as pd
+
+from sheet_writer import column_letter
+
+# Delta uploader for worksheets holding one keyed DataFrame (header in row 1).
+# A snapshot of the last successful upload (a Parquet file with each row's sheet
+# position in `_row`) is diffed against the new data, and only inserted, changed
+# and removed rows are sent, as batched value updates in bounded chunks. Removed
+# rows are reused by inserted rows; any remaining gaps are closed by moving rows
+# up from the bottom, so the sheet stays dense (but not sorted). Every row goes to
+# an explicit range (the grid is grown first), so nothing depends on where the sheet
+# currently ends. The snapshot is removed before the first write and saved again
+# once all writes succeeded: after a failed run the next one finds no snapshot and
+# rewrites the sheet in full. A full rewrite is also needed when the columns changed.
+
+ROW_COLUMN = "_row"
+MAX_ROWS_PER_REQUEST = 5000  # Rows of values per batchUpdate / append request
+
+def load_snapshot(snapshot_path):
+    if not os.path.exists(snapshot_path):
+        return None
+    return pd.read_parquet(snapshot_path)
+
+def save_snapshot(dataframe, snapshot_path, rows=None):
+    snapshot = dataframe.reset_index(drop=True).copy()
+    snapshot[ROW_COLUMN] = rows if rows is not None else range(2, len(snapshot) + 2)
+    if os.path.dirname(snapshot_path):
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    snapshot.to_parquet(snapshot_path, index=False)
+
+def _row_values(frame):
+    return frame.astype(object).where(frame.notna(), "").values.tolist()
+
+# Work out which sheet rows to write or clear to turn `old` (snapshot) into `new`.
+# Returns ({sheet_row: values}, rows_to_clear, new_positions, counts).
+def plan_delta(old, new, key_columns):
+    columns = list(new.columns)
+    value_columns = [c for c in columns if c not in key_columns]
+    new = new.reset_index(drop=True)
+    merged = old.merge(new.reset_index(), on=key_columns, how="outer", suffixes=("_old", ""), indicator=True)
+
+    both = merged[merged["_merge"] == "both"]
+    differs = pd.Series(False, index=both.index)
+    for column in value_columns:
+        old_values, new_values = both[f"{column}_old"], both[column]
+        differs |= (old_values != new_values) & ~(old_values.isna() & new_values.isna())
+    changed = both[differs]
+    removed = merged[merged["_merge"] == "left_only"]
+    inserted = merged[merged["_merge"] == "right_only"]
+
+    positions = pd.Series(0, index=new.index, dtype="int64")  # new row index -> sheet row
+    kept = both["index"].astype("int64").to_numpy()
+    positions[kept] = both[ROW_COLUMN].astype("int64").to_numpy()
+
+    writes = {}
+    for _, row in changed.iterrows():
+        writes[int(row[ROW_COLUMN])] = int(row["index"])
+
+    # Inserted rows fill the slots of removed rows first, then go after the last row
+    free = sorted(int(r) for r in removed[ROW_COLUMN])
+    last_row = int(old[ROW_COLUMN].max()) if len(old) else 1
+    for index in inserted["index"].astype("int64"):
+        if free:
+            target = free.pop(0)
+        else:
+            last_row += 1
+            target = last_row
+        positions[index] = target
+        writes[target] = int(index)
+
+    # Close remaining gaps by moving the bottom-most rows up
+    to_clear = []
+    occupied = positions.sort_values(ascending=False)
+    row_at = {int(r): int(i) for i, r in occupied.items()}
+    bottom = sorted(row_at, reverse=True)
+    for hole in free:
+        while bottom and bottom[0] not in row_at:
+            bottom.pop(0)
+        if not bottom or bottom[0] < hole:
+            break
+        source = bottom.pop(0)
+        index = row_at.pop(source)
+        positions[index] = hole
+        row_at[hole] = index
+        writes.pop(source, None)
+        writes[hole] = index
+    final_last = int(positions.max()) if len(positions) else 1
+    old_last = int(old[ROW_COLUMN].max()) if len(old) else 1
+    if old_last > final_last:
+        to_clear = list(range(final_last + 1, old_last + 1))
+
+    values = _row_values(new[columns])
+    row_writes = {row: values[index] for row, index in writes.items()}
+    counts = {"inserted": len(inserted), "changed": len(changed), "removed": len(removed),
+              "rows_written": len(row_writes), "rows_cleared": len(to_clear)}
+    return row_writes, to_clear, positions.to_numpy(), counts
+
+# Group row writes into contiguous A1 ranges
+def _contiguous_ranges(row_writes, num_cols):
+    ranges = []
+    rows = sorted(row_writes)
+    start = 0
+    while start < len(rows):
+        end = start
+        while end + 1 < len(rows) and rows[end + 1] == rows[end] + 1:
+            end += 1
+        first, last = rows[start], rows[end]
+        ranges.append({"range": f"A{first}:{column_letter(num_cols)}{last}",
+                       "values": [row_writes[r] for r in rows[start:end + 1]]})
+        start = end + 1
+    return ranges
+
+def _chunk_ranges(ranges, max_rows):
+    chunk, chunk_rows = [], 0
+    for item in ranges:
+        # Split long runs so no single request exceeds max_rows
+        for offset in range(0, len(item["values"]), max_rows):
+            values = item["values"][offset:offset + max_rows]
+            first = int(item["range"].split(":")[0][1:]) + offset
+            end_col = "".join(ch for ch in item["range"].split(":")[1] if ch.isalpha())
+            part = {"range": f"A{first}:{end_col}{first + len(values) - 1}", "values": values}
+            if chunk and chunk_rows + len(values) > max_rows:
+                yield chunk
+                chunk, chunk_rows = [], 0
+            chunk.append(part)
+            chunk_rows += len(values)
+    if chunk:
+        yield chunk
+
+# Apply the delta between the stored snapshot and `dataframe` to the worksheet.
+# Returns the counts, or None when a full rewrite is needed (no snapshot / schema change).
+def upload_delta(worksheet, dataframe, snapshot_path, key_columns, max_rows_per_request=MAX_ROWS_PER_REQUEST):
+    old = load_snapshot(snapshot_path)
+    if old is None:
+        logging.info("No upload snapshot found, a full rewrite is needed.")
+        return None
+    if [c for c in old.columns if c != ROW_COLUMN] != list(dataframe.columns):
+        logging.info("Sheet columns changed since the last upload, a full rewrite is needed.")
+        return None
+
+    row_writes, to_clear, positions, counts = plan_delta(old, dataframe, key_columns)
+    num_cols = len(dataframe.columns)
+    if row_writes or to_clear:
+        os.remove(snapshot_path)
+
+    requests = 0
+    last_row = max(row_writes, default=0)
+    if last_row > worksheet.row_count:
+        worksheet.resize(rows=last_row)
+        requests += 1
+    for chunk in _chunk_ranges(_contiguous_ranges(row_writes, num_cols), max_rows_per_request):
+        worksheet.batch_update(chunk, value_input_option="RAW")
+        requests += 1
+    if to_clear:
+        worksheet.batch_clear([f"A{to_clear[0]}:{column_letter(num_cols)}{to_clear[-1]}"])
+        requests += 1
+
+    save_snapshot(dataframe, snapshot_path, rows=positions)
+    counts["requests"] = requests
+    logging.info(f"Delta upload: {counts}")
+    return counts
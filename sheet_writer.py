@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from source_clients import backoff_delay, retry_after_seconds
+
+# Chunked, resumable writer for large Google Sheets uploads.
+# Rows are split into blocks bounded by cell count and serialized size (the Sheets
+# API rejects very large payloads and slows down well before that), blocks are
+# written through a bounded thread pool with per-block retries, and finished blocks
+# are recorded in a progress marker file. A run that fails part-way can be started
+# again with the same data and only the missing blocks are written.
+
+MAX_BLOCK_CELLS = 50_000
+MAX_BLOCK_BYTES = 2_000_000  # Recommended maximum Sheets API request payload
+MAX_WORKERS = 4  # Sheets allows ~60 write requests per minute per user, so keep this small
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # Seconds; the jittered backoff ceiling doubles after every failed attempt
+BACKOFF_MAX = 60.0
+SIZE_SAMPLE_ROWS = 200
+
+# 1 -> A, 26 -> Z, 27 -> AA, 703 -> AAA
+def column_letter(n):
+    letters = ""
+    while n > 0:
+        n, remainder = divmod(n - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def a1_range(first_row, first_col, last_row, last_col):
+    return f"{column_letter(first_col)}{first_row}:{column_letter(last_col)}{last_row}"
+
+def values_fingerprint(values, start_row=1):
+    digest = hashlib.sha256(f"{start_row}:".encode())
+    for row in values:
+        digest.update(json.dumps(row, default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+# Rows per block so that a block stays under both the cell and the byte budget
+def block_rows(values, max_cells=MAX_BLOCK_CELLS, max_bytes=MAX_BLOCK_BYTES):
+    if not values:
+        return 1
+    num_cols = max(len(row) for row in values[:SIZE_SAMPLE_ROWS]) or 1
+    step = max(len(values) // SIZE_SAMPLE_ROWS, 1)
+    sample = values[::step][:SIZE_SAMPLE_ROWS]
+    row_bytes = max(len(json.dumps(row, default=str)) for row in sample) + 1
+    return max(min(max_cells // num_cols, max_bytes // row_bytes), 1)
+
+class SheetWriter:
+    def __init__(self, worksheet, progress_path=None, max_cells=MAX_BLOCK_CELLS, max_bytes=MAX_BLOCK_BYTES,
+                 max_workers=MAX_WORKERS, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, sleep=time.sleep):
+        self.worksheet = worksheet
+        self.progress_path = progress_path
+        self.max_cells = max_cells
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def _load_progress(self, fingerprint):
+        if not self.progress_path or not os.path.exists(self.progress_path):
+            return None
+        try:
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable progress marker {self.progress_path}: {e}")
+            return None
+        if progress.get("fingerprint") != fingerprint:
+            logging.info("Progress marker belongs to different data, starting a fresh upload.")
+            return None
+        return progress
+
+    def _save_progress(self, progress):
+        if not self.progress_path:
+            return
+        directory = os.path.dirname(self.progress_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as tmp:
+            json.dump(progress, tmp)
+        os.replace(tmp.name, self.progress_path)
+
+    def _clear_progress(self):
+        if self.progress_path and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+    def _with_retries(self, action, description):
+        for attempt in range(self.max_retries):
+            try:
+                return action()
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, BACKOFF_MAX, retry_after_seconds(e))
+                logging.warning(f"{description} failed (attempt {attempt + 1}): {e}. Retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    # Grow the grid up front; parallel block writes cannot extend it themselves
+    def _ensure_grid(self, last_row, last_col):
+        rows, cols = self.worksheet.row_count, self.worksheet.col_count
+        if last_row > rows or last_col > cols:
+            self._with_retries(lambda: self.worksheet.resize(rows=max(rows, last_row), cols=max(cols, last_col)),
+                               "Worksheet resize")
+
+    def _write_block(self, start, block, first_row, progress):
+        num_cols = max(len(row) for row in block)
+        range_name = a1_range(first_row + start, 1, first_row + start + len(block) - 1, num_cols)
+        self._with_retries(lambda: self.worksheet.update(values=block, range_name=range_name, value_input_option="RAW"),
+                           f"Block {range_name} write")
+        with self.lock:
+            progress["done"].append(start)
+            self._save_progress(progress)
+        return len(block)
+
+    # Write `values` (a list of rows, header included) starting at `first_row`.
+    # With clear=True the worksheet is cleared first, unless an earlier run for the
+    # same data is being resumed. Returns counts and throughput for the run.
+    def write(self, values, first_row=1, clear=False):
+        start_time = time.perf_counter()
+        fingerprint = values_fingerprint(values, first_row)
+        rows_per_block = block_rows(values, self.max_cells, self.max_bytes)
+        progress = self._load_progress(fingerprint)
+        resumed = progress is not None and progress.get("block_rows") == rows_per_block
+        if not resumed:
+            progress = {"fingerprint": fingerprint, "block_rows": rows_per_block, "done": []}
+            if clear:
+                self._with_retries(self.worksheet.clear, "Worksheet clear")
+            self._save_progress(progress)
+
+        done = set(progress["done"])
+        blocks = [(start, values[start:start + rows_per_block]) for start in range(0, len(values), rows_per_block)]
+        pending = [(start, block) for start, block in blocks if start not in done]
+        if values:
+            self._ensure_grid(first_row + len(values) - 1, max(len(row) for row in values))
+
+        written, failed_blocks = 0, 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._write_block, start, block, first_row, progress): start
+                       for start, block in pending}
+            for future in as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as e:
+                    failed_blocks += 1
+                    logging.error(f"Block at row {first_row + futures[future]} failed after {self.max_retries} attempts: {e}")
+
+        if not failed_blocks:
+            self._clear_progress()
+        seconds = time.perf_counter() - start_time
+        stats = {
+            "rows": len(values),
+            "written": written,
+            "blocks": len(blocks),
+            "skipped_blocks": len(blocks) - len(pending),
+            "failed_blocks": failed_blocks,
+            "resumed": resumed,
+            "seconds": seconds,
+            "rows_per_sec": written / seconds if seconds else 0.0
+        }
+        logging.info(f"Sheet write: {written}/{len(values)} rows in {len(pending)} of {len(blocks)} blocks "
+                     f"({rows_per_block} rows each), {failed_blocks} failed, resumed={resumed}")
+        return stats
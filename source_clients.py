@@ -0,0 +1,289 @@
+import email.utils
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import metrics
+
+try:
+    from google.auth.exceptions import TransportError
+except ImportError:  # google-auth is only needed for the Google clients
+    TransportError = OSError
+
+# Shared clients for the ETL sources (the SafeZone Google Sheet, the data.gov.my feeds).
+# Credentials, authorized sessions and the gspread client are created once per
+# process and reused, so tokens are only fetched when they expire. Every session
+# keeps a pool of keep-alive connections sized for the concurrent fetches.
+# SheetsClient talks to the Sheets REST API directly through such a session: there is
+# no discovery document to fetch, it is safe to share between threads (the
+# googleapiclient/httplib2 client is not), and it exposes the same
+# values().get/batchGet(...).execute() calls as service.spreadsheets().
+# Failed requests are retried with jittered exponential backoff; a Retry-After header
+# on 429/503 responses is honoured. fetch_cached keeps an on-disk copy of a download
+# and revalidates it with ETag / Last-Modified. Base URLs are configurable so the
+# whole layer can be pointed at a local stub server.
+
+SHEETS_API_URL = os.getenv("SHEETS_API_URL", "https://sheets.googleapis.com/v4")
+HTTP_CACHE_DIR = os.path.join(".cache", "http")
+POOL_SIZE = 10  # Keep-alive connections per host and session
+FETCH_WORKERS = 4  # Concurrent requests per batch of ranges; Sheets allows ~60 reads per minute per user
+TIMEOUT = 60  # Seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # Seconds; the backoff ceiling doubles after every failed attempt
+BACKOFF_MAX = 32.0
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+DOWNLOAD_BLOCK = 1 << 20
+
+class SourceHTTPError(Exception):
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        super().__init__(f"HTTP {response.status_code} from {response.url}: {response.text[:200]}")
+
+# HTTP status of a failed request, for this module's errors as well as googleapiclient,
+# gspread (requests) and urllib errors; None for network errors
+def error_status(error):
+    for attribute in ("status", "code"):
+        if isinstance(getattr(error, attribute, None), int):
+            return getattr(error, attribute)
+    response = getattr(error, "response", None)
+    if response is None:
+        response = getattr(error, "resp", None)
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return int(status) if status is not None else None
+
+# Seconds to wait from a Retry-After header (delay seconds or an HTTP date), if any
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        response = getattr(error, "resp", None)
+    headers = getattr(response, "headers", response) if response is not None else getattr(error, "headers", None)
+    value = None
+    if headers is not None:
+        try:
+            value = headers.get("Retry-After") or headers.get("retry-after")
+        except AttributeError:
+            return None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+# Rate limits, server errors and network errors are retried; other client errors are not
+def is_retryable(error):
+    status = error_status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, (OSError, TransportError))
+
+# "Full jitter": a uniform delay up to the exponential ceiling, so concurrent clients
+# spread out, but never shorter than what the server asked for
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX, retry_after=None, rng=random):
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+class RetryPolicy:
+    def __init__(self, max_retries=MAX_RETRIES, base=BACKOFF_BASE, cap=BACKOFF_MAX, sleep=time.sleep, rng=random):
+        self.max_retries = max_retries
+        self.base = base
+        self.cap = cap
+        self.sleep = sleep
+        self.rng = rng
+
+    def call(self, action, description):
+        for attempt in range(self.max_retries):
+            try:
+                return action()
+            except Exception as e:
+                if attempt == self.max_retries - 1 or not is_retryable(e):
+                    raise
+                delay = backoff_delay(attempt, self.base, self.cap, retry_after_seconds(e), self.rng)
+                logging.warning(f"{description} failed (attempt {attempt + 1}): {e}. Retrying in {delay:.2f}s")
+                self.sleep(delay)
+
+DEFAULT_RETRY = RetryPolicy()
+
+# Run zero-argument callables concurrently; results come back in task order and the
+# first error is raised
+def fetch_all(tasks, workers=FETCH_WORKERS):
+    tasks = list(tasks)
+    if len(tasks) <= 1 or workers <= 1:
+        return [task() for task in tasks]
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(lambda task: task(), tasks))
+
+def mount_pool(session, pool_size=POOL_SIZE):
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_shared = {}
+_shared_lock = threading.RLock()
+
+# Build the object for `key` once per process; later calls return the same instance
+def shared(key, factory):
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = factory()
+        return _shared[key]
+
+# Plain keep-alive session for public sources
+def shared_session(pool_size=POOL_SIZE):
+    return shared(("session", pool_size), lambda: mount_pool(requests.Session(), pool_size))
+
+def service_account_credentials(credentials_file, scopes):
+    from google.oauth2 import service_account
+
+    return shared(("credentials", credentials_file, tuple(scopes)),
+                  lambda: service_account.Credentials.from_service_account_file(credentials_file, scopes=list(scopes)))
+
+# Session that adds (and refreshes) the service account's bearer token
+def authorized_session(credentials_file, scopes, pool_size=POOL_SIZE):
+    from google.auth.transport.requests import AuthorizedSession
+
+    credentials = service_account_credentials(credentials_file, scopes)
+    return shared(("authorized_session", credentials_file, tuple(scopes), pool_size),
+                  lambda: mount_pool(AuthorizedSession(credentials), pool_size))
+
+def sheets_client(credentials_file, scopes):
+    return shared(("sheets", credentials_file, tuple(scopes)),
+                  lambda: SheetsClient(authorized_session(credentials_file, scopes)))
+
+# gspread client on the shared authorized session
+def gspread_client(credentials_file, scopes):
+    import gspread
+
+    return shared(("gspread", credentials_file, tuple(scopes)),
+                  lambda: gspread.authorize(service_account_credentials(credentials_file, scopes),
+                                            session=authorized_session(credentials_file, scopes)))
+
+class SheetsRequest:
+    def __init__(self, client, path, params):
+        self.client = client
+        self.path = path
+        self.params = params
+
+    def execute(self):
+        return self.client.request(self.path, self.params)
+
+# Sheets API v4 values reads over a pooled session; sheets_client() builds the
+# authorized one. `calls` counts requests sent, including retries.
+class SheetsClient:
+    def __init__(self, session, base_url=SHEETS_API_URL, retry=DEFAULT_RETRY, timeout=TIMEOUT):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.retry = retry
+        self.timeout = timeout
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId=None, range=None):
+        return SheetsRequest(self, f"/spreadsheets/{spreadsheetId}/values/{urllib.parse.quote(range, safe='')}", {})
+
+    def batchGet(self, spreadsheetId=None, ranges=()):
+        return SheetsRequest(self, f"/spreadsheets/{spreadsheetId}/values:batchGet", {"ranges": list(ranges)})
+
+    def request(self, path, params):
+        def send():
+            with self.lock:
+                self.calls += 1
+            response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+            if response.status_code >= 400:
+                raise SourceHTTPError(response)
+            return response.json()
+
+        return self.retry.call(send, f"Sheets request {urllib.parse.unquote(path)}")
+
+# values.get for every range in `ranges`, concurrently; one list of rows per range
+def fetch_sheet_ranges(sheet, spreadsheet_id, ranges, workers=FETCH_WORKERS):
+    values = sheet.values()
+    return fetch_all([lambda r=r: values.get(spreadsheetId=spreadsheet_id, range=r).execute().get("values", [])
+                      for r in ranges], workers)
+
+# Return a local path for `source`, downloading a URL only if the server copy changed.
+# Local paths are returned as-is. If the server cannot be reached, a cached copy is used.
+def fetch_cached(source, cache_dir=HTTP_CACHE_DIR, session=None, retry=DEFAULT_RETRY, timeout=TIMEOUT):
+    if not source.startswith(("http://", "https://")):
+        return source
+
+    session = session or shared_session()
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.basename(source.split("?", 1)[0]) or "download"
+    url_hash = hashlib.md5(source.encode("utf-8")).hexdigest()[:8]
+    data_path = os.path.join(cache_dir, f"{url_hash}-{name}")
+    meta_path = data_path + ".meta.json"
+    meta = {}
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    def download():
+        with session.get(source, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                return False
+            if response.status_code >= 400:
+                raise SourceHTTPError(response)
+            with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as tmp:
+                try:
+                    for block in response.iter_content(DOWNLOAD_BLOCK):
+                        tmp.write(block)
+                except BaseException:
+                    # A broken transfer leaves no partial file behind (each retry starts a new one)
+                    tmp.close()
+                    os.unlink(tmp.name)
+                    raise
+            os.replace(tmp.name, data_path)
+            with open(meta_path, "w") as f:
+                json.dump({"url": source, "etag": response.headers.get("ETag"),
+                           "last_modified": response.headers.get("Last-Modified")}, f)
+            return True
+
+    try:
+        with metrics.stage("fetch") as stage:
+            downloaded = retry.call(download, f"Download of {source}")
+            if downloaded:
+                stage.add(nbytes=os.path.getsize(data_path))
+    except (OSError, SourceHTTPError) as e:
+        if not os.path.exists(data_path) or not is_retryable(e):
+            raise
+        logging.warning(f"Could not fetch {source} ({e}), using cached {data_path}")
+        return data_path
+    if downloaded:
+        logging.info(f"Downloaded {source} to {data_path}")
+    else:
+        logging.info(f"{source} unchanged since last download, using {data_path}")
+    return data_path
+
+# fetch_cached for several sources at once; local paths in source order
+def fetch_many(sources, cache_dir=HTTP_CACHE_DIR, workers=FETCH_WORKERS):
+    return fetch_all([functools.partial(fetch_cached, source, cache_dir) for source in sources], workers)
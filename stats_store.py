@@ -0,0 +1,304 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from firebase_admin import db
+
+from prediction_cache import FirebaseValueMirror
+
+# Columnar in-memory store behind the /stats endpoints.
+# Each source (the SafeZoneGOV aggregates written by zgov.py and the crime_data
+# reports written by preprocess_and_upload.py) is held as NumPy columns: state,
+# district and category dictionary-encoded to int32 codes, dates as a month number
+# and crimes as int64. Rows are summed per state/district/category/month when a
+# table is built (a million reports collapse to a few thousand rows), so a query is
+# a boolean mask plus one np.bincount over the small table. refresh() builds complete
+# new tables and then replaces the dict holding them in a single assignment, so
+# readers always see either the old or the new data. pandas (and pyarrow with it)
+# is only imported when a table is built, so importing the API stays cheap.
+# crime_data is mirrored through a realtime listener, so a refresh reads no more
+# than the records changed since the last one, and a source whose data did not
+# change keeps its table.
+
+SOURCES = ("gov", "reports")
+
+# zgov.py runs as a separate job and publishes its aggregates to the SafeZoneGOV
+# worksheet, so that is where the API reads them. GOV_CUBE_DIR points at zgov.py's
+# cube instead when its directory is shared with the API (e.g. a mounted volume).
+GOV_SHEET_ID = os.getenv("GOV_SHEET_ID", "1CNo8eLCASEfd7ktOgiUrzT8KBkAWhW5sPON1BITBKvM")
+GOV_RANGE = "SafeZoneGOV!A:E"
+GOV_CUBE_DIR = os.getenv("GOV_CUBE_DIR")
+GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "google-credentials.json")
+SHEETS_SCOPES = ("https://www.googleapis.com/auth/spreadsheets.readonly",)
+STRING_COLUMNS = ("state", "district", "category")
+FREQUENCIES = ("month", "year")
+
+class EmptySelection(Exception):
+    pass
+
+def month_number(value):
+    import pandas as pd
+
+    return int(pd.Timestamp(value).to_datetime64().astype("datetime64[M]").astype(np.int64))
+
+def month_label(number, freq="month"):
+    if freq == "year":
+        return str(1970 + number)
+    return str(np.datetime64(int(number), "M"))
+
+# SafeZoneGOV aggregates: from the shared cube if GOV_CUBE_DIR holds one, else from the worksheet
+def load_gov_frame(cube_dir=GOV_CUBE_DIR, sheet=None):
+    if cube_dir:
+        from crime_cube import CrimeCube
+
+        cube = CrimeCube.load(cube_dir)
+        if cube is not None:
+            return cube.to_frame()
+        logging.warning(f"No crime cube in {cube_dir}, reading the SafeZoneGOV worksheet")
+    return load_gov_sheet(sheet)
+
+# The worksheet zgov.py uploads (state, district, category, date, crimes; header in row 1)
+def load_gov_sheet(sheet=None):
+    import pandas as pd
+    from source_clients import sheets_client
+
+    sheet = sheet or sheets_client(GOOGLE_CREDENTIALS_FILE, SHEETS_SCOPES)
+    values = sheet.values().get(spreadsheetId=GOV_SHEET_ID, range=GOV_RANGE).execute().get("values", [])
+    if len(values) < 2:
+        return None
+    frame = pd.DataFrame(values[1:], columns=values[0])
+    crimes = frame["crimes"].astype(str).str.replace(",", "", regex=False)
+    frame["crimes"] = pd.to_numeric(crimes, errors="coerce").fillna(0).astype(np.int64)
+    return frame
+
+# Mirror of a Firebase tree of records (crime_data: row ID -> record). The listener's
+# first event carries the whole tree; later events carry only the records written or
+# deleted, which are applied in place. Without a listener, falls back to
+# FirebaseValueMirror's polling of the whole tree. `version` counts changes.
+class FirebaseTreeMirror(FirebaseValueMirror):
+    def __init__(self, path, refresh_interval=600.0, use_listener=True, initial_timeout=60.0):
+        super().__init__(path, refresh_interval, use_listener)
+        self.initial_timeout = initial_timeout
+        self.loaded = threading.Event()
+        self.data_lock = threading.Lock()  # Guards value against the listener thread
+        self.version = 0
+
+    def _store(self, value):
+        with self.data_lock:
+            self.value = value if isinstance(value, dict) else {}
+            self.version += 1
+            self.updated_at = time.time()
+        self.loaded.set()
+
+    # Records below the top level are copied before they change, so snapshots stay intact
+    def _set(self, parts, value):
+        if not parts:
+            self.value = value if isinstance(value, dict) else {}
+            return
+        node = self.value
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = {}
+            node[part] = child = dict(child)
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def _on_event(self, event):
+        parts = [part for part in event.path.split("/") if part]
+        with self.data_lock:
+            if self.value is None:
+                self.value = {}
+            if event.event_type == "patch":
+                for key, value in (event.data or {}).items():
+                    self._set(parts + [part for part in key.split("/") if part], value)
+            else:
+                self._set(parts, event.data)
+            self.version += 1
+            self.updated_at = time.time()
+        self.loaded.set()
+
+    def start(self):
+        with self.lock:
+            if self.mode:
+                return
+            if self.use_listener:
+                try:
+                    self.registration = db.reference(self.path).listen(self._on_event)
+                    self.mode = "listener"
+                except Exception as e:
+                    logging.warning(f"Firebase listener for {self.path} unavailable, polling instead: {e}")
+            if self.mode != "listener":
+                self.refresh()
+                threading.Thread(target=self._poll, name=f"mirror-{self.path}", daemon=True).start()
+                self.mode = "polling"
+        if not self.loaded.wait(self.initial_timeout):
+            logging.warning(f"No data from the {self.path} listener after {self.initial_timeout}s")
+
+    # (shallow copy of the records, version)
+    def snapshot(self):
+        if not self.mode:
+            self.start()
+        with self.data_lock:
+            return dict(self.value or {}), self.version
+
+# Individual crime reports from Firebase; every record counts as one crime
+def report_frame(records):
+    import pandas as pd
+
+    frame = pd.DataFrame.from_dict(records, orient="index", columns=["state", "district", "category", "type", "date"])
+    frame["crimes"] = 1
+    return frame
+
+# Loader for the reports source: the frame is rebuilt only when the mirror changed
+class ReportSource:
+    def __init__(self, mirror=None):
+        self.mirror = mirror or FirebaseTreeMirror("crime_data")
+        self.version = None
+        self.frame = None
+
+    def __call__(self):
+        records, version = self.mirror.snapshot()
+        if version != self.version:
+            self.frame, self.version = report_frame(records), version
+        return self.frame
+
+    def stop(self):
+        self.mirror.stop()
+
+class ColumnTable:
+    def __init__(self, frame):
+        import pandas as pd
+
+        dates = pd.to_datetime(frame["date"], errors="coerce")
+        valid = dates.notna().to_numpy()
+        if not valid.all():
+            logging.warning(f"Dropping {int((~valid).sum())} rows without a valid date")
+        columns = {column: frame[column].fillna("Unknown").astype(str)[valid] for column in STRING_COLUMNS}
+        columns["month"] = dates[valid].to_numpy().astype("datetime64[M]").astype(np.int32)
+        columns["crimes"] = frame["crimes"].to_numpy(dtype=np.int64)[valid]
+        grouped = pd.DataFrame(columns).groupby([*STRING_COLUMNS, "month"], sort=False, as_index=False)["crimes"].sum()
+
+        self.source_rows = int(valid.sum())
+        self.rows = len(grouped)
+        self.codes, self.labels, self.lookup = {}, {}, {}
+        for column in STRING_COLUMNS:
+            codes, uniques = pd.factorize(grouped[column], sort=True)
+            self.codes[column] = codes.astype(np.int32)
+            self.labels[column] = np.asarray(uniques, dtype=object)
+            self.lookup[column] = {}
+            for code, label in enumerate(uniques):
+                self.lookup[column].setdefault(label.lower(), []).append(code)
+        self.month = grouped["month"].to_numpy(dtype=np.int32)
+        self.year = self.month // 12
+        self.crimes = grouped["crimes"].to_numpy(dtype=np.int64)
+        self.num_districts = len(self.labels["district"])
+        self.district_key = self.codes["state"].astype(np.int64) * self.num_districts + self.codes["district"]
+
+    def _column_mask(self, column, value):
+        codes = self.lookup[column].get(value.lower())
+        if not codes:
+            raise EmptySelection()
+        return np.isin(self.codes[column], codes) if len(codes) > 1 else self.codes[column] == codes[0]
+
+    # Boolean row mask for the filters, or None when nothing is filtered
+    def mask(self, state=None, district=None, category=None, start=None, end=None):
+        mask = None
+        for column, value in (("state", state), ("district", district), ("category", category)):
+            if value is not None:
+                column_mask = self._column_mask(column, value)
+                mask = column_mask if mask is None else mask & column_mask
+        if start is not None:
+            mask = (self.month >= month_number(start)) if mask is None else mask & (self.month >= month_number(start))
+        if end is not None:
+            mask = (self.month <= month_number(end)) if mask is None else mask & (self.month <= month_number(end))
+        return mask
+
+    def _grouped(self, keys, size, filters):
+        try:
+            mask = self.mask(**filters)
+        except EmptySelection:
+            return np.zeros(size, dtype=np.int64)
+        crimes = self.crimes
+        if mask is not None:
+            keys, crimes = keys[mask], crimes[mask]
+        return np.bincount(keys, weights=crimes, minlength=size).astype(np.int64)
+
+    # [(state, district, crimes)], largest first
+    def by_district(self, **filters):
+        totals = self._grouped(self.district_key, len(self.labels["state"]) * self.num_districts, filters)
+        present = np.flatnonzero(totals)
+        order = present[np.argsort(-totals[present], kind="stable")]
+        states, districts = np.divmod(order, self.num_districts)
+        return list(zip(self.labels["state"][states].tolist(), self.labels["district"][districts].tolist(),
+                        totals[order].tolist()))
+
+    # [(period, crimes)] in date order, per month or per year
+    def trend(self, freq="month", **filters):
+        if freq not in FREQUENCIES:
+            raise ValueError(f"freq must be one of {FREQUENCIES}")
+        periods = self.month if freq == "month" else self.year
+        first = int(periods.min()) if self.rows else 0
+        totals = self._grouped(periods - first, int(periods.max()) - first + 1 if self.rows else 0, filters)
+        present = np.flatnonzero(totals)
+        return [(month_label(first + p, freq), int(totals[p])) for p in present]
+
+class StatsStore:
+    def __init__(self, loaders=None):
+        self.loaders = loaders if loaders is not None else {"gov": load_gov_frame, "reports": ReportSource()}
+        self.tables = {}
+        self.frames = {}  # The frame each table was built from
+        self.loaded_at = {}
+        self.errors = {}
+        self.lock = threading.Lock()  # Serializes refreshes; readers never take it
+
+    def table(self, source):
+        return self.tables.get(source)
+
+    # Rebuild every source whose data changed; a source that fails to load keeps its previous table
+    def refresh(self):
+        with self.lock:
+            tables = dict(self.tables)
+            for source, loader in self.loaders.items():
+                start = time.perf_counter()
+                try:
+                    frame = loader()
+                    if frame is None:
+                        self.errors[source] = "No data available"
+                        continue
+                    if source in tables and frame is self.frames.get(source):
+                        continue
+                    tables[source] = ColumnTable(frame)
+                    self.frames[source] = frame
+                    self.loaded_at[source] = time.time()
+                    self.errors.pop(source, None)
+                    logging.info(f"Loaded {tables[source].source_rows} {source} rows ({tables[source].rows} grouped) "
+                                 f"into the stats store in {time.perf_counter() - start:.2f}s")
+                except Exception as e:
+                    self.errors[source] = str(e)
+                    logging.error(f"Error loading {source} statistics: {e}")
+            self.tables = tables
+        return self.stats()
+
+    def stop(self):
+        for loader in self.loaders.values():
+            if hasattr(loader, "stop"):
+                loader.stop()
+
+    def stats(self):
+        return {source: {"rows": self.tables[source].source_rows if source in self.tables else None,
+                         "grouped_rows": self.tables[source].rows if source in self.tables else None,
+                         "loaded_at": self.loaded_at.get(source), "error": self.errors.get(source)}
+                for source in self.loaders}
+
+def paginate(items, offset, limit):
+    page = items[offset:offset + limit]
+    next_offset = offset + limit if offset + limit < len(items) else None
+    return {"total": len(items), "offset": offset, "limit": limit, "next_offset": next_offset, "items": page}
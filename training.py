@@ -0,0 +1,200 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from crime_cube import DEFAULT_CUBE_DIR, CrimeCube
+from instrumentation import instrumented_run, metrics
+from model_registry import MODEL_DIR, ModelRegistry, forecast_path, load_model_file, set_current
+
+# Offline training and batch scoring for the crime forecasting model.
+# The aggregated crime data (zgov.py's df_combined: state, district, category, date,
+# crimes) is laid out as a dense panel, one row per state/district/category series
+# and one column per period (year or month, inferred from the dates). Features for
+# every series and period are built at once with NumPy windowing: lags 1-7 from a
+# sliding window over the NaN-padded panel and trailing means over 3/6/12 periods
+# from cumulative sums. The model predicts the next period's crimes from those 10
+# features. `train` writes a versioned model into MODEL_DIR, scores every series for
+# the period after the data in one predict call, stores that forecast table next to
+# the model and points MODEL_DIR/CURRENT at it, which main.py hot-reloads. `score`
+# re-scores fresh data with the current model.
+
+SERIES_COLUMNS = ["state", "district", "category"]
+LAGS = 7
+ROLLING_WINDOWS = (3, 6, 12)
+FEATURE_NAMES = [f"lag_{k}" for k in range(1, LAGS + 1)] + [f"rolling_mean_{w}" for w in ROLLING_WINDOWS]
+DEFAULT_THREADS = os.cpu_count() or 1
+XGB_PARAMS = {"n_estimators": 300, "max_depth": 4, "learning_rate": 0.05, "tree_method": "hist"}
+META_SUFFIX = ".meta"
+
+# "Y" when every date is a January 1st (data.gov.my publishes yearly totals), else "M"
+def infer_freq(dates):
+    dates = pd.to_datetime(dates)
+    return "Y" if ((dates.dt.month == 1) & (dates.dt.day == 1)).all() else "M"
+
+# Dense (series x period) crime matrix. Returns (keys, periods, matrix): keys holds
+# the series columns per matrix row, periods the PeriodIndex of the matrix columns.
+def build_panel(df, freq=None):
+    freq = freq or infer_freq(df["date"])
+    ordinals = pd.PeriodIndex(pd.to_datetime(df["date"]), freq=freq).asi8
+    codes = df.groupby(SERIES_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    keys = df[SERIES_COLUMNS].iloc[first_rows].reset_index(drop=True)
+    first = int(ordinals.min())
+    n_series, n_periods = len(keys), int(ordinals.max()) - first + 1
+    matrix = np.bincount(codes * n_periods + (ordinals - first), weights=df["crimes"].to_numpy(dtype=np.float64),
+                         minlength=n_series * n_periods).reshape(n_series, n_periods)
+    periods = pd.period_range(pd.Period(ordinal=first, freq=freq), periods=n_periods)
+    return keys, periods, matrix
+
+# (series, period + 1, feature) tensor: entry [:, t] holds the features for predicting
+# period t from the periods before it, so [:, -1] is the input for the next period.
+# Missing history is NaN, which XGBoost treats as missing.
+def feature_tensor(matrix):
+    n_series, n_periods = matrix.shape
+    padded = np.concatenate([np.full((n_series, LAGS), np.nan), matrix], axis=1)
+    lags = sliding_window_view(padded, LAGS, axis=1)[:, :, ::-1]  # lag_1 first
+    cumulative = np.concatenate([np.zeros((n_series, 1)), np.cumsum(matrix, axis=1)], axis=1)
+    t = np.arange(n_periods + 1)
+    rolling = []
+    for window in ROLLING_WINDOWS:
+        start = np.maximum(t - window, 0)
+        with np.errstate(invalid="ignore"):
+            rolling.append((cumulative[:, t] - cumulative[:, start]) / (t - start))  # 0/0 -> NaN at t=0
+    return np.concatenate([lags, np.stack(rolling, axis=2)], axis=2).astype(np.float32)
+
+# Training rows for periods [start, end): every period with at least one period of history
+def training_rows(features, matrix, start=1, end=None):
+    end = matrix.shape[1] if end is None else end
+    return features[:, start:end].reshape(-1, features.shape[2]), matrix[:, start:end].reshape(-1)
+
+def fit_model(X, y, threads=DEFAULT_THREADS, params=None):
+    from xgboost import XGBRegressor
+
+    model = XGBRegressor(n_jobs=threads, **{**XGB_PARAMS, **(params or {})})
+    model.fit(X, y)
+    return model
+
+# Next-period forecast for every series, scored in one predict call
+def forecast_table(model, keys, periods, features):
+    table = keys.copy()
+    table["period"] = str(periods[-1] + 1)
+    predictions = model.predict(np.ascontiguousarray(features[:, -1])).astype(np.float64)
+    table["forecast"] = np.clip(predictions, 0, None).round(2)
+    return table
+
+def write_atomic_csv(table, path):
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path) or ".", delete=False, suffix=".tmp") as tmp:
+        table.to_csv(tmp, index=False)
+    os.replace(tmp.name, path)
+
+# The aggregated crime data: from the cube zgov.py maintains, or ingested from a Parquet source
+def load_training_frame(source="cube", cube_dir=DEFAULT_CUBE_DIR):
+    if source == "cube":
+        cube = CrimeCube.load(cube_dir)
+        if cube is None:
+            raise FileNotFoundError(f"No crime cube in {cube_dir}; run zgov.py first or pass --source")
+        return cube.to_frame()
+    from gov_ingest import load_crime_district  # pyarrow is only needed here, not in the API
+
+    return load_crime_district(source)
+
+def prepare(df):
+    with metrics.stage("feature_build") as stage:
+        keys, periods, matrix = build_panel(df)
+        features = feature_tensor(matrix)
+        stage.add(rows=matrix.size)
+    return keys, periods, matrix, features
+
+# Train on `df`, write the model, its metadata and forecast table to `model_dir`,
+# and (with activate) point CURRENT at it. Returns the metadata.
+def train(df, model_dir=MODEL_DIR, threads=DEFAULT_THREADS, params=None, activate=True):
+    keys, periods, matrix, features = prepare(df)
+    n_periods = matrix.shape[1]
+    if n_periods < 2:
+        raise ValueError("Need at least two periods of data to train")
+
+    evaluation = {}
+    if n_periods >= 3:
+        # Hold out the last period: model error vs repeating the previous period
+        with metrics.stage("holdout"):
+            holdout = fit_model(*training_rows(features, matrix, end=n_periods - 1), threads, params)
+            predicted = holdout.predict(np.ascontiguousarray(features[:, n_periods - 1]))
+        actual = matrix[:, n_periods - 1]
+        evaluation = {"holdout_period": str(periods[-1]), "mae": float(np.abs(predicted - actual).mean()),
+                      "naive_mae": float(np.abs(matrix[:, n_periods - 2] - actual).mean())}
+
+    with metrics.stage("train") as stage:
+        X, y = training_rows(features, matrix)
+        start = time.perf_counter()
+        model = fit_model(X, y, threads, params)
+        train_seconds = time.perf_counter() - start
+        stage.add(rows=len(y))
+
+    os.makedirs(model_dir, exist_ok=True)
+    name = f"model-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.ubj"
+    model_path = os.path.join(model_dir, name)
+    model.save_model(model_path)
+    with metrics.stage("score") as stage:
+        table = forecast_table(model, keys, periods, features)
+        write_atomic_csv(table, forecast_path(model_path))
+        stage.add(rows=len(table))
+
+    meta = {"model": name, "features": FEATURE_NAMES, "freq": periods.freqstr, "first_period": str(periods[0]),
+            "last_period": str(periods[-1]), "forecast_period": str(periods[-1] + 1), "series": len(keys),
+            "training_rows": int(len(y)), "threads": threads, "params": {**XGB_PARAMS, **(params or {})},
+            "train_seconds": train_seconds, "trained_at": time.time(), **evaluation}
+    with open(os.path.splitext(model_path)[0] + META_SUFFIX, "w") as f:
+        json.dump(meta, f, indent=2)
+    if activate:
+        set_current(model_dir, name)
+    logging.info(f"Trained {name} on {len(y)} rows ({len(keys)} series, {n_periods} periods) in {train_seconds:.2f}s; "
+                 f"holdout {evaluation or 'skipped'}")
+    return meta
+
+# Re-score fresh data with the model MODEL_DIR currently serves, replacing its forecast table
+def score(df, model_dir=MODEL_DIR):
+    model_path = ModelRegistry(candidates=(), model_dir=model_dir).resolve()
+    if model_path is None:
+        raise FileNotFoundError(f"No model in {model_dir}; run `training.py train` first")
+    model = load_model_file(model_path)
+    keys, periods, matrix, features = prepare(df)
+    with metrics.stage("score") as stage:
+        table = forecast_table(model, keys, periods, features)
+        write_atomic_csv(table, forecast_path(model_path))
+        stage.add(rows=len(table))
+    logging.info(f"Wrote {len(table)} {table['period'].iloc[0]} forecasts for {model_path}")
+    return table
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Train the crime forecasting model and batch-score every district.")
+    parser.add_argument("command", choices=["train", "score"],
+                        help="'train' fits and activates a new model version; 'score' re-scores with the current one.")
+    parser.add_argument("--source", default="cube",
+                        help="'cube' reads the aggregate cube zgov.py maintains; otherwise a Parquet URL or path "
+                             "such as the data.gov.my crime_district feed")
+    parser.add_argument("--cube-dir", default=DEFAULT_CUBE_DIR)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="XGBoost training threads")
+    parser.add_argument("--n-estimators", type=int, default=XGB_PARAMS["n_estimators"])
+    parser.add_argument("--no-activate", action="store_true", help="Write the new version without pointing CURRENT at it")
+    parser.add_argument("--metrics", default=os.getenv("METRICS_PATH"),
+                        help="Write per-stage timings here: JSON, or a Prometheus textfile if the path ends in .prom.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile the run with cProfile; stats go to PATH and a text summary to PATH.txt.")
+    args = parser.parse_args()
+    with instrumented_run("training", metrics_path=args.metrics, profile_path=args.profile):
+        df = load_training_frame(args.source, args.cube_dir)
+        if args.command == "train":
+            train(df, args.model_dir, threads=args.threads, params={"n_estimators": args.n_estimators},
+                  activate=not args.no_activate)
+        else:
+            score(df, args.model_dir)
@@ -1,10 +1,18 @@
 import pandas as pd
-import gspread
-from google.oauth2 import service_account
 import os
 import logging
 import json
 import tempfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from gov_ingest import URL_DATA, REQUIRED_COLUMNS, apply_gov_schema, load_crime_district, sum_crimes
+from sheet_delta import upload_delta, save_snapshot
+from sheet_writer import SheetWriter
+from crime_cube import DEFAULT_CUBE_DIR, update_cube
+from instrumentation import metrics, instrumented_run
+from schema import gov_schema
+from source_clients import DEFAULT_RETRY, gspread_client
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -13,19 +21,19 @@ logging.basicConfig(level=logging.INFO)
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 SHEET_ID = "1CNo8eLCASEfd7ktOgiUrzT8KBkAWhW5sPON1BITBKvM"  # Hardcoded Google Sheet ID
 
-# Load the credentials from the repository secret
-GOOGLE_SHEETS_CREDENTIALS = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
+# Snapshot of the last upload, diffed against new data in delta mode
+SNAPSHOT_PATH = os.path.join(".cache", "gov", "SafeZoneGOV.snapshot.parquet")
+KEY_COLUMNS = ['state', 'district', 'category', 'date']
 
-if not GOOGLE_SHEETS_CREDENTIALS:
-    logging.error("GOOGLE_SHEETS_CREDENTIALS environment variable is not set.")
-    exit(1)
+# Blocks already written by an interrupted full rewrite, so a rerun can resume
+PROGRESS_PATH = os.path.join(".cache", "gov", "SafeZoneGOV.progress.json")
 
 # Write the credentials to a temporary file
 def create_credentials_file(credentials_json):
     try:
         # Parse the JSON to ensure it's valid
         credentials = json.loads(credentials_json)
-        
+
         # Create a temporary file
         with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as temp_file:
             json.dump(credentials, temp_file)
@@ -34,65 +42,63 @@ def create_credentials_file(credentials_json):
         logging.error("Invalid JSON in GOOGLE_SHEETS_CREDENTIALS.")
         exit(1)
 
-# Create the credentials file
-credentials_file = create_credentials_file(GOOGLE_SHEETS_CREDENTIALS)
-
-# Load the data from the public URL
-URL_DATA = 'https://storage.data.gov.my/publicsafety/crime_district.parquet'
-df = pd.read_parquet(URL_DATA)
-
-# Check for required columns
-required_columns = ['state', 'district', 'category', 'date', 'crimes']
-if not all(column in df.columns for column in required_columns):
-    raise ValueError(f"DataFrame is missing one or more required columns: {required_columns}")
-
-# Convert 'date' to datetime if it exists
-df['date'] = pd.to_datetime(df['date'])
-
-# Filter out rows where the state is 'Malaysia'
-df = df[df['state'] != 'Malaysia']
-
-# Filter out rows where the district is 'All' (aggregated rows)
-df = df[df['district'] != 'All']
-
-# Filter the DataFrame to include only the required columns
-df_filtered = df[required_columns].copy()
-
-# Combine districts as specified
-df_filtered['district'] = df_filtered['district'].replace({
-    'Johor Bahru Selatan': 'Johor Bahru',
-    'Johor Bahru Utara': 'Johor Bahru',
-    'Seberang Perai Selatan': 'Seberang Perai',
-    'Seberang Perai Tengah': 'Seberang Perai',
-    'Seberang Perai Utara': 'Seberang Perai',
-    'Klang Selatan': 'Klang',
-    'Klang Utara': 'Klang',
-    'Cameron Highland': 'Cameron Highlands'  # Fix district name
-})
-
-# Group by state, district, category, and date, and sum the crimes
-df_combined = df_filtered.groupby(['state', 'district', 'category', 'date'], as_index=False)['crimes'].sum()
-
-# Reorder columns to match your Google Sheet format
-df_combined = df_combined[['state', 'district', 'category', 'date', 'crimes']]
-
-# Format date for Google Sheets
-df_combined['date'] = df_combined['date'].dt.strftime('%Y-%m-%d')
-
-# Upload to Google Sheets
-def upload_to_google_sheets(dataframe, sheet_id, credentials_file, worksheet_name="SafeZoneGOV"):
+# Load the whole Parquet file into memory, then filter and aggregate (original ingestion)
+def load_crime_district_full(source=URL_DATA):
+    with metrics.stage("parquet_read") as stage:
+        df = pd.read_parquet(source)
+        stage.add(rows=len(df))
+
+    # Check for required columns
+    if not all(column in df.columns for column in REQUIRED_COLUMNS):
+        raise ValueError(f"DataFrame is missing one or more required columns: {REQUIRED_COLUMNS}")
+
+    # Filter out rows where the state is 'Malaysia'
+    df = df[df['state'] != 'Malaysia']
+
+    # Filter out rows where the district is 'All' (aggregated rows)
+    df = df[df['district'] != 'All']
+
+    # Convert the required columns to the schema (categorical names, day dates,
+    # downcast counts) and combine districts as specified
+    schema = gov_schema()
+    df_filtered = apply_gov_schema(df[REQUIRED_COLUMNS], schema)
+
+    # Group by state, district, category, and date (on the category codes), and sum the crimes
+    with metrics.stage("groupby") as stage:
+        df_combined = schema.apply(sum_crimes(df_filtered))
+        stage.add(rows=len(df_filtered))
+
+    # Reorder columns to match your Google Sheet format
+    return df_combined[REQUIRED_COLUMNS]
+
+# Open the worksheet with the process-wide gspread client (cached credentials and
+# token, pooled keep-alive session); rate-limited or failed calls are retried with backoff
+def open_worksheet(credentials_file, sheet_id, worksheet_name):
+    client = gspread_client(credentials_file, SCOPES)
+    return DEFAULT_RETRY.call(lambda: client.open_by_key(sheet_id).worksheet(worksheet_name),
+                              f"Opening worksheet {worksheet_name}")
+
+# Upload to Google Sheets.
+# mode="delta" sends only rows that changed since the last upload's snapshot and falls
+# back to a full rewrite when there is no snapshot or the columns changed.
+# `worksheet` is a Future of an already opening worksheet (see run), if any.
+def upload_to_google_sheets(dataframe, sheet_id, credentials_file, worksheet_name="SafeZoneGOV",
+                            mode="delta", snapshot_path=SNAPSHOT_PATH, progress_path=PROGRESS_PATH, worksheet=None):
     try:
-        # Load credentials and authorize the client
-        creds = service_account.Credentials.from_service_account_file(
-            credentials_file, scopes=SCOPES
-        )
-        client = gspread.authorize(creds)
-
         # Open the Google Sheet by ID and select the worksheet
-        sheet = client.open_by_key(sheet_id).worksheet(worksheet_name)
-
-        # Clear all existing data in the sheet
-        sheet.clear()
+        if worksheet is not None:
+            sheet = worksheet.result()
+        else:
+            sheet = open_worksheet(credentials_file, sheet_id, worksheet_name)
+
+        if mode == "delta":
+            with metrics.stage("sheets_upload") as stage:
+                counts = upload_delta(sheet, dataframe, snapshot_path, KEY_COLUMNS)
+                if counts is not None:
+                    stage.add(rows=counts["rows_written"])
+            if counts is not None:
+                logging.info("Delta uploaded to Google Sheets successfully!")
+                return
 
         # Convert the DataFrame to a list of lists
         data_to_upload = dataframe.values.tolist()
@@ -101,20 +107,78 @@ def upload_to_google_sheets(dataframe, sheet_id, credentials_file, worksheet_nam
         header = dataframe.columns.tolist()
         data_to_upload.insert(0, header)
 
-        # Calculate the range dynamically based on the size of the data
-        num_rows = len(data_to_upload)
-        num_cols = len(data_to_upload[0]) if num_rows > 0 else 0
-        range_name = f"A1:{chr(64 + num_cols)}{num_rows}"  # Example: "A1:E10"
-
-        # Upload the data to the Google Sheet
-        sheet.update(range_name, data_to_upload)
+        # Clear the sheet and upload in row blocks (an interrupted upload resumes instead)
+        with metrics.stage("sheets_upload") as stage:
+            stats = SheetWriter(sheet, progress_path=progress_path).write(data_to_upload, clear=True)
+            stage.add(rows=stats["written"], payload=data_to_upload)
+        if stats["failed_blocks"]:
+            logging.error(f"{stats['failed_blocks']} blocks failed to upload; rerun to resume.")
+            return
+        save_snapshot(dataframe, snapshot_path)
 
         logging.info("Data uploaded to Google Sheets successfully!")
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
-# Upload the preprocessed data to Google Sheets
-upload_to_google_sheets(df_combined, SHEET_ID, credentials_file, worksheet_name="SafeZoneGOV")
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate data.gov.my crime_district data into the SafeZoneGOV sheet.")
+    parser.add_argument("--ingest", choices=["stream", "full"], default="stream",
+                        help="'stream' scans only the needed columns/rows batch by batch with a cached download; "
+                             "'full' loads the whole Parquet file with pandas.")
+    parser.add_argument("--source", default=URL_DATA, help="Parquet URL or local file path")
+    parser.add_argument("--upload", choices=["delta", "full"], default="delta",
+                        help="'delta' writes only changed rows; 'full' clears and rewrites the worksheet.")
+    parser.add_argument("--cube-dir", default=DEFAULT_CUBE_DIR, help="Where the aggregate cube is stored")
+    parser.add_argument("--rebuild-cube", action="store_true",
+                        help="Rebuild the aggregate cube from scratch instead of merging in new months.")
+    parser.add_argument("--metrics", default=os.getenv("METRICS_PATH"),
+                        help="Write per-stage timings here: JSON, or a Prometheus textfile if the path ends in .prom.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Profile the run with cProfile; stats go to PATH and a text summary to PATH.txt.")
+    args = parser.parse_args()
+    with instrumented_run("zgov", metrics_path=args.metrics, profile_path=args.profile):
+        run(args)
+
+# Ingest, refresh the cube and upload, as configured by the command line
+def run(args):
+    # Load the credentials from the repository secret
+    GOOGLE_SHEETS_CREDENTIALS = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
+
+    if not GOOGLE_SHEETS_CREDENTIALS:
+        logging.error("GOOGLE_SHEETS_CREDENTIALS environment variable is not set.")
+        exit(1)
+
+    # Create the credentials file
+    credentials_file = create_credentials_file(GOOGLE_SHEETS_CREDENTIALS)
+
+    # Authorize and open the worksheet in the background while the data is downloaded
+    # and aggregated; errors surface (and are logged) when the upload needs it
+    with ThreadPoolExecutor(max_workers=1) as background:
+        worksheet = background.submit(open_worksheet, credentials_file, SHEET_ID, "SafeZoneGOV")
+
+        # Load and aggregate the data from the public URL
+        if args.ingest == "stream":
+            df_combined = load_crime_district(args.source)
+        else:
+            df_combined = load_crime_district_full(args.source)
+
+        # Refresh the precomputed aggregate cube used for dashboard rollups
+        try:
+            with metrics.stage("cube_update") as stage:
+                update_cube(df_combined, args.cube_dir, rebuild=args.rebuild_cube)
+                stage.add(rows=len(df_combined))
+        except Exception as e:
+            logging.error(f"Failed to update the crime cube: {e}")
+
+        # Format date for Google Sheets
+        df_combined['date'] = df_combined['date'].dt.strftime('%Y-%m-%d')
+
+        # Upload the preprocessed data to Google Sheets
+        upload_to_google_sheets(df_combined, SHEET_ID, credentials_file, worksheet_name="SafeZoneGOV",
+                                mode=args.upload, worksheet=worksheet)
+
+    # Clean up the temporary credentials file
+    os.remove(credentials_file)
 
-# Clean up the temporary credentials file
-os.remove(credentials_file)
+if __name__ == "__main__":
+    main()